@@ -0,0 +1,338 @@
+import json
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from benchmarks.pdf_factory import generate_pdf
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SITE_ID = "benchmark-site"
+DRIVE_ID = "benchmark-drive"
+ROOT_FOLDER_ID = "folder-root"
+# Drive paths are accepted by drive ID and through the site's default drive
+DRIVE_PATH = r'^/v1\.0/(?:drives/[^/]+|sites/[^/]+/drive)'
+
+
+def build_folder(documents: int, pages: List[int], words_per_page: int,
+                 folders: int) -> Tuple[Dict[str, Dict], Dict[str, bytes]]:
+    """
+    Create the drive items and PDF contents of the synthetic folder.
+
+    Documents cycle through the `pages` sizes and are spread round robin over
+    the root folder and `folders` subfolders.
+
+    Returns:
+        Tuple[Dict[str, Dict], Dict[str, bytes]]: Drive items and PDF content, keyed by item ID
+    """
+    items = {ROOT_FOLDER_ID: {'id': ROOT_FOLDER_ID, 'name': 'Benchmark', 'folder': {}, 'parentReference': {}}}
+    parents = [ROOT_FOLDER_ID]
+    for index in range(folders):
+        folder_id = f"folder-{index}"
+        items[folder_id] = {
+            'id': folder_id, 'name': f"Subfolder {index}", 'folder': {},
+            'parentReference': {'id': ROOT_FOLDER_ID}
+        }
+        parents.append(folder_id)
+
+    contents = {}
+    for index in range(documents):
+        item_id = f"doc-{index}"
+        contents[item_id] = generate_pdf(pages[index % len(pages)], words_per_page, seed=index)
+        items[item_id] = {
+            'id': item_id,
+            'name': f"document_{index:05d}.pdf",
+            'size': len(contents[item_id]),
+            'eTag': f'"{item_id},1"',
+            'lastModifiedDateTime': '2024-01-01T00:00:00Z',
+            'file': {'mimeType': 'application/pdf'},
+            'parentReference': {'id': parents[index % len(parents)]}
+        }
+    return items, contents
+
+
+class _GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict) -> None:
+        self._send(status, json.dumps(data).encode())
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        body = self._read_body()
+        path = urlparse(self.path).path
+        if path.startswith('/mock/'):
+            status, data = self.server.control(path, json.loads(body) if body else {})
+            return self._send_json(status, data)
+        if path.endswith('/oauth2/token'):
+            return self._send_json(200, {'access_token': 'benchmark-token', 'expires_in': 3600})
+        if path == '/v1.0/$batch':
+            responses = []
+            for request in json.loads(body).get('requests', []):
+                throttled = self.server.take_throttle()
+                if throttled is not None:
+                    responses.append({
+                        'id': request['id'], 'status': 429, 'headers': {'Retry-After': str(throttled)},
+                        'body': {'error': {'code': 'TooManyRequests'}}
+                    })
+                    continue
+                status, data = self.server.route('/v1.0' + request['url'])
+                responses.append({'id': request['id'], 'status': status, 'body': data})
+            return self._send_json(200, {'responses': responses})
+        self._send_json(404, {'error': {'code': 'itemNotFound'}})
+
+    def do_GET(self):
+        match = re.match(DRIVE_PATH + r'/items/([^/]+)/content$', urlparse(self.path).path)
+        if match:
+            content = self.server.contents.get(match.group(1))
+            if content is None:
+                return self._send_json(404, {'error': {'code': 'itemNotFound'}})
+            if self.server.download_latency:
+                time.sleep(self.server.download_latency)
+            return self._send(200, content, 'application/pdf')
+        status, data = self.server.route(self.path)
+        self._send_json(status, data)
+
+
+class _GraphServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, items: Dict[str, Dict], contents: Dict[str, bytes],
+                 download_latency: float, page_size: int):
+        super().__init__(('127.0.0.1', 0), _GraphHandler)
+        self.items = items
+        self.contents = contents
+        self.download_latency = download_latency
+        self.page_size = page_size
+        # Delta feed state: every change gets the next sequence number, a
+        # delta token is the sequence number it was issued at
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.changed_at = {item_id: 0 for item_id in items}
+        self.deleted = {}
+        self.expired_before = 0
+        self.throttle = {'count': 0, 'retry_after': 0}
+        self.failing_listings = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def _children(self, folder_id: str, query: Dict[str, List[str]], path: str) -> Dict:
+        children = [item for item in self.items.values() if item['parentReference'].get('id') == folder_id]
+        skip = int(query.get('$skiptoken', ['0'])[0])
+        page = {'value': children[skip:skip + self.page_size]}
+        if skip + self.page_size < len(children):
+            page['@odata.nextLink'] = f"{self.base_url}{path}?$skiptoken={skip + self.page_size}"
+        return page
+
+    def _delta(self, query: Dict[str, List[str]], path: str) -> Tuple[int, Dict]:
+        """Changes since the sequence number in the token: changed items and deletion tombstones."""
+        token = query.get('token', ['0'])[0]
+        with self.lock:
+            if token == 'latest':
+                return 200, {'value': [], '@odata.deltaLink': f"{self.base_url}{path}?token={self.sequence}"}
+            since = int(token)
+            if since < self.expired_before:
+                return 410, {'error': {'code': 'resyncRequired', 'message': 'The delta token has expired'}}
+            changes = [
+                self.items[item_id] for item_id, sequence in self.changed_at.items()
+                if sequence > since and item_id in self.items
+            ]
+            changes += [tombstone for sequence, tombstone in self.deleted.values() if sequence > since]
+            current = self.sequence
+        skip = int(query.get('$skiptoken', ['0'])[0])
+        page = {'value': changes[skip:skip + self.page_size]}
+        if skip + self.page_size < len(changes):
+            page['@odata.nextLink'] = f"{self.base_url}{path}?token={since}&$skiptoken={skip + self.page_size}"
+        else:
+            page['@odata.deltaLink'] = f"{self.base_url}{path}?token={current}"
+        return 200, page
+
+    def control(self, path: str, data: Dict) -> Tuple[int, Dict]:
+        """Change the folder from a test; see the control methods of MockGraphServer."""
+        with self.lock:
+            if path == '/mock/files':
+                self.sequence += 1
+                item_id = f"doc-added-{self.sequence}"
+                self.contents[item_id] = generate_pdf(data.get('pages', 1), seed=self.sequence)
+                self.items[item_id] = {
+                    'id': item_id,
+                    'name': data['name'],
+                    'size': len(self.contents[item_id]),
+                    'eTag': f'"{item_id},1"',
+                    'lastModifiedDateTime': '2024-01-02T00:00:00Z',
+                    'file': {'mimeType': 'application/pdf'},
+                    'parentReference': {'id': data.get('folder_id') or ROOT_FOLDER_ID}
+                }
+                self.changed_at[item_id] = self.sequence
+                return 200, self.items[item_id]
+            match = re.match(r'^/mock/files/([^/]+)/delete$', path)
+            if match and match.group(1) in self.items:
+                self.sequence += 1
+                item = self.items.pop(match.group(1))
+                self.contents.pop(item['id'], None)
+                self.deleted[item['id']] = (self.sequence, {
+                    'id': item['id'], 'deleted': {'state': 'deleted'}, 'parentReference': item['parentReference']
+                })
+                return 200, {}
+            if path == '/mock/expire-delta':
+                self.expired_before = self.sequence + 1
+                return 200, {}
+            if path == '/mock/throttle':
+                self.throttle = {'count': data.get('count', 0), 'retry_after': data.get('retry_after', 0)}
+                return 200, {}
+            if path == '/mock/fail-listing':
+                self.failing_listings[data['folder_id']] = data.get('count', 1)
+                return 200, {}
+        return 404, {'error': {'code': 'itemNotFound'}}
+
+    def take_throttle(self) -> Optional[float]:
+        """Retry-After of the next throttled batch sub-request, or None when it is not throttled."""
+        with self.lock:
+            if self.throttle['count'] <= 0:
+                return None
+            self.throttle['count'] -= 1
+            return self.throttle['retry_after']
+
+    def route(self, url: str) -> Tuple[int, Dict]:
+        """Answer a Graph GET request with a status and JSON body."""
+        parsed = urlparse(url)
+        path = unquote(parsed.path)
+        query = parse_qs(parsed.query)
+        if re.match(DRIVE_PATH + r'/root/delta$', path):
+            return self._delta(query, parsed.path)
+        if path == '/v1.0/sites':
+            return 200, {'value': [{'id': SITE_ID, 'name': 'regulatory-docs'}]}
+        if re.match(r'^/v1\.0/sites/[^/]+/drive$', path):
+            return 200, {'id': DRIVE_ID}
+        match = re.match(DRIVE_PATH + r'/root:/(.+?)(:/children)?$', path)
+        if match:
+            if match.group(2):
+                return 200, self._children(ROOT_FOLDER_ID, query, parsed.path)
+            return 200, self.items[ROOT_FOLDER_ID]
+        match = re.match(DRIVE_PATH + r'/items/([^/]+)(/children)?$', path)
+        if match and match.group(1) in self.items:
+            if match.group(2):
+                with self.lock:
+                    if self.failing_listings.get(match.group(1), 0) > 0:
+                        self.failing_listings[match.group(1)] -= 1
+                        return 503, {'error': {'code': 'serviceNotAvailable'}}
+                return 200, self._children(match.group(1), query, parsed.path)
+            return 200, self.items[match.group(1)]
+        return 404, {'error': {'code': 'itemNotFound'}}
+
+
+def _serve(config: Dict, ready) -> None:
+    items, contents = build_folder(config['documents'], config['pages'], config['words_per_page'], config['folders'])
+    server = _GraphServer(items, contents, config['download_latency'], config['page_size'])
+    ready.send((server.server_address[1], sum(len(content) for content in contents.values())))
+    server.serve_forever()
+
+
+class MockGraphServer:
+    """
+    Local stand-in for Microsoft Graph serving a synthetic SharePoint folder.
+
+    The server runs in its own process, so generating and serving PDFs does
+    not compete with the pipeline for the GIL or show up in its memory use.
+    It implements the endpoints SharePointService uses: the token endpoint,
+    site and drive lookup, paged folder listings, item metadata, downloads,
+    the drive's delta feed and JSON batching. Tests can change the folder
+    while the server runs (`add_file`, `delete_file`), expire all delta
+    tokens so the next delta request gets a 410, throttle batched
+    sub-requests with 429s and make folder listings fail with 503s.
+    """
+
+    def __init__(self, documents: int = 100, pages: Optional[List[int]] = None, words_per_page: int = 400,
+                 folders: int = 0, download_latency: float = 0.0, page_size: int = 200):
+        self.config = {
+            'documents': documents,
+            'pages': pages or [1, 5, 20],
+            'words_per_page': words_per_page,
+            'folders': folders,
+            'download_latency': download_latency,
+            'page_size': page_size
+        }
+        self.process = None
+        self.port = None
+        self.total_bytes = 0
+
+    def start(self) -> 'MockGraphServer':
+        """Start the server process and wait until the folder is generated."""
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=_serve, args=(self.config, sender), daemon=True)
+        self.process.start()
+        self.port, self.total_bytes = receiver.recv()
+        logger.info(
+            f"Mock Graph server on port {self.port}: {self.config['documents']} PDFs, "
+            f"{self.total_bytes / (1024 * 1024):.1f} MB"
+        )
+        return self
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def _control(self, path: str, data: Optional[Dict] = None) -> Dict:
+        request = urllib.request.Request(
+            f"{self.base_url}{path}", data=json.dumps(data or {}).encode(), method='POST',
+            headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def add_file(self, name: str, pages: int = 1, folder_id: Optional[str] = None) -> Dict:
+        """Add a PDF to the root folder, or to the folder with ID `folder_id`, and return its drive item."""
+        return self._control('/mock/files', {'name': name, 'pages': pages, 'folder_id': folder_id})
+
+    def delete_file(self, item_id: str) -> None:
+        self._control(f'/mock/files/{item_id}/delete')
+
+    def expire_delta(self) -> None:
+        """Make every delta token issued so far answer 410 Gone."""
+        self._control('/mock/expire-delta')
+
+    def throttle_batch(self, count: int, retry_after: float = 0) -> None:
+        """Answer the next `count` batched sub-requests with 429 and the given Retry-After."""
+        self._control('/mock/throttle', {'count': count, 'retry_after': retry_after})
+
+    def fail_listing(self, folder_id: str, count: int) -> None:
+        """Answer the next `count` listings of a folder's children with 503."""
+        self._control('/mock/fail-listing', {'folder_id': folder_id, 'count': count})
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def graph_url(self) -> str:
+        return f"{self.base_url}/v1.0"
+
+    @property
+    def folder_url(self) -> str:
+        """Graph URL of the synthetic folder, as passed to /process-document."""
+        return f"{self.graph_url}/sites/{SITE_ID}/drive/root:/Benchmark"
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import random
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from google.api_core import exceptions as google_exceptions
+
+BATCH_IDS_PATTERN = re.compile(r"keys are the document IDs \(([^)]*)\)")
+
+
+class MockResponse:
+    def __init__(self, text: str):
+        self.text = text
+        # No usage metadata: the processor falls back to its own token count
+        self.usage_metadata = None
+
+
+class MockGeminiModel:
+    """
+    Stand-in for the Gemini model used by DocumentProcessor.
+
+    Answers every field of the template after a configurable latency and
+    rejects a configurable share of requests with a 429 (ResourceExhausted)
+    so the rate limiter and retries are exercised. Packed prompts get one
+    answer per document ID. It replaces `DocumentProcessor.gemini_model`
+    in-process, because the Gemini SDK has no setting to point it at a local
+    HTTP endpoint.
+    """
+
+    def __init__(self, fields: List[Dict], latency: float = 0.5, latency_jitter: float = 0.2,
+                 rate_limit_probability: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.fields = fields
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def _answer(self) -> Dict:
+        return {field['name']: f"Benchmark value of {field['name']}" for field in self.fields}
+
+    def _draw(self) -> Tuple[float, bool]:
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.latency_jitter, self.latency_jitter))
+            limited = self.random.random() < self.rate_limit_probability
+            if limited:
+                self.rate_limited += 1
+            return delay, limited
+
+    def _respond(self, prompt: str) -> MockResponse:
+        match = BATCH_IDS_PATTERN.search(prompt)
+        if match:
+            document_ids = [document_id.strip() for document_id in match.group(1).split(',')]
+            return MockResponse(json.dumps({document_id: self._answer() for document_id in document_ids}))
+        return MockResponse(json.dumps(self._answer()))
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> MockResponse:
+        delay, limited = self._draw()
+        if limited:
+            # Rejections come back quickly, like the real quota errors
+            await asyncio.sleep(min(delay, 0.05))
+            raise google_exceptions.ResourceExhausted(f"Quota exceeded. Please retry in {self.retry_after}s")
+        await asyncio.sleep(delay)
+        return self._respond(prompt)
+
+    def statistics(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'rate_limited': self.rate_limited}
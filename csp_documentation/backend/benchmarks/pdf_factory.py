@@ -0,0 +1,83 @@
+import random
+from typing import List
+
+# Vocabulary of the generated documents; a few lines carry the values the
+# benchmark template asks for so extraction prompts look realistic
+WORDS = (
+    "study protocol clinical trial subject dose placebo randomized cohort efficacy safety adverse event "
+    "endpoint analysis population investigator site visit baseline treatment arm regulatory submission "
+    "product substance manufacturer batch stability specification assay impurity label indication"
+).split()
+
+FIELD_LINES = [
+    "Study Title: A Randomized Study of Compound {n} in Adult Subjects",
+    "Sponsor: Benchmark Pharmaceuticals Ltd",
+    "Protocol Number: BP-{n:05d}",
+    "Product Name: Compound {n}",
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _page_lines(rng: random.Random, words_per_page: int, line_words: int = 12) -> List[str]:
+    lines = []
+    remaining = words_per_page
+    while remaining > 0:
+        count = min(line_words, remaining)
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(count)))
+        remaining -= count
+    return lines
+
+
+def generate_pdf(pages: int, words_per_page: int = 400, seed: int = 0) -> bytes:
+    """
+    Build a text PDF with the given number of pages.
+
+    The content streams are uncompressed and use a standard font, so PyPDF2
+    extracts the text the same way it does for real text PDFs. The first
+    page starts with the values of the benchmark template fields.
+
+    Args:
+        pages (int): Number of pages
+        words_per_page (int): Number of filler words on each page
+        seed (int): Seed of the filler text; also numbers the field values
+
+    Returns:
+        bytes: The PDF file content
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, written once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for page in range(pages):
+        lines = _page_lines(rng, words_per_page)
+        if page == 0:
+            lines = [line.format(n=seed) for line in FIELD_LINES] + lines
+        text = "\n".join(f"({_escape(line)}) Tj T*" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 36 806 Td\n{text}\nET".encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(output)
@@ -0,0 +1,291 @@
+"""
+End-to-end benchmark of the document pipeline against local stand-ins.
+
+A mock Graph server serves a synthetic folder of generated PDFs and a mock
+Gemini model answers with configurable latency and 429s, so the run needs no
+credentials or network. Run it from the backend directory:
+
+    python -m benchmarks.run_pipeline --documents 200 --pages 1,5,20 --llm-latency 0.8
+
+It reports documents per second, p50/p99 latency of every stage, end-to-end
+document latency, queue delay and peak RSS, and can write them as JSON to
+compare runs before and after a change.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from benchmarks.mock_graph import MockGraphServer
+
+TEMPLATE_ID = "benchmark"
+TEMPLATE_FIELDS = [
+    {"name": "Study Title", "description": "Full title of the clinical study"},
+    {"name": "Sponsor", "description": "Organization sponsoring the study"},
+    {"name": "Protocol Number", "description": "Identifier of the study protocol"},
+    {"name": "Product Name", "description": "Name of the investigational product"},
+]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p99': percentile(values, 0.99),
+        'max': max(values) if values else None
+    }
+
+
+def _read_rss(pid: int) -> int:
+    """Resident set size of a process in bytes, 0 if it cannot be read."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of this process and of the PDF parsing workers."""
+
+    def __init__(self, processor, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.processor = processor
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_rss_with_workers = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = _read_rss(os.getpid())
+            executor = self.processor.parse_executor
+            workers = list(getattr(executor, '_processes', None) or {}) if executor else []
+            self.peak_rss = max(self.peak_rss, rss)
+            self.peak_rss_with_workers = max(self.peak_rss_with_workers, rss + sum(_read_rss(pid) for pid in workers))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=100, help="Number of PDFs in the synthetic folder")
+    parser.add_argument('--pages', default='1,5,20',
+                        help="Comma-separated page counts; documents cycle through them")
+    parser.add_argument('--words-per-page', type=int, default=400)
+    parser.add_argument('--folders', type=int, default=0,
+                        help="Subfolders to spread the documents over; implies a recursive crawl")
+    parser.add_argument('--download-latency', type=float, default=0.0,
+                        help="Seconds the mock Graph server waits before each download")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Mean seconds per mock Gemini request")
+    parser.add_argument('--llm-jitter', type=float, default=0.2, help="Uniform jitter around --llm-latency")
+    parser.add_argument('--rate-limit-probability', type=float, default=0.0,
+                        help="Share of mock Gemini requests rejected with a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry delay sent with mock 429s")
+    parser.add_argument('--download-concurrency', type=int)
+    parser.add_argument('--parse-workers', type=int)
+    parser.add_argument('--llm-concurrency', type=int)
+    parser.add_argument('--queue-size', type=int)
+    parser.add_argument('--scheduler', choices=['fifo', 'sjf_size', 'sjf_tokens', 'fair'])
+    parser.add_argument('--no-packing', action='store_true', help="Send every document in its own prompt")
+    parser.add_argument('--json', dest='json_path', help="Write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace, server: MockGraphServer, work_dir: str) -> None:
+    """Point the services at the mock server and keep their state in `work_dir`."""
+    os.environ.update({
+        'GRAPH_API_URL': server.graph_url,
+        'GRAPH_LOGIN_URL': server.base_url,
+        'SHAREPOINT_CLIENT_ID': 'benchmark',
+        'SHAREPOINT_CLIENT_SECRET': 'benchmark',
+        'SHAREPOINT_TENANT_ID': 'benchmark',
+        'SHAREPOINT_SITE_URL': 'https://benchmark.sharepoint.com/sites/regulatory-docs',
+        'SHAREPOINT_FOLDER_PATH': 'Benchmark',
+        'EXTRACTION_CACHE_ENABLED': 'false',
+        'PDF_PAGE_CACHE_DIR': '',
+        'EXTRACTION_CACHE_DIR': os.path.join(work_dir, 'extraction_cache'),
+        'SYNC_MANIFEST_PATH': os.path.join(work_dir, 'sync_manifest.db'),
+        'JOB_STORE_PATH': os.path.join(work_dir, 'jobs.db'),
+        'METADATA_DB_PATH': os.path.join(work_dir, 'metadata_storage.db'),
+    })
+    os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+    overrides = {
+        'PIPELINE_DOWNLOAD_CONCURRENCY': args.download_concurrency,
+        'PIPELINE_PARSE_WORKERS': args.parse_workers,
+        'PIPELINE_LLM_CONCURRENCY': args.llm_concurrency,
+        'PIPELINE_QUEUE_SIZE': args.queue_size,
+        'SCHEDULER_POLICY': args.scheduler,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+    if args.no_packing:
+        os.environ['PACKING_ENABLED'] = 'false'
+
+
+async def run_benchmark(args: argparse.Namespace, server: MockGraphServer, work_dir: str) -> Dict:
+    # Services read their settings on import and construction, so they are
+    # only imported once the environment points at the mock server
+    from context.template_context import get_template_context
+    from services.document_pipeline import DocumentPipeline
+    from services.document_processor import DocumentProcessor
+    from services.metrics import Histogram
+    from benchmarks.mock_llm import MockGeminiModel
+
+    class RecordingHistogram(Histogram):
+        """Histogram that also keeps every observation, for exact percentiles."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.values = defaultdict(list)
+
+        def observe(self, value: float, **labels) -> None:
+            super().observe(value, **labels)
+            self.values[labels.get('stage', '')].append(value)
+
+    template_context = get_template_context()
+    template_context.templates_dir = os.path.join(work_dir, 'templates')
+    os.makedirs(template_context.templates_dir, exist_ok=True)
+    template_context.save_template({
+        'id': TEMPLATE_ID, 'name': 'Benchmark', 'description': 'Benchmark template',
+        'metadataFields': TEMPLATE_FIELDS
+    })
+
+    processor = DocumentProcessor()
+    model = MockGeminiModel(
+        TEMPLATE_FIELDS, latency=args.llm_latency, latency_jitter=args.llm_jitter,
+        rate_limit_probability=args.rate_limit_probability, retry_after=args.retry_after
+    )
+    processor.gemini_model = model
+    stage_seconds = RecordingHistogram('benchmark_stage_duration_seconds', 'Stage latency', ['stage'])
+    processor.metrics.stage_seconds = stage_seconds
+
+    document_seconds = []
+    queue_delays = []
+
+    def on_event(file: Dict, event: str, data: Dict) -> None:
+        if event == 'done':
+            document_seconds.append(data.get('elapsed_seconds', 0.0))
+            queue_delays.append(data.get('queue_delay_seconds', 0.0))
+
+    sampler = RssSampler(processor)
+    sampler.start()
+    start_time = time.perf_counter()
+    try:
+        if args.folders:
+            files = processor.crawl_files(server.folder_url)
+        else:
+            files = await asyncio.to_thread(processor.get_files_to_process, server.folder_url)
+        pipeline = DocumentPipeline(processor, TEMPLATE_ID, on_event=on_event)
+        results = await pipeline.run(files)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        sampler.stop()
+        if processor.parse_executor is not None:
+            processor.parse_executor.shutdown()
+        processor.download_executor.shutdown()
+
+    total_pages = sum(
+        (metadata.get('extraction_statistics') or {}).get('page_count', 0) for metadata in results
+    )
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        'config': {key: value for key, value in vars(args).items() if key != 'json_path'},
+        'pipeline': {
+            'download_concurrency': pipeline.download_concurrency,
+            'parse_workers': processor.PARSE_WORKERS,
+            'llm_concurrency': pipeline.llm_concurrency,
+            'queue_size': pipeline.queue_size,
+            'scheduler_policy': pipeline.scheduler_policy,
+            'packing': processor.PACKING_ENABLED
+        },
+        'documents': len(pipeline.files),
+        'succeeded': len(results),
+        'failed': len(pipeline.failed_documents),
+        'pages': total_pages,
+        'corpus_mb': round(server.total_bytes / (1024 * 1024), 2),
+        'elapsed_seconds': round(elapsed, 3),
+        'documents_per_second': round(len(results) / elapsed, 3) if elapsed else None,
+        'pages_per_second': round(total_pages / elapsed, 3) if elapsed else None,
+        'llm': model.statistics(),
+        'stages': {stage: summarize(values) for stage, values in sorted(stage_seconds.values.items())},
+        'document_latency': summarize(document_seconds),
+        'queue_delay': summarize(queue_delays),
+        'peak_rss_mb': round(max(self_peak, sampler.peak_rss) / (1024 * 1024), 1),
+        'peak_rss_with_parse_workers_mb': round(sampler.peak_rss_with_workers / (1024 * 1024), 1) or None
+    }
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f} ms"
+
+
+def print_report(report: Dict) -> None:
+    print()
+    print(f"Documents:        {report['succeeded']} of {report['documents']} ok, {report['failed']} failed "
+          f"({report['pages']} pages, {report['corpus_mb']} MB)")
+    print(f"Elapsed:          {report['elapsed_seconds']:.2f} s")
+    print(f"Throughput:       {report['documents_per_second']} docs/s, {report['pages_per_second']} pages/s")
+    print(f"Mock LLM:         {report['llm']['requests']} requests, {report['llm']['rate_limited']} rate limited")
+    print(f"Peak RSS:         {report['peak_rss_mb']} MB "
+          f"({report['peak_rss_with_parse_workers_mb']} MB with parse workers)")
+    print()
+    print(f"{'stage':<18}{'count':>8}{'p50':>14}{'p99':>14}{'max':>14}")
+    rows = list(report['stages'].items()) + [
+        ('queue delay', report['queue_delay']), ('document (e2e)', report['document_latency'])
+    ]
+    for stage, stats in rows:
+        print(f"{stage:<18}{stats['count']:>8}{_format_seconds(stats['p50']):>14}"
+              f"{_format_seconds(stats['p99']):>14}{_format_seconds(stats['max']):>14}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    pages = [int(value) for value in args.pages.split(',') if value.strip()]
+    server = MockGraphServer(
+        documents=args.documents, pages=pages, words_per_page=args.words_per_page,
+        folders=args.folders, download_latency=args.download_latency
+    ).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix='csp_benchmark_') as work_dir:
+            configure_environment(args, server, work_dir)
+            # Keep the services' INFO logs out of the report
+            logging.getLogger().setLevel(logging.WARNING)
+            report = asyncio.run(run_benchmark(args, server, work_dir))
+    finally:
+        server.stop()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
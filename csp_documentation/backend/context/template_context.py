@@ -1,6 +1,8 @@
 import json
 import os
 import logging
+import threading
+import time
 from typing import Dict, List, Optional
 
 # Configure logging
@@ -8,6 +10,18 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class TemplateContext:
+    """
+    Registry of the JSON templates in the templates directory.
+
+    Parsed templates are cached and a file is only re-read when its
+    modification time changes or it is written through `save_template` /
+    `delete_template`. The directory is only rescanned when its own
+    modification time changes (a template was added, removed or replaced)
+    or, to pick up templates edited in place, once every
+    TEMPLATE_RESCAN_SECONDS. Use `get_template_context()` to share one registry
+    across the whole process.
+    """
+
     def __init__(self):
         # Get the backend directory path
         backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,40 +29,79 @@ class TemplateContext:
         # Set the templates directory path
         self.templates_dir = os.path.join(backend_dir, "templates")
         
+        # Templates edited in place leave the directory's mtime unchanged; they
+        # are picked up by a rescan at most this many seconds later
+        self.RESCAN_SECONDS = float(os.getenv('TEMPLATE_RESCAN_SECONDS', '5'))
+        
         # Create templates directory if it doesn't exist
         os.makedirs(self.templates_dir, exist_ok=True)
         
-        # Initialize templates dictionary
+        # Initialize templates dictionary and the modification time of each loaded file
         self.templates = {}
+        self.template_mtimes = {}
+        self.dir_mtime = None
+        self.last_scan = 0.0
+        self.lock = threading.RLock()
         
         # Load all templates
         self._load_templates()
         
     def _load_templates(self):
-        """Load all templates from the templates directory."""
-        try:
-            # Clear existing templates
-            self.templates.clear()
-            
-            # Load each template file
-            for filename in os.listdir(self.templates_dir):
-                if filename.endswith('.json'):
-                    template_id = filename.replace('.json', '')
-                    template_path = os.path.join(self.templates_dir, filename)
+        """
+        Bring the cached templates in line with the templates directory.
+        
+        Only new files and files whose modification time changed are parsed;
+        templates whose file was removed are dropped.
+        """
+        with self.lock:
+            try:
+                self.dir_mtime = os.stat(self.templates_dir).st_mtime_ns
+                self.last_scan = time.monotonic()
+                seen = set()
+                loaded = 0
+                
+                for entry in os.scandir(self.templates_dir):
+                    if not entry.name.endswith('.json'):
+                        continue
+                    template_id = entry.name.replace('.json', '')
+                    seen.add(template_id)
+                    
+                    mtime = entry.stat().st_mtime_ns
+                    if self.template_mtimes.get(template_id) == mtime:
+                        continue
                     
                     try:
-                        with open(template_path, 'r') as f:
+                        with open(entry.path, 'r') as f:
                             template_data = json.load(f)
                             self.templates[template_id] = template_data
+                            self.template_mtimes[template_id] = mtime
+                            loaded += 1
                     except Exception as e:
                         logger.error(f"Error loading template {template_id}: {str(e)}")
                         continue
-            
-            logger.info(f"Loaded {len(self.templates)} templates")
-            
-        except Exception as e:
-            logger.error(f"Error loading templates: {str(e)}")
-            self.templates = {}
+                
+                for template_id in list(self.templates):
+                    if template_id not in seen:
+                        del self.templates[template_id]
+                        self.template_mtimes.pop(template_id, None)
+                
+                if loaded:
+                    logger.info(f"Loaded {loaded} templates")
+                
+            except Exception as e:
+                logger.error(f"Error loading templates: {str(e)}")
+                self.templates = {}
+                self.template_mtimes = {}
+    
+    def _refresh(self):
+        """Rescan the templates directory if it changed or the rescan interval has passed."""
+        try:
+            dir_mtime = os.stat(self.templates_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if dir_mtime == self.dir_mtime and time.monotonic() - self.last_scan < self.RESCAN_SECONDS:
+            return
+        self._load_templates()
     
     def get_template(self, template_id: str) -> Optional[Dict]:
         """
@@ -60,8 +113,8 @@ class TemplateContext:
         Returns:
             Optional[Dict]: The template data if found, None otherwise
         """
-        # Reload templates to ensure we have the latest data
-        self._load_templates()
+        # Pick up templates changed on disk since the last call
+        self._refresh()
         
         if template_id in self.templates:
             return self.templates[template_id]
@@ -85,6 +138,37 @@ class TemplateContext:
             
         return template.get('metadataFields', [])
     
+    def get_merged_fields(self, template_ids: List[str]) -> List[Dict]:
+        """
+        Get the union of the fields of several templates.
+        
+        Fields are matched by name and kept in the order they first appear.
+        When templates describe the same field differently, the distinct
+        descriptions are combined so the extraction prompt covers all of them.
+        
+        Args:
+            template_ids (List[str]): IDs of the templates
+            
+        Returns:
+            List[Dict]: The merged fields
+        """
+        merged = {}
+        for template_id in template_ids:
+            template = self.get_template(template_id)
+            if not template:
+                raise ValueError(f"No template found for template ID: {template_id}")
+            for field in template.get('metadataFields', []):
+                existing = merged.get(field['name'])
+                if existing is None:
+                    merged[field['name']] = dict(field)
+                    continue
+                description = field.get('description', '')
+                if description and description not in existing.get('description', '').split('; '):
+                    existing['description'] = '; '.join(
+                        part for part in (existing.get('description', ''), description) if part
+                    )
+        return list(merged.values())
+    
     def save_template(self, template_data: Dict) -> bool:
         """
         Save a template to a file.
@@ -103,11 +187,13 @@ class TemplateContext:
                 
             template_path = os.path.join(self.templates_dir, f"{template_id}.json")
             
-            with open(template_path, 'w') as f:
-                json.dump(template_data, f, indent=2)
-                
-            # Update the in-memory templates
-            self.templates[template_id] = template_data
+            with self.lock:
+                with open(template_path, 'w') as f:
+                    json.dump(template_data, f, indent=2)
+                    
+                # Update the in-memory templates
+                self.templates[template_id] = template_data
+                self.template_mtimes[template_id] = os.stat(template_path).st_mtime_ns
             
             logger.info(f"Saved template with ID: {template_id}")
             return True
@@ -130,9 +216,10 @@ class TemplateContext:
             template_path = os.path.join(self.templates_dir, f"{template_id}.json")
             
             if os.path.exists(template_path):
-                os.remove(template_path)
-                if template_id in self.templates:
-                    del self.templates[template_id]
+                with self.lock:
+                    os.remove(template_path)
+                    self.templates.pop(template_id, None)
+                    self.template_mtimes.pop(template_id, None)
                     
                 logger.info(f"Deleted template with ID: {template_id}")
                 return True
@@ -144,6 +231,40 @@ class TemplateContext:
             logger.error(f"Error deleting template: {str(e)}")
             return False
 
+    def has_template(self, template_id: str) -> bool:
+        """Check whether a template exists."""
+        self._refresh()
+        return template_id in self.templates
+
+    def get_templates_by_id(self) -> Dict[str, Dict]:
+        """Get all templates keyed by their ID."""
+        self._refresh()
+        with self.lock:
+            return dict(self.templates)
+
     def get_all_templates(self) -> List[Dict]:
         """Get all templates."""
-        return list(self.templates.values()) 
\ No newline at end of file
+        return list(self.get_templates_by_id().values())
+
+
+def split_template_ids(template_id: str) -> List[str]:
+    """Split a comma-separated list of template IDs, dropping blanks and duplicates."""
+    template_ids = []
+    for part in template_id.split(','):
+        part = part.strip()
+        if part and part not in template_ids:
+            template_ids.append(part)
+    return template_ids
+
+
+_template_context = None
+_template_context_lock = threading.Lock()
+
+
+def get_template_context() -> TemplateContext:
+    """Get the template registry shared by the whole process."""
+    global _template_context
+    with _template_context_lock:
+        if _template_context is None:
+            _template_context = TemplateContext()
+        return _template_context 
\ No newline at end of file
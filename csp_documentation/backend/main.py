@@ -15,7 +15,7 @@ load_dotenv()
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import logging
@@ -23,6 +23,11 @@ from services.document_processor import DocumentProcessor
 from services.excel_generator import ExcelGenerator
 from services.metadata_storage import MetadataStorage
 from services.sharepoint_service import SharePointService
+from services.job_store import JobStore
+from services.processing_job import ProcessingJob
+from services.backfill_job import BackfillJob
+from context.template_context import get_template_context, split_template_ids
+import asyncio
 import shutil
 from pathlib import Path
 
@@ -47,10 +52,6 @@ class Template(BaseModel):
     description: str
     metadataFields: List[TemplateField]
 
-# Template storage path
-TEMPLATES_DIR = "templates"
-os.makedirs(TEMPLATES_DIR, exist_ok=True)
-
 app = FastAPI(title="Document Processing API")
 
 # Configure CORS
@@ -64,9 +65,82 @@ app.add_middleware(
 # Initialize document processor
 document_processor = DocumentProcessor()
 # Initialize ExcelGenerator
-excel_generator = ExcelGenerator(output_dir="output")
+excel_generator = ExcelGenerator(output_dir="output", sharepoint_service=document_processor.sharepoint_service)
+# Optionally refresh workbooks with deferred rows on a timer
+EXCEL_FLUSH_INTERVAL = float(os.getenv('EXCEL_FLUSH_INTERVAL', '0'))
+if EXCEL_FLUSH_INTERVAL > 0:
+    excel_generator.start_auto_flush(EXCEL_FLUSH_INTERVAL)
 # Initialize metadata storage
 metadata_storage = MetadataStorage()
+# Template registry shared with the document processor and Excel generator
+template_context = get_template_context()
+# Initialize job store shared by all worker processes
+job_store = JobStore()
+# Jobs submitted through /jobs run in the background of this worker
+background_jobs = set()
+# How often event streams check the job store for new events
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '0.5'))
+# Comment lines sent on idle event streams so proxies keep them open
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv('JOB_EVENTS_KEEPALIVE_SECONDS', '15'))
+
+def _write_job_results(all_metadata: List[Dict], document_url: str, template_id: str) -> Optional[str]:
+    """
+    Add a job's metadata to storage and Excel.
+
+    A job run for several comma-separated templates extracted the union of
+    their fields; every template gets its own fields of each document.
+    Runs under a lock shared by all worker processes so concurrent jobs do
+    not write the same workbook at the same time.
+
+    Returns:
+        Optional[str]: SharePoint URL of the first uploaded workbook
+    """
+    sharepoint_url = None
+    with job_store.lock('metadata'):
+        for single_template_id in split_template_ids(template_id):
+            for metadata in all_metadata:
+                excel_generator.add_metadata(metadata, document_url, single_template_id, defer_export=True)
+            # Write the workbook once for the whole job
+            result = excel_generator.flush(single_template_id).get(single_template_id)
+            if isinstance(result, dict) and result.get('sharepoint_url') and not sharepoint_url:
+                sharepoint_url = result['sharepoint_url']
+    return sharepoint_url
+
+def _export_job_results(job: ProcessingJob, all_metadata: List[Dict]) -> Optional[str]:
+    """
+    Write the results of a finished job to Excel.
+
+    A backfill job has already merged its fields into the stored rows, so
+    only the template's workbook is rewritten.
+
+    Returns:
+        Optional[str]: SharePoint URL of the uploaded workbook
+    """
+    if isinstance(job, BackfillJob):
+        with job_store.lock('metadata'):
+            result = excel_generator.flush(job.template_id).get(job.template_id)
+        return result.get('sharepoint_url') if isinstance(result, dict) else None
+    return _write_job_results(all_metadata, job.document_url, job.template_id)
+
+def _check_templates(template_id: str) -> None:
+    """Reject a request naming a template that does not exist."""
+    for single_template_id in split_template_ids(template_id):
+        if not template_context.get_template(single_template_id):
+            raise HTTPException(status_code=404, detail=f"Template with ID {single_template_id} not found")
+
+def _remove_deleted_documents(file_names: List[str]) -> None:
+    """Remove stored metadata of documents that were deleted from SharePoint."""
+    with job_store.lock('metadata'):
+        template_ids = set()
+        for file_name in file_names:
+            template_ids.update(metadata_storage.get_template_ids(file_name))
+            metadata_storage.delete_metadata(file_name)
+        # Rewrite the affected workbooks without the deleted rows
+        for template_id in template_ids:
+            try:
+                excel_generator.generate_excel(template_id)
+            except Exception as e:
+                logger.error(f"Error regenerating Excel for template {template_id}: {str(e)}")
 
 @app.post("/templates")
 async def create_template(template: Template):
@@ -80,16 +154,15 @@ async def create_template(template: Template):
             template.id = str(int(time.time() * 1000))  # Generate timestamp-based ID
         
         # Check if template with this ID already exists
-        template_path = os.path.join(TEMPLATES_DIR, f"{template.id}.json")
-        if os.path.exists(template_path):
+        if template_context.has_template(template.id):
             raise HTTPException(
                 status_code=400,
                 detail=f"Template with ID {template.id} already exists"
             )
         
         # Save template as JSON file
-        with open(template_path, "w") as f:
-            json.dump(template.dict(), f, indent=2)
+        if not template_context.save_template(template.dict()):
+            raise HTTPException(status_code=500, detail="Error saving template")
             
         logger.info(f"Created new template with ID: {template.id}")
         return {"message": "Template created successfully", "template": template}
@@ -107,17 +180,13 @@ async def get_templates():
     """
     try:
         templates = []
-        for filename in os.listdir(TEMPLATES_DIR):
-            if filename.endswith(".json"):
-                template_id = filename.replace(".json", "")
-                with open(os.path.join(TEMPLATES_DIR, filename), "r") as f:
-                    template_data = json.load(f)
-                    templates.append({
-                        "id": template_id,
-                        "name": template_data.get("name", ""),
-                        "description": template_data.get("description", ""),
-                        "metadataFields": template_data.get("metadataFields", [])
-                    })
+        for template_id, template_data in template_context.get_templates_by_id().items():
+            templates.append({
+                "id": template_id,
+                "name": template_data.get("name", ""),
+                "description": template_data.get("description", ""),
+                "metadataFields": template_data.get("metadataFields", [])
+            })
         return templates
     except Exception as e:
         logger.error(f"Error getting templates: {str(e)}")
@@ -129,18 +198,16 @@ async def get_template(template_id: str):
     Get a specific template by ID.
     """
     try:
-        template_path = os.path.join(TEMPLATES_DIR, f"{template_id}.json")
-        if not os.path.exists(template_path):
+        if not template_context.has_template(template_id):
             raise HTTPException(status_code=404, detail=f"Template with ID {template_id} not found")
             
-        with open(template_path, "r") as f:
-            template_data = json.load(f)
-            return {
-                "id": template_id,
-                "name": template_data.get("name", ""),
-                "description": template_data.get("description", ""),
-                "metadataFields": template_data.get("metadataFields", [])
-            }
+        template_data = template_context.get_template(template_id)
+        return {
+            "id": template_id,
+            "name": template_data.get("name", ""),
+            "description": template_data.get("description", ""),
+            "metadataFields": template_data.get("metadataFields", [])
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -150,49 +217,75 @@ async def get_template(template_id: str):
 @app.delete("/templates/{template_id}")
 async def delete_template(template_id: str):
     try:
-        template_path = os.path.join(TEMPLATES_DIR, f"{template_id}.json")
-        if not os.path.exists(template_path):
+        if not template_context.has_template(template_id):
             raise HTTPException(status_code=404, detail="Template not found")
-        os.remove(template_path)
+        template_context.delete_template(template_id)
         return {"message": "Template deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process-document")
-async def process_document(document_url: str, template_id: str):
+async def process_document(document_url: str, template_id: str, delta_sync: bool = False, recursive: bool = False):
     """
     Process one or more documents and extract metadata.
     
     Args:
         document_url (str): URL of the document, Drive folder, or SharePoint folder
-        template_id (str): ID of the template to use for processing
+        template_id (str): ID of the template to use for processing, or several
+            comma-separated IDs to extract all of them in a single pass
+        delta_sync (bool): Only process PDFs added or changed since the last
+            sync of the folder, and drop metadata of deleted ones
+        recursive (bool): Also process the PDFs in all subfolders of a
+            SharePoint folder; processing starts while the crawl is running
         
     Returns:
         dict: Response containing metadata and success message
     """
+    if delta_sync and recursive:
+        raise HTTPException(status_code=400, detail="delta_sync and recursive cannot be combined")
     try:
         logger.info(f"Processing document(s) with template ID: {template_id}")
 
-        # Get the list of files to process (names and urls)
-        files_to_process = document_processor.get_files_to_process(document_url)
-        total_documents = len(files_to_process)
-        current_document = files_to_process[0]['name'] if files_to_process else None
+        files = None
+        deleted_documents = []
+        if delta_sync:
+            changes = await asyncio.to_thread(document_processor.get_changed_files, document_url)
+            files = changes['changed']
+            deleted_documents = [item['name'] for item in changes['deleted']]
+            if deleted_documents:
+                await asyncio.to_thread(_remove_deleted_documents, deleted_documents)
+            if not files:
+                return {
+                    "status": "success",
+                    "metadata": [],
+                    "total_documents": 0,
+                    "current_document": None,
+                    "deleted_documents": deleted_documents,
+                    "sharepoint_url": None,
+                    "message": "No added or changed documents since the last sync."
+                }
+
+        # Each request runs as its own job with its own queues and workers
+        job = ProcessingJob(document_processor, job_store, document_url, template_id, files, recursive=recursive)
 
         # Process the document(s) asynchronously
-        all_metadata = await document_processor.process_documents(document_url, template_id)
+        all_metadata = await job.run()
+        total_documents = len(job.files)
+        current_document = job.files[0]['name'] if job.files else None
         
         # Add each document's metadata to Excel file and collect sharepoint_url
-        sharepoint_url = None
-        for metadata in all_metadata:
-            result = excel_generator.add_metadata(metadata, document_url, template_id)
-            if isinstance(result, dict) and result.get('sharepoint_url'):
-                sharepoint_url = result['sharepoint_url']
+        sharepoint_url = await asyncio.to_thread(_write_job_results, all_metadata, document_url, template_id)
+        
+        if delta_sync:
+            document_processor.mark_synced(document_url, job.files, job.failed_documents)
         
         return {
             "status": "success",
+            "job_id": job.job_id,
             "metadata": all_metadata,
             "total_documents": total_documents,
             "current_document": current_document,
+            "deleted_documents": deleted_documents,
             "sharepoint_url": sharepoint_url,
             "message": f"Processed {len(all_metadata)} document(s) successfully. Use /download-excel to download the Excel file."
         }
@@ -200,6 +293,223 @@ async def process_document(document_url: str, template_id: str):
         logger.error(f"Error processing document(s): {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """
+    Get the most recent processing jobs from all worker processes.
+    """
+    try:
+        return job_store.list_jobs(limit)
+    except Exception as e:
+        logger.error(f"Error listing jobs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get the state and per-document results of a processing job.
+    """
+    try:
+        job = job_store.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+        return {**job, "results": job_store.get_results(job_id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _run_background_job(job: ProcessingJob) -> None:
+    """Run a submitted job and export its results once all documents are done."""
+    try:
+        all_metadata = await job.run()
+        await asyncio.to_thread(_export_job_results, job, all_metadata)
+    except Exception as e:
+        # Failed documents are already recorded per document; the job can be resumed
+        logger.error(f"Background job {job.job_id} failed: {str(e)}")
+        if job_store.get_job(job.job_id)['status'] != 'failed':
+            job_store.add_event(job.job_id, 'failed', data={'error': str(e)})
+            job_store.update_job(job.job_id, status='failed', error=str(e))
+
+def _start_background_job(job: ProcessingJob) -> None:
+    task = asyncio.create_task(_run_background_job(job))
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+@app.post("/jobs")
+async def submit_job(document_url: str, template_id: str, recursive: bool = False):
+    """
+    Submit a processing job and return without waiting for it.
+
+    Progress can be followed on /jobs/{job_id}/events and the results read
+    from /jobs/{job_id} while the job runs.
+
+    Args:
+        document_url (str): URL of the document, Drive folder, or SharePoint folder
+        template_id (str): ID of the template to use for processing, or several
+            comma-separated IDs to extract all of them in a single pass
+        recursive (bool): Also process the PDFs in all subfolders of a SharePoint folder
+
+    Returns:
+        dict: The job ID and the URLs to follow it
+    """
+    try:
+        _check_templates(template_id)
+        job = ProcessingJob(document_processor, job_store, document_url, template_id, recursive=recursive)
+        _start_background_job(job)
+        return {
+            "status": "queued",
+            "job_id": job.job_id,
+            "job_url": f"/jobs/{job.job_id}",
+            "events_url": f"/jobs/{job.job_id}/events"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _format_event(event: Dict) -> str:
+    payload = {'file_name': event['file_name'], 'created_at': event['created_at'], **event['data']}
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+
+async def _job_event_stream(job_id: str, after_id: int, request: Request):
+    """
+    Yield the events of a job as server-sent events until the job has ended.
+
+    Events are read from the job store, so the stream works no matter which
+    worker process runs the job.
+    """
+    last_sent = time.monotonic()
+    while not await request.is_disconnected():
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        events = await asyncio.to_thread(job_store.get_events, job_id, after_id)
+        for event in events:
+            after_id = event['id']
+            yield _format_event(event)
+        if events:
+            last_sent = time.monotonic()
+            continue
+        # Final events are written before the final status, so none are missed;
+        # a job whose heartbeat stopped was interrupted and writes no more events
+        if not job_store.is_running(job):
+            break
+        if time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream the progress of a job as server-sent events.
+
+    Every document reports 'queued', 'downloading', 'extracting', 'llm' and
+    then 'done' or 'failed', with the seconds since it was queued and its
+    token counts; the job reports 'started' and 'completed' or 'failed'.
+    A reconnecting client resumes after the Last-Event-ID it received.
+    """
+    if not job_store.get_job(job_id):
+        raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+    last_event_id = request.headers.get('last-event-id', '')
+    after_id = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        _job_event_stream(job_id, after_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """
+    Resume an interrupted or failed job, skipping the documents it already finished.
+
+    Args:
+        job_id (str): ID of the job to resume
+
+    Returns:
+        dict: Response containing the metadata of all finished documents
+    """
+    try:
+        job_state = job_store.get_job(job_id)
+        if not job_state:
+            raise HTTPException(status_code=404, detail=f"Job with ID {job_id} not found")
+        if job_store.is_running(job_state):
+            raise HTTPException(status_code=409, detail=f"Job {job_id} is still running")
+
+        if job_state.get('kind') == BackfillJob.kind:
+            job = BackfillJob.resume(document_processor, job_store, excel_generator, job_id)
+        else:
+            job = ProcessingJob.resume(document_processor, job_store, job_id)
+        skipped_documents = len(job.done_files)
+        all_metadata = await job.run()
+
+        sharepoint_url = await asyncio.to_thread(_export_job_results, job, all_metadata)
+
+        return {
+            "status": "success",
+            "job_id": job.job_id,
+            "metadata": all_metadata,
+            "total_documents": len(job.files),
+            "skipped_documents": skipped_documents,
+            "sharepoint_url": sharepoint_url,
+            "message": f"Resumed job: {len(all_metadata)} document(s) processed successfully, {skipped_documents} already done."
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error resuming job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/templates/{template_id}/backfill")
+async def backfill_template(template_id: str):
+    """
+    Fill in template fields that stored documents were not extracted for.
+
+    After fields are added to a template, only the missing fields of each
+    stored document are sent to the LLM, with the document's cached text
+    where available, and the answers are merged into its existing row. The
+    job runs in the background and is followed like any other job.
+
+    Args:
+        template_id (str): ID of the template
+
+    Returns:
+        dict: The job ID and URLs to follow it, the number of documents to
+            backfill and the documents whose source is unknown
+    """
+    try:
+        _check_templates(template_id)
+        files, unavailable_documents = await asyncio.to_thread(
+            BackfillJob.find_documents, document_processor, job_store, metadata_storage, template_id
+        )
+        if not files:
+            return {
+                "status": "complete",
+                "total_documents": 0,
+                "unavailable_documents": unavailable_documents,
+                "message": "No stored documents of this template are missing fields."
+            }
+
+        job = BackfillJob(document_processor, job_store, excel_generator, template_id, files=files)
+        _start_background_job(job)
+        missing_fields = list(dict.fromkeys(name for file in files for name in file['missing_fields']))
+        return {
+            "status": "queued",
+            "job_id": job.job_id,
+            "job_url": f"/jobs/{job.job_id}",
+            "events_url": f"/jobs/{job.job_id}/events",
+            "total_documents": len(files),
+            "missing_fields": missing_fields,
+            "unavailable_documents": unavailable_documents
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting backfill for template {template_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/generate-excel")
 async def generate_excel(request: Request):
     try:
@@ -247,6 +557,15 @@ async def download_excel(template_id: str):
         logger.error(f"Error downloading Excel: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Processing metrics of this worker in the Prometheus text format: stage
+    latency histograms, document, Gemini request and 429 counts, and tokens
+    per template.
+    """
+    return PlainTextResponse(document_processor.metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """
@@ -346,7 +665,7 @@ async def upload_template_fields(file: UploadFile = File(...)):
 @app.get("/metadata")
 async def get_metadata():
     """
-    Get all metadata from metadata_storage.json.
+    Get all stored metadata.
     """
     try:
         metadata = metadata_storage.get_metadata()
@@ -379,7 +698,7 @@ async def delete_metadata(document_url: str, template_id: str):
         document_url = unquote(document_url)
         
         # Delete from metadata storage
-        metadata_storage.delete_metadata(document_url)
+        metadata_storage.delete_metadata(document_url, template_id)
         
         # Delete from Excel file
         excel_generator.delete_metadata(document_url, template_id)
@@ -627,61 +946,65 @@ async def process_local_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process-local-folder-pdfs")
-async def process_local_folder_pdfs(folder_path: str):
+async def process_local_folder_pdfs(folder_path: str, template_id: str, recursive: bool = True,
+                                    background: bool = False):
+    """
+    Process the PDFs of a local folder through the document pipeline.
+
+    PDFs are parsed in place on the shared process pool and extracted by the
+    shared LLM stage; the metadata of the whole folder is written to storage
+    and Excel in one batch. The request runs as a job, so progress can be
+    followed on /jobs/{job_id}/events and an interrupted import resumed.
+
+    Args:
+        folder_path (str): Path of the local folder
+        template_id (str): ID of the template to use for processing, or several
+            comma-separated IDs to extract all of them in a single pass
+        recursive (bool): Include the PDFs of all subfolders
+        background (bool): Return right after the job is created instead of
+            waiting for it to finish
+
+    Returns:
+        dict: The job ID and, unless running in the background, the results
+    """
     try:
-        # Initialize services
-        document_processor = DocumentProcessor()
-        excel_generator = ExcelGenerator()
-        
         # Verify folder exists
         if not os.path.isdir(folder_path):
             raise HTTPException(status_code=400, detail="Folder path does not exist")
-        
-        processed_files = []
-        
-        # Walk through all files in the folder
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    try:
-                        file_path = os.path.join(root, file)
-                        
-                        # Extract text from PDF
-                        text = document_processor.extract_text_from_pdf(file_path)
-                        
-                        # Extract metadata
-                        metadata = document_processor.extract_metadata(text)
-                        
-                        if metadata:
-                            # Add file information to metadata
-                            metadata['File Name'] = file
-                            metadata['File Path'] = file_path
-                            metadata['File Size'] = os.path.getsize(file_path)
-                            metadata['Process Time'] = datetime.now().isoformat()
-                            
-                            # Add to Excel
-                            excel_generator.add_metadata(metadata)
-                            processed_files.append(file)
-                            
-                            logger.info(f"Processed PDF: {file}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing file {file}: {str(e)}")
-                        continue
-        
-        if processed_files:
-            # Generate Excel file
-            excel_path = excel_generator.generate_excel()
-            
+        _check_templates(template_id)
+
+        files = await asyncio.to_thread(document_processor.get_local_files, folder_path, recursive)
+        if not files:
+            raise HTTPException(status_code=400, detail="No PDF files found in the specified folder")
+
+        job = ProcessingJob(document_processor, job_store, folder_path, template_id, files)
+        if background:
+            _start_background_job(job)
             return {
-                "status": "success",
-                "message": f"Processed {len(processed_files)} PDF files",
-                "processed_files": processed_files,
-                "excel_path": excel_path
+                "status": "queued",
+                "job_id": job.job_id,
+                "total_documents": len(files),
+                "job_url": f"/jobs/{job.job_id}",
+                "events_url": f"/jobs/{job.job_id}/events"
             }
-        else:
-            raise HTTPException(status_code=400, detail="No PDF files found in the specified folder")
-            
+
+        all_metadata = await job.run()
+        sharepoint_url = await asyncio.to_thread(_write_job_results, all_metadata, folder_path, template_id)
+
+        return {
+            "status": "success",
+            "job_id": job.job_id,
+            "message": f"Processed {len(all_metadata)} of {len(files)} PDF files",
+            "processed_files": [metadata.get('File Name') for metadata in all_metadata],
+            "failed_documents": job.failed_documents,
+            "excel_path": excel_generator.get_current_excel_path(split_template_ids(template_id)[0]),
+            "excel_paths": {
+                single_template_id: excel_generator.get_current_excel_path(single_template_id)
+                for single_template_id in split_template_ids(template_id)
+            },
+            "sharepoint_url": sharepoint_url
+        }
+
     except HTTPException:
         raise
     except Exception as e:
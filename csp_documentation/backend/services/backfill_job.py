@@ -0,0 +1,125 @@
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from services.document_pipeline import SOURCE_KEYS
+from services.job_store import JobStore
+from services.metadata_storage import MetadataStorage
+from services.processing_job import ProcessingJob
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BackfillJob(ProcessingJob):
+    """
+    Fill in template fields that stored metadata was not extracted for.
+
+    When fields are added to a template, the documents processed before only
+    lack the new ones. The job finds every stored record of the template
+    that is missing some of its current fields and sends each document to
+    the LLM with just those fields. The text comes from the page cache when
+    the record's content hash is known, so such documents are not even
+    downloaded. Answers are merged into the stored rows as each batch of
+    outcomes is written, and the workbook is written once by the caller's
+    `flush`.
+
+    Documents are grouped by their set of missing fields; each group runs
+    through its own pipeline. Like any job, an interrupted backfill can be
+    resumed and skips the documents it already finished.
+    """
+
+    kind = 'backfill'
+
+    def __init__(self, processor, job_store: JobStore, excel_generator, template_id: str,
+                 files: Optional[List[Dict]] = None, job_id: Optional[str] = None):
+        self.excel_generator = excel_generator
+        self.unavailable_documents: List[str] = []
+        if files is None and job_id is None:
+            files, self.unavailable_documents = self.find_documents(
+                processor, job_store, excel_generator.metadata_storage, template_id
+            )
+        super().__init__(processor, job_store, '', template_id, files=files, job_id=job_id)
+
+    @classmethod
+    def resume(cls, processor, job_store: JobStore, excel_generator, job_id: str) -> 'BackfillJob':
+        """
+        Load an existing backfill job to process the documents it has not finished.
+
+        Args:
+            processor: The DocumentProcessor used to process the documents
+            job_store (JobStore): The shared job store
+            excel_generator: The ExcelGenerator holding the stored metadata
+            job_id (str): ID of the job to resume
+
+        Returns:
+            BackfillJob: The job, ready to run
+        """
+        job = job_store.get_job(job_id)
+        if not job:
+            raise KeyError(f"Job with ID {job_id} not found")
+        return cls(processor, job_store, excel_generator, job['template_id'], job_id=job_id)
+
+    @staticmethod
+    def find_documents(processor, job_store: JobStore, metadata_storage: MetadataStorage,
+                       template_id: str) -> Tuple[List[Dict], List[str]]:
+        """
+        Find the stored documents of a template that lack some of its fields.
+
+        Records stored before their source was kept are looked up in the
+        files of earlier jobs.
+
+        Args:
+            processor: The DocumentProcessor, for the template and page cache
+            job_store (JobStore): The shared job store
+            metadata_storage (MetadataStorage): The stored metadata
+            template_id (str): ID of the template
+
+        Returns:
+            Tuple[List[Dict], List[str]]: Files to process, each with its
+                'missing_fields', and the documents whose source is unknown
+        """
+        template = processor.template_context.get_template(template_id)
+        if not template:
+            raise ValueError(f"Template with ID {template_id} not found")
+        field_names = [field['name'] for field in template.get('metadataFields', [])]
+
+        files = []
+        unavailable = []
+        for record in metadata_storage.get_incomplete_records(template_id, field_names):
+            source = record['source'] or job_store.find_file(record['document_url']) or {}
+            if not (source.get('url') or source.get('local_path') or
+                    processor.pdf_extractor.has_cached_pages(source.get('content_hash'))):
+                unavailable.append(record['document_url'])
+                continue
+            file = {key: source[key] for key in SOURCE_KEYS + ('content_hash',) if source.get(key)}
+            file['name'] = record['document_url']
+            file['missing_fields'] = record['missing_fields']
+            files.append(file)
+
+        if unavailable:
+            logger.warning(f"Cannot backfill {len(unavailable)} document(s) of template {template_id}: source unknown")
+        logger.info(f"Found {len(files)} document(s) of template {template_id} with missing fields")
+        return files, unavailable
+
+    def _store_outcomes(self, outcomes: List[Tuple[Dict, Optional[Dict], Optional[str]]]) -> None:
+        """Merge the new fields into the stored rows, then persist the outcomes."""
+        for file, metadata, _ in outcomes:
+            if metadata is not None:
+                self.excel_generator.merge_metadata(metadata, file['name'], self.template_id, file['missing_fields'])
+        super()._store_outcomes(outcomes)
+
+    async def _process(self, files: Union[List[Dict], AsyncIterator[Dict]]) -> List[Dict]:
+        """Run each group of documents missing the same fields through its own pipeline."""
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for file in files:
+            groups.setdefault(tuple(file['missing_fields']), []).append(file)
+
+        results = []
+        self.failed_documents = []
+        for field_names, group in groups.items():
+            logger.info(f"Backfilling {', '.join(field_names)} for {len(group)} document(s)")
+            pipeline = self._create_pipeline(list(field_names))
+            results += await pipeline.run(group)
+            self.failed_documents += pipeline.failed_documents
+        return results
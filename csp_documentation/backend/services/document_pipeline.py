@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+
+from context.template_context import split_template_ids
+from services.extraction_cache import ExtractionCache
+from services.scheduler import create_file_queue, create_llm_queue, DocumentQueue
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# File properties kept with each result to find the document again
+SOURCE_KEYS = ('id', 'url', 'local_path', 'size', 'etag', 'last_modified')
+
+
+class DocumentPipeline:
+    """
+    Staged pipeline for a batch of documents.
+
+    Each document flows through three stages - download, PDF parsing and LLM
+    extraction - that run concurrently and are joined by bounded asyncio
+    queues. Downloads run on a thread pool and are kept in memory unless they
+    are large, parsing runs on a process pool and the LLM stage is limited to
+    a fixed number of in-flight requests. Local files (with a 'local_path')
+    skip the download and are parsed in place. When a stage
+    falls behind its inbox fills up and the stage in front of it waits, so
+    memory stays bounded no matter how many files are queued.
+
+    Documents found in the processor's extraction cache leave the pipeline
+    early: before download when their eTag/last modified time matches, or
+    right after download when their content hash does. Parsing splits the
+    pages of each PDF across the process pool. When packing is enabled,
+    small documents are grouped in front of the LLM stage so that several of
+    them share one request.
+
+    The order in which queued documents are served is set by the scheduler
+    policy: 'fifo' (listing order), 'sjf_size' (smallest file first),
+    'sjf_tokens' (smallest file first, then fewest text tokens first in
+    front of the LLM stage) or 'fair' (round robin over size buckets). The
+    time each document spent waiting in queues is reported with its result.
+
+    `template_id` may list several comma-separated templates: each document
+    is then downloaded, parsed and sent to the LLM once with the union of
+    their fields, and the caller fans the metadata out to every template.
+    `field_names` restricts the request to some of the template fields, e.g.
+    fields added to the template after its documents were processed. Files
+    with a 'content_hash' whose page texts are cached are not downloaded at
+    all. Every result carries its 'source': the file's location, version and
+    content hash, so it can be found again later.
+
+    `on_document` is called with the file, its metadata (or None) and the
+    error message (or None) as soon as each document is done, so callers can
+    record outcomes without waiting for the whole batch. `on_event` is called
+    with the file, an event name and its details as the document moves
+    through the stages: 'queued', 'downloading', 'extracting' (PDF parsing),
+    'llm', then 'done' or 'failed'. Every event carries the seconds since the
+    document was queued; 'done' adds its token and extraction statistics.
+    """
+
+    def __init__(self, processor, template_id: str,
+                 download_concurrency: Optional[int] = None,
+                 parse_concurrency: Optional[int] = None,
+                 llm_concurrency: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 scheduler_policy: Optional[str] = None,
+                 field_names: Optional[List[str]] = None,
+                 on_document: Optional[Callable[[Dict, Optional[Dict], Optional[str]], None]] = None,
+                 on_event: Optional[Callable[[Dict, str, Dict], None]] = None):
+        self.processor = processor
+        self.template_id = template_id
+        self.download_concurrency = download_concurrency or processor.DOWNLOAD_CONCURRENCY
+        self.parse_concurrency = parse_concurrency or processor.PARSE_WORKERS
+        self.llm_concurrency = llm_concurrency or processor.LLM_CONCURRENCY
+        self.queue_size = queue_size or processor.PIPELINE_QUEUE_SIZE
+        self.scheduler_policy = scheduler_policy or processor.SCHEDULER_POLICY
+        self.field_names = field_names
+        self.on_document = on_document
+        self.on_event = on_event
+
+        self.cache = processor.extraction_cache
+        self.metrics = processor.metrics
+        self.cache_hits = 0
+
+        self.files: List[Dict] = []
+        self.results: List[Dict] = []
+        self.failed_documents: List[Dict] = []
+
+    async def run(self, files: Union[List[Dict], AsyncIterator[Dict]]) -> List[Dict]:
+        """
+        Push the given files through every stage and wait for them to finish.
+
+        Args:
+            files (List[Dict] | AsyncIterator[Dict]): Files to process, each
+                with 'name' and 'url'. An async iterator (e.g. a folder crawl)
+                is consumed while earlier files are already being processed.
+
+        Returns:
+            List[Dict]: Metadata for every document that was processed successfully
+        """
+        # Several comma-separated templates are extracted in one pass over the union of their fields
+        self.fields = self.processor.template_context.get_merged_fields(split_template_ids(self.template_id))
+        if self.field_names is not None:
+            self.fields = [field for field in self.fields if field['name'] in self.field_names]
+            if not self.fields:
+                raise ValueError(f"None of the requested fields are in template {self.template_id}")
+        self.template_version = ExtractionCache.template_version(self.fields)
+
+        download_queue = create_file_queue(self.scheduler_policy, self.queue_size)
+        parse_queue = DocumentQueue(maxsize=self.queue_size)
+        llm_queue = create_llm_queue(self.scheduler_policy, self.queue_size)
+
+        stages = [
+            self._feed(files, download_queue),
+            self._run_stage(download_queue, parse_queue, self.download_concurrency, self._download, 'downloading'),
+            self._run_stage(parse_queue, llm_queue, self.parse_concurrency, self._parse, 'extracting'),
+        ]
+        if self.processor.PACKING_ENABLED and self.processor.MAX_BATCH_SIZE > 1:
+            pack_queue = asyncio.Queue(maxsize=self.queue_size)
+            stages.append(self._pack(llm_queue, pack_queue))
+            llm_queue = pack_queue
+        stages.append(self._run_stage(llm_queue, None, self.llm_concurrency, self._extract, 'llm'))
+
+        start_time = time.time()
+        await asyncio.gather(*stages)
+
+        processing_time = time.time() - start_time
+        logger.info(
+            f"Processed {len(self.results)} documents in {processing_time:.2f} seconds "
+            f"({len(self.failed_documents)} failed, {self.cache_hits} from cache)"
+        )
+        delays = sorted(metadata.get('queue_delay_seconds', 0.0) for metadata in self.results)
+        if delays:
+            logger.info(
+                f"Queueing delay ({self.scheduler_policy}): median {delays[len(delays) // 2]:.2f}s, "
+                f"max {delays[-1]:.2f}s"
+            )
+        return self.results
+
+    async def _feed(self, files: Union[List[Dict], AsyncIterator[Dict]], outbox: asyncio.Queue) -> None:
+        """Queue every file for download, then signal the end of input."""
+        try:
+            if hasattr(files, '__aiter__'):
+                async for file in files:
+                    await self._queue_file(file, outbox)
+            else:
+                for file in files:
+                    await self._queue_file(file, outbox)
+        finally:
+            await outbox.put(None)
+
+    async def _queue_file(self, file: Dict, outbox: asyncio.Queue) -> None:
+        self.files.append(file)
+        item = {'file': file, 'queued_at': time.monotonic()}
+        self._emit(item, 'queued', size=file.get('size'))
+        await outbox.put(item)
+
+    async def _run_stage(self, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                         concurrency: int, handler, event: str) -> None:
+        """
+        Run `concurrency` workers that apply `handler` to items from `inbox`.
+
+        `event` is emitted for every document when a worker picks it up.
+
+        A None item marks the end of input. Each worker passes it back to the
+        inbox for its siblings before exiting, and once all workers are done a
+        single None is forwarded to the next stage.
+        """
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    await inbox.put(None)
+                    break
+                for started in item['pack'] if 'pack' in item else [item]:
+                    self._emit(started, event)
+                try:
+                    item = await handler(item)
+                except Exception as e:
+                    self._record_failure(item, e)
+                    continue
+                for done in item['pack'] if 'pack' in item else [item]:
+                    if outbox is not None and 'metadata' not in done:
+                        await outbox.put(done)
+                    else:
+                        done['metadata']['queue_delay_seconds'] = round(done.get('queue_delay', 0.0), 3)
+                        self.results.append(done['metadata'])
+                        self._count_document(done)
+                        self._notify(done['file'], done['metadata'], None)
+                        self._emit(
+                            done, 'done',
+                            token_statistics=done['metadata'].get('token_statistics'),
+                            extraction_statistics=done['metadata'].get('extraction_statistics'),
+                            from_cache=done.get('from_cache', False)
+                        )
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        if outbox is not None:
+            await outbox.put(None)
+
+    async def _download(self, item: Dict) -> Dict:
+        loop = asyncio.get_running_loop()
+        if self.cache:
+            item['cache_keys'] = [ExtractionCache.version_key(item['file'], self.template_version)]
+            if await self._use_cached(item, item['cache_keys'][0]):
+                return item
+
+        pdf_extractor = self.processor.pdf_extractor
+        if await asyncio.to_thread(pdf_extractor.has_cached_pages, item['file'].get('content_hash')):
+            # The text is parsed from the page cache; the file itself is not needed
+            item['source'] = None
+            item['content_hash'] = item['file']['content_hash']
+        elif item['file'].get('local_path'):
+            # Local files are parsed in place: nothing to download or remove afterwards
+            item['source'] = item['file']['local_path']
+            if self.cache or pdf_extractor.page_cache:
+                item['content_hash'] = await loop.run_in_executor(
+                    self.processor.download_executor, ExtractionCache.hash_file, item['source']
+                )
+        elif self.processor.IN_MEMORY_DOWNLOADS:
+            with self.metrics.stage_seconds.time(stage='download'):
+                download = await loop.run_in_executor(
+                    self.processor.download_executor,
+                    self.processor.download_document_spooled,
+                    item['file']['url']
+                )
+            # Bytes for documents held in memory, a temporary file path otherwise
+            item['source'] = download.source
+            item['path'] = download.path
+            item['content_hash'] = download.content_hash
+        else:
+            temp_file_path = self.processor._get_temp_file_path()
+            item['source'] = item['path'] = temp_file_path
+            with self.metrics.stage_seconds.time(stage='download'):
+                await loop.run_in_executor(
+                    self.processor.download_executor,
+                    self.processor.download_document,
+                    item['file']['url'],
+                    temp_file_path
+                )
+            if self.cache or pdf_extractor.page_cache:
+                item['content_hash'] = await loop.run_in_executor(
+                    self.processor.download_executor, ExtractionCache.hash_file, temp_file_path
+                )
+
+        if self.cache:
+            content_key = ExtractionCache.content_key(item['content_hash'], self.template_version)
+            item['cache_keys'].append(content_key)
+            if await self._use_cached(item, content_key):
+                self._remove_temp_file(item)
+        return item
+
+    async def _use_cached(self, item: Dict, key: Optional[str]) -> bool:
+        """Attach a cached result to the item if there is one for `key`."""
+        cached = await asyncio.to_thread(self.cache.get, key) if key else None
+        if cached is None:
+            return False
+        cached['File Name'] = item['file'].get('name')
+        cached['source'] = self._source(item)
+        item['metadata'] = cached
+        item['from_cache'] = True
+        self.cache_hits += 1
+        logger.info(f"Using cached extraction for {item['file'].get('name')}")
+        return True
+
+    async def _parse(self, item: Dict) -> Dict:
+        try:
+            with self.metrics.stage_seconds.time(stage='pdf_extract'):
+                extraction = await self.processor.pdf_extractor.extract(item['source'], item.get('content_hash'))
+        finally:
+            self._remove_temp_file(item)
+        item['text'] = extraction['text']
+        item['text_tokens'] = await asyncio.to_thread(self.processor._count_tokens, item['text'])
+        timings = extraction['page_timings']
+        item['extraction_statistics'] = {
+            'page_count': extraction['page_count'],
+            'parse_seconds': round(sum(timings, 0.0), 3),
+            'slowest_page_seconds': round(max(timings), 3) if timings else 0.0,
+            'from_page_cache': extraction['from_cache']
+        }
+        return item
+
+    async def _pack(self, inbox: asyncio.Queue, outbox: asyncio.Queue) -> None:
+        """
+        Group small parsed documents into packs for a single LLM request.
+
+        A pack is sent once it holds MAX_BATCH_SIZE documents, once the next
+        document would exceed PACKING_TOKEN_BUDGET, or once no document has
+        arrived for PACKING_WAIT_SECONDS. Documents above
+        PACKING_MAX_DOCUMENT_TOKENS pass through on their own.
+        """
+        processor = self.processor
+        pack: List[Dict] = []
+        pack_tokens = 0
+        while True:
+            try:
+                if pack:
+                    item = await asyncio.wait_for(inbox.get(), processor.PACKING_WAIT_SECONDS)
+                else:
+                    item = await inbox.get()
+            except asyncio.TimeoutError:
+                await self._send_pack(pack, outbox)
+                pack, pack_tokens = [], 0
+                continue
+            if item is None:
+                break
+
+            if item['text_tokens'] > processor.PACKING_MAX_DOCUMENT_TOKENS:
+                await outbox.put(item)
+                continue
+            if pack and (len(pack) >= processor.MAX_BATCH_SIZE or
+                         pack_tokens + item['text_tokens'] > processor.PACKING_TOKEN_BUDGET):
+                await self._send_pack(pack, outbox)
+                pack, pack_tokens = [], 0
+            pack.append(item)
+            pack_tokens += item['text_tokens']
+
+        if pack:
+            await self._send_pack(pack, outbox)
+        await outbox.put(None)
+
+    async def _send_pack(self, pack: List[Dict], outbox: asyncio.Queue) -> None:
+        await outbox.put(pack[0] if len(pack) == 1 else {'pack': pack})
+
+    async def _extract(self, item: Dict) -> Dict:
+        if 'pack' in item:
+            return await self._extract_pack(item['pack'])
+        metadata = await self.processor.extract_metadata_async(
+            item['text'], self.fields, text_tokens=item.pop('text_tokens', None)
+        )
+        await self._finish_extraction(item, metadata)
+        return item
+
+    async def _extract_pack(self, items: List[Dict]) -> Dict:
+        """
+        Extract a pack of documents with one request.
+
+        Documents missing from the answer, or every document when the packed
+        request fails, are extracted again one by one.
+        """
+        try:
+            results = await self.processor.extract_metadata_batch_async(
+                [item['text'] for item in items], self.fields, [item['text_tokens'] for item in items]
+            )
+        except Exception as e:
+            logger.warning(f"Packed extraction of {len(items)} documents failed, extracting them one by one: {str(e)}")
+            results = [None] * len(items)
+
+        done = []
+        for item, metadata in zip(items, results):
+            try:
+                if metadata is None:
+                    await self._extract(item)
+                else:
+                    await self._finish_extraction(item, metadata)
+            except Exception as e:
+                self._record_failure(item, e)
+                continue
+            done.append(item)
+        return {'pack': done}
+
+    async def _finish_extraction(self, item: Dict, metadata: Dict) -> None:
+        item.pop('text', None)
+        item.pop('text_tokens', None)
+        # An unparsable reply yields no template fields; caching it would make
+        # a transient failure stick until the file or the template changes
+        if self.cache and any(field['name'] in metadata for field in self.fields):
+            await asyncio.to_thread(self.cache.put, item['cache_keys'], metadata)
+        metadata['File Name'] = item['file'].get('name')
+        metadata['extraction_statistics'] = item.pop('extraction_statistics', None)
+        metadata['source'] = self._source(item)
+        item['metadata'] = metadata
+
+    def _source(self, item: Dict) -> Dict:
+        """Where the document came from and which version of it was extracted."""
+        source = {key: item['file'][key] for key in SOURCE_KEYS if item['file'].get(key)}
+        content_hash = item.get('content_hash') or item['file'].get('content_hash')
+        if content_hash:
+            source['content_hash'] = content_hash
+        return source
+
+    def _record_failure(self, item: Dict, error: Exception) -> None:
+        self._remove_temp_file(item)
+        file_name = item['file'].get('name', 'unknown')
+        logger.error(f"Error processing document {file_name}: {str(error)}")
+        self.failed_documents.append({
+            'error': str(error),
+            'file': file_name
+        })
+        self.metrics.documents.inc(outcome='failed')
+        self._notify(item['file'], None, str(error))
+        self._emit(item, 'failed', error=str(error))
+
+    def _count_document(self, item: Dict) -> None:
+        self.metrics.queue_delay_seconds.observe(item.get('queue_delay', 0.0))
+        if item.get('from_cache'):
+            self.metrics.documents.inc(outcome='cached')
+        else:
+            self.metrics.documents.inc(outcome='done')
+            self.metrics.record_tokens(self.template_id, item['metadata'].get('token_statistics'))
+
+    def _notify(self, file: Dict, metadata: Optional[Dict], error: Optional[str]) -> None:
+        if self.on_document is None:
+            return
+        try:
+            self.on_document(file, metadata, error)
+        except Exception as e:
+            logger.error(f"Error recording outcome of {file.get('name', 'unknown')}: {str(e)}")
+
+    def _emit(self, item: Dict, event: str, **data) -> None:
+        if self.on_event is None:
+            return
+        if 'queued_at' in item:
+            data['elapsed_seconds'] = round(time.monotonic() - item['queued_at'], 3)
+        data['queue_delay_seconds'] = round(item.get('queue_delay', 0.0), 3)
+        if item.get('text_tokens') is not None:
+            data['text_tokens'] = item['text_tokens']
+        try:
+            self.on_event(item['file'], event, data)
+        except Exception as e:
+            logger.error(f"Error recording {event} event of {item['file'].get('name', 'unknown')}: {str(e)}")
+
+    def _remove_temp_file(self, item: Dict) -> None:
+        item.pop('source', None)
+        temp_file_path = item.pop('path', None)
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.remove(temp_file_path)
+            except Exception as e:
+                logger.warning(f"Could not remove temporary file {temp_file_path}: {str(e)}")
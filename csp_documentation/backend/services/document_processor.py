@@ -1,13 +1,21 @@
 import os
 import requests
 import json
-from PyPDF2 import PdfReader
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import logging
 from dotenv import load_dotenv
 from services.sharepoint_service import SharePointService
-from context.template_context import TemplateContext
-from typing import List, Dict, Optional
+from context.template_context import get_template_context
+from services.extraction_cache import ExtractionCache
+from services.sync_manifest import SyncManifest
+from services.rate_limiter import RateLimiter
+from services.metrics import ProcessingMetrics
+from services.pdf_extractor import PdfTextExtractor, extract_pdf_text
+from services.passage_index import PassageIndex
+from services.spooled_download import SpooledDownload
+from services.folder_crawler import FolderCrawler
+from typing import Callable, List, Dict, Optional, Tuple
 import re
 from urllib.parse import urlparse
 from office365.runtime.auth.client_credential import ClientCredential
@@ -16,10 +24,10 @@ from office365.sharepoint.files.file import File
 import tiktoken
 from datetime import datetime, timedelta
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import time
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 import threading
+from collections import deque
 from functools import partial
 import tempfile
 import uuid
@@ -47,21 +55,25 @@ class DocumentProcessor:
         genai.configure(api_key=gemini_api_key)
         self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
         
-        # Initialize template context
-        self.template_context = TemplateContext()
+        # Shared template registry
+        self.template_context = get_template_context()
 
         self.sharepoint_client = None
         
-        # Initialize token tracking
+        # Initialize token tracking; only the last TOKENS_PER_MINUTE_HISTORY minutes are kept
+        self.TOKENS_PER_MINUTE_HISTORY = int(os.getenv('TOKENS_PER_MINUTE_HISTORY', '60'))
         self.token_tracking = {
             'total_tokens': 0,
-            'tokens_per_minute': [],
+            'tokens_per_minute': deque(maxlen=self.TOKENS_PER_MINUTE_HISTORY),
             'last_minute_tokens': 0,
             'last_minute_time': datetime.now(),
             'documents_processed': 0,
             'documents_exceeding_limit': 0
         }
         
+        # Stage latencies, document and request counts and tokens per template
+        self.metrics = ProcessingMetrics()
+        
         # Initialize tokenizer
         self.tokenizer = tiktoken.get_encoding("cl100k_base") 
         
@@ -70,16 +82,81 @@ class DocumentProcessor:
         self.MAX_BATCH_SIZE = 10  # Maximum number of documents per batch
         self.BATCH_PROCESSING_TIMEOUT = 120  # 2 minutes timeout for batch processing
         
-        # Initialize queues and thread pools
-        self.document_queue = Queue()
-        self.result_queue = Queue()
+        # Rate limiter shared by every Gemini call of this process. The token
+        # budget per minute is MAX_TOKENS_PER_BATCH.
+        self.MAX_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '1000'))
+        self.ESTIMATED_RESPONSE_TOKENS = int(os.getenv('GEMINI_ESTIMATED_RESPONSE_TOKENS', '512'))
+        self.LLM_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+        self.rate_limiter = RateLimiter(self.MAX_TOKENS_PER_BATCH, self.MAX_REQUESTS_PER_MINUTE)
+        
+        # Documents above this many tokens are extracted chunk by chunk
+        self.CHUNKED_EXTRACTION_THRESHOLD = int(os.getenv('CHUNKED_EXTRACTION_THRESHOLD', '100000'))
+        self.CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '50000'))
+        self.CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '200'))
+        
+        # Opt-in, off by default so the whole text is searched: documents above
+        # RETRIEVAL_MIN_TOKENS only send the passages that a local BM25 index
+        # ranks as relevant to the template fields
+        self.RETRIEVAL_ENABLED = os.getenv('RETRIEVAL_ENABLED', 'false').lower() == 'true'
+        self.RETRIEVAL_MIN_TOKENS = int(os.getenv('RETRIEVAL_MIN_TOKENS', '8000'))
+        self.RETRIEVAL_PASSAGE_WORDS = int(os.getenv('RETRIEVAL_PASSAGE_WORDS', '200'))
+        self.RETRIEVAL_PASSAGES_PER_FIELD = int(os.getenv('RETRIEVAL_PASSAGES_PER_FIELD', '3'))
+        
+        # Small documents are packed, up to MAX_BATCH_SIZE at a time, into
+        # a single prompt of at most PACKING_TOKEN_BUDGET document tokens
+        self.PACKING_ENABLED = os.getenv('PACKING_ENABLED', 'true').lower() == 'true'
+        self.PACKING_MAX_DOCUMENT_TOKENS = int(os.getenv('PACKING_MAX_DOCUMENT_TOKENS', '4000'))
+        self.PACKING_TOKEN_BUDGET = int(os.getenv('PACKING_TOKEN_BUDGET', '40000'))
+        self.PACKING_WAIT_SECONDS = float(os.getenv('PACKING_WAIT_SECONDS', '2'))
+        
+        # Pipeline settings: concurrent downloads, PDF parsing processes,
+        # in-flight LLM requests and the size of the queues between stages
+        self.DOWNLOAD_CONCURRENCY = int(os.getenv('PIPELINE_DOWNLOAD_CONCURRENCY', '8'))
+        self.PARSE_WORKERS = int(os.getenv('PIPELINE_PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.LLM_CONCURRENCY = int(os.getenv('PIPELINE_LLM_CONCURRENCY', '4'))
+        self.PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '16'))
+        # Bounds the Gemini requests in flight across all pipelines, including
+        # the chunk requests of large documents
+        self.llm_semaphore = asyncio.Semaphore(max(1, self.LLM_CONCURRENCY))
+        # Order in which queued documents are served: fifo, sjf_size, sjf_tokens or fair
+        self.SCHEDULER_POLICY = os.getenv('SCHEDULER_POLICY', 'fifo').lower()
+        
+        # Downloads are streamed in DOWNLOAD_CHUNK_SIZE chunks and, when
+        # IN_MEMORY_DOWNLOADS is on, held in memory up to DOWNLOAD_SPOOL_MAX_BYTES
+        self.DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+        self.IN_MEMORY_DOWNLOADS = os.getenv('IN_MEMORY_DOWNLOADS', 'true').lower() == 'true'
+        self.DOWNLOAD_SPOOL_MAX_BYTES = int(os.getenv('DOWNLOAD_SPOOL_MAX_MB', '16')) * 1024 * 1024
         
-        # Thread pool for processing
-        self.process_pool = ThreadPoolExecutor(max_workers=4)
+        # Thread pool for blocking downloads; the PDF parsing process pool is
+        # started on first use
+        self.download_executor = ThreadPoolExecutor(max_workers=self.DOWNLOAD_CONCURRENCY)
+        self.parse_executor = None
+        
+        # Page-parallel PDF text extraction on the parsing process pool
+        self.pdf_extractor = PdfTextExtractor(self.get_parse_executor)
+        
+        # Cache of extraction results keyed by document version and template fields
+        if os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true':
+            self.extraction_cache = ExtractionCache()
+        else:
+            self.extraction_cache = None
+        
+        # Manifest of SharePoint folder contents for delta syncs
+        self.sync_manifest = SyncManifest()
         
         # Lock for thread-safe operations
         self.token_lock = threading.Lock()
 
+    def get_parse_executor(self) -> ProcessPoolExecutor:
+        """Return the process pool used for PDF parsing, starting it if needed."""
+        if self.parse_executor is None:
+            # Spawn rather than fork: the server process runs other threads
+            self.parse_executor = ProcessPoolExecutor(
+                max_workers=self.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.parse_executor
+
     def _get_temp_file_path(self) -> str:
         """Generate a unique temporary file path."""
         temp_dir = tempfile.gettempdir()
@@ -89,7 +166,8 @@ class DocumentProcessor:
     def _count_tokens(self, text: str) -> int:
         """Count the number of tokens in a text string."""
         try:
-            return len(self.tokenizer.encode(text))
+            with self.metrics.stage_seconds.time(stage='tokenize'):
+                return len(self.tokenizer.encode(text))
         except Exception as e:
             logger.error(f"Error counting tokens: {str(e)}")
             return 0
@@ -123,7 +201,8 @@ class DocumentProcessor:
             'total_tokens': self.token_tracking['total_tokens'],
             'documents_processed': self.token_tracking['documents_processed'],
             'documents_exceeding_limit': self.token_tracking['documents_exceeding_limit'],
-            'tokens_per_minute': self.token_tracking['tokens_per_minute'][-5:] if self.token_tracking['tokens_per_minute'] else []
+            'tokens_per_minute': list(self.token_tracking['tokens_per_minute'])[-5:],
+            'rate_limiter': self.rate_limiter.get_statistics()
         }
 
     def _initialize_sharepoint(self, site_url: str):
@@ -134,6 +213,22 @@ class DocumentProcessor:
             credentials = ClientCredential(client_id, client_secret)
             self.sharepoint_client = ClientContext(site_url).with_credentials(credentials)
     
+    def _get_folder_path(self, folder_url: str) -> Optional[str]:
+        """
+        Extract the drive folder path from a Graph API folder URL.
+        
+        Example URL: https://graph.microsoft.com/v1.0/sites/.../drive/root:/Regulatory IDMP Documents
+        """
+        parts = folder_url.split('/drive/root:/')
+        if len(parts) < 2:
+            logger.error("Invalid Graph API URL format")
+            return None
+        # Remove any trailing parameters or slashes
+        folder_path = parts[1].split(':/')[0]  # Remove any :/children or similar
+        folder_path = folder_path.rstrip('/')
+        logger.info(f"Extracted folder path: {folder_path}")
+        return folder_path
+
     def _get_sharepoint_files(self, folder_url: str) -> List[Dict]:
         """Get all PDF files from a SharePoint folder."""
         try:
@@ -141,189 +236,349 @@ class DocumentProcessor:
                 logger.warning("SharePoint service not configured. Please set up SharePoint credentials.")
                 return []
                 
-            # Extract the folder path from the Graph API URL
-            if 'graph.microsoft.com' in folder_url:
-                try:
-                    # Extract the folder path from the URL
-                    # Example URL: https://graph.microsoft.com/v1.0/sites/.../drive/root:/Regulatory IDMP Documents
-                    parts = folder_url.split('/drive/root:/')
-                    if len(parts) > 1:
-                        folder_path = parts[1]
-                        # Remove any trailing parameters or slashes
-                        folder_path = folder_path.split(':/')[0]  # Remove any :/children or similar
-                        folder_path = folder_path.rstrip('/')
-                        
-                        logger.info(f"Extracted folder path: {folder_path}")
-                        
-                        # Use the SharePoint service to get files from the specific folder
-                        files = self.sharepoint_service.get_files(folder_path)
-                        
-                        return [{
-                            'url': file['url'],
-                            'name': file['name']
-                        } for file in files]
-                    else:
-                        logger.error("Invalid Graph API URL format")
-                        return []
-                        
-                except Exception as e:
-                    logger.error(f"Error parsing Graph API URL: {str(e)}")
-                    return []
-            else:
-                logger.error("Invalid SharePoint URL format")
+            folder_path = self._get_folder_path(folder_url)
+            if not folder_path:
                 return []
             
+            # Use the SharePoint service to get files from the specific folder
+            return self.sharepoint_service.get_files(folder_path)
+            
         except Exception as e:
             logger.error(f"Error getting SharePoint files: {str(e)}")
             return []
+
+    def crawl_files(self, url: str, on_error: Optional[Callable[[str, str], None]] = None):
+        """
+        Crawl a SharePoint folder and all its subfolders for PDFs.
+        
+        Args:
+            url (str): Graph API URL of the folder
+            on_error (Callable, optional): Called with the path of each folder
+                that could not be listed and the error
+            
+        Returns:
+            AsyncIterator[Dict]: The PDFs, yielded as they are discovered
+        """
+        if not self.sharepoint_service:
+            raise ValueError("SharePoint service not configured")
+        folder_path = self._get_folder_path(url)
+        if not folder_path:
+            raise ValueError(f"Invalid SharePoint folder URL: {url}")
+        return FolderCrawler(self.sharepoint_service).crawl(folder_path, on_error)
+
+    def get_changed_files(self, url: str) -> Dict[str, List[Dict]]:
+        """
+        Sync a SharePoint folder against the local manifest.
+        
+        Args:
+            url (str): Graph API URL of the SharePoint folder
+            
+        Returns:
+            Dict[str, List[Dict]]: 'changed' - files to process; 'deleted' -
+                manifest items removed from the folder
+        """
+        if not self.sharepoint_service:
+            raise ValueError("SharePoint service not configured")
+        folder_path = self._get_folder_path(url)
+        if not folder_path:
+            raise ValueError("Delta sync requires a SharePoint folder URL")
+        return self.sharepoint_service.sync_folder(folder_path, self.sync_manifest)
+
+    def mark_synced(self, url: str, files: List[Dict], failed_documents: List[Dict]) -> None:
+        """Record the files of a delta sync that were processed successfully."""
+        failed_names = {failure['file'] for failure in failed_documents}
+        self.sync_manifest.mark_processed(
+            self._get_folder_path(url),
+            [file['id'] for file in files if file['name'] not in failed_names]
+        )
     
     def _get_url_type(self, url: str) -> str:
         """Determine the type of URL."""
-        if 'sharepoint.com' in url:
+        if 'sharepoint.com' in url or '/drive/root:/' in url:
             return 'sharepoint'
         else:
             return 'document'
 
-    async def process_documents(self, url: str, template_id: str) -> List[Dict]:
-        """
-        Process multiple documents in parallel using queues and thread pools.
+    async def extract_metadata_async(self, text: str, fields: List[Dict], text_tokens: Optional[int] = None) -> Dict:
         """
-        try:
-            url_type = self._get_url_type(url)
-            all_metadata = []
-            failed_documents = []
-            
-            if url_type == 'sharepoint':
-                self._initialize_sharepoint(url)
-                files = self._get_sharepoint_files(url)
-                if not files:
-                    raise ValueError("No files found in the SharePoint folder")
-                
-                logger.info(f"Found {len(files)} files to process")
-                
-                # Start parallel processing
-                start_time = time.time()
-                
-                # Start worker threads
-                workers = []
-                for _ in range(4):  # 4 worker threads
-                    worker = threading.Thread(
-                        target=self._process_document_worker,
-                        args=(template_id,)
-                    )
-                    worker.start()
-                    workers.append(worker)
-                
-                # Add documents to queue
-                for file in files:
-                    self.document_queue.put(file)
-                
-                # Add None to signal end of documents
-                for _ in range(4):
-                    self.document_queue.put(None)
-                
-                # Wait for all workers to complete
-                for worker in workers:
-                    worker.join()
-                
-                # Collect results
-                while not self.result_queue.empty():
-                    result = self.result_queue.get()
-                    if isinstance(result, dict):
-                        all_metadata.append(result)
-                    else:
-                        failed_documents.append(result)
-                
-                processing_time = time.time() - start_time
-                logger.info(f"Processed {len(all_metadata)} documents in {processing_time:.2f} seconds")
-                
-            else:
-                # Single document processing
-                metadata = await self.process_document(url, template_id)
-                all_metadata.append(metadata)
+        Extract the template fields from document text with Gemini.
+        
+        Texts longer than CHUNKED_EXTRACTION_THRESHOLD tokens are split into
+        chunks that are extracted concurrently and merged field by field, so
+        the whole text is searched. When retrieval is enabled (off by
+        default), documents longer than RETRIEVAL_MIN_TOKENS tokens are first
+        cut down to the passages relevant to the fields; retrieval then wins
+        and chunking only applies if the selected passages are still over the
+        threshold. Values outside the selected passages are not found.
+        
+        Args:
+            text (str): The document text
+            fields (List[Dict]): Template fields to extract
+            text_tokens (int, optional): Token count of the text, if already known
             
-            return all_metadata
+        Returns:
+            Dict: Extracted metadata including token statistics
+        """
+        # Count tokens
+        if text_tokens is None:
+            text_tokens = await asyncio.to_thread(self._count_tokens, text)
+        with self.token_lock:
+            self._update_token_tracking(text_tokens)
+        
+        document_tokens = text_tokens
+        if self.RETRIEVAL_ENABLED and text_tokens > self.RETRIEVAL_MIN_TOKENS:
+            # Indexing and counting a large text would block the event loop
+            text = await asyncio.to_thread(self._select_passages, text, fields)
+            text_tokens = await asyncio.to_thread(self._count_tokens, text)
+            logger.info(f"Sending {text_tokens} of {document_tokens} document tokens after passage selection")
+        
+        if text_tokens > self.CHUNKED_EXTRACTION_THRESHOLD:
+            metadata, prompt_tokens, response_tokens, chunk_count = await self._extract_chunked(text, fields)
+        else:
+            metadata, prompt_tokens, response_tokens = await self._extract_once(text, fields)
+            chunk_count = 1
+        
+        # Add token statistics
+        metadata['token_statistics'] = {
+            'document_tokens': document_tokens,
+            'text_tokens': text_tokens,
+            'prompt_tokens': prompt_tokens,
+            'response_tokens': response_tokens,
+            'total_tokens': text_tokens + prompt_tokens + response_tokens,
+            'chunks': chunk_count
+        }
+        
+        # Update document count
+        with self.token_lock:
+            self.token_tracking['documents_processed'] += 1
+        
+        return metadata
+
+    async def extract_metadata_batch_async(self, texts: List[str], fields: List[Dict],
+                                           text_tokens: Optional[List[int]] = None) -> List[Optional[Dict]]:
+        """
+        Extract the template fields from several small documents with one prompt.
+        
+        The instruction block is sent once, followed by every document under
+        its own ID, and Gemini answers with one JSON object per document ID.
+        
+        Args:
+            texts (List[str]): The document texts
+            fields (List[Dict]): Template fields to extract
+            text_tokens (List[int], optional): Token count of each text, if already known
             
-        except Exception as e:
-            logger.error(f"Error processing documents: {str(e)}")
-            raise
+        Returns:
+            List[Optional[Dict]]: Metadata of each document, in input order;
+                None for documents missing from the response
+        """
+        if text_tokens is None:
+            text_tokens = await asyncio.gather(*(asyncio.to_thread(self._count_tokens, text) for text in texts))
+        with self.token_lock:
+            self._update_token_tracking(sum(text_tokens))
+        
+        document_ids = [f"DOC{index + 1}" for index in range(len(texts))]
+        with self.metrics.stage_seconds.time(stage='prompt_build'):
+            prompt = self._generate_batch_prompt(dict(zip(document_ids, texts)), fields)
+        
+        prompt_tokens = await asyncio.to_thread(self._count_tokens, prompt)
+        with self.token_lock:
+            self._update_token_tracking(prompt_tokens)
+        
+        response = await self._generate_content_async(prompt, prompt_tokens)
+        
+        response_tokens = await asyncio.to_thread(self._count_tokens, response.text)
+        with self.token_lock:
+            self._update_token_tracking(response_tokens)
+        
+        with self.metrics.stage_seconds.time(stage='response_parse'):
+            answers = self._parse_batch_response(response.text)
+            parsed = {
+                document_id: self._parse_response(json.dumps(answer))
+                for document_id, answer in answers.items() if isinstance(answer, dict)
+            }
+        results = []
+        for document_id, tokens in zip(document_ids, text_tokens):
+            metadata = parsed.get(document_id)
+            if metadata is None:
+                results.append(None)
+                continue
+            metadata['token_statistics'] = {
+                'document_tokens': tokens,
+                'text_tokens': tokens,
+                'prompt_tokens': prompt_tokens // len(texts),
+                'response_tokens': response_tokens // len(texts),
+                'total_tokens': tokens + (prompt_tokens + response_tokens) // len(texts),
+                'chunks': 1,
+                'packed_documents': len(texts)
+            }
+            results.append(metadata)
+        
+        with self.token_lock:
+            self.token_tracking['documents_processed'] += sum(1 for result in results if result is not None)
+        
+        return results
 
-    def _process_document_worker(self, template_id: str):
+    async def _extract_once(self, text: str, fields: List[Dict]) -> Tuple[Dict, int, int]:
         """
-        Worker thread for processing documents from the queue.
+        Extract the fields from a text with a single prompt.
+        
+        Returns:
+            Tuple[Dict, int, int]: Parsed metadata, prompt tokens and response tokens
         """
-        while True:
-            file = self.document_queue.get()
-            if file is None:
+        # Generate prompt
+        with self.metrics.stage_seconds.time(stage='prompt_build'):
+            prompt = self._generate_prompt(text, fields)
+        
+        # Count prompt tokens; chunk-sized prompts would block the event loop
+        prompt_tokens = await asyncio.to_thread(self._count_tokens, prompt)
+        with self.token_lock:
+            self._update_token_tracking(prompt_tokens)
+        
+        # Get metadata from Gemini
+        response = await self._generate_content_async(prompt, prompt_tokens)
+        
+        # Count response tokens
+        response_tokens = await asyncio.to_thread(self._count_tokens, response.text)
+        with self.token_lock:
+            self._update_token_tracking(response_tokens)
+        
+        with self.metrics.stage_seconds.time(stage='response_parse'):
+            metadata = self._parse_response(response.text)
+        return metadata, prompt_tokens, response_tokens
+
+    async def _extract_chunked(self, text: str, fields: List[Dict]) -> Tuple[Dict, int, int, int]:
+        """
+        Map-reduce extraction for documents too large for one prompt.
+        
+        Each chunk is extracted on its own, sharing the process-wide
+        LLM_CONCURRENCY limit with all other requests, and the answers are
+        merged with `_reduce_chunk_results`.
+        A failed chunk fails the document rather than leaving fields silently
+        incomplete.
+        
+        Returns:
+            Tuple[Dict, int, int, int]: Merged metadata, prompt tokens,
+                response tokens and number of chunks
+        """
+        chunks = await asyncio.to_thread(self._split_text, text)
+        logger.info(f"Document too large for one prompt, extracting from {len(chunks)} chunks")
+        results = await asyncio.gather(*(self._extract_once(chunk, fields) for chunk in chunks))
+        metadata = self._reduce_chunk_results([result[0] for result in results], fields)
+        prompt_tokens = sum(result[1] for result in results)
+        response_tokens = sum(result[2] for result in results)
+        return metadata, prompt_tokens, response_tokens, len(chunks)
+
+    def _select_passages(self, text: str, fields: List[Dict]) -> str:
+        """Keep only the passages of a document that are relevant to the fields."""
+        index = PassageIndex(text, passage_words=self.RETRIEVAL_PASSAGE_WORDS)
+        return index.select_text(fields, self.RETRIEVAL_PASSAGES_PER_FIELD)
+
+    def _split_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks of at most CHUNK_TOKENS tokens.
+        
+        Consecutive chunks overlap by CHUNK_OVERLAP_TOKENS tokens so values
+        that straddle a boundary are seen whole by at least one chunk.
+        """
+        tokens = self.tokenizer.encode(text)
+        step = max(1, self.CHUNK_TOKENS - self.CHUNK_OVERLAP_TOKENS)
+        chunks = []
+        for start in range(0, len(tokens), step):
+            chunks.append(self.tokenizer.decode(tokens[start:start + self.CHUNK_TOKENS]))
+            if start + self.CHUNK_TOKENS >= len(tokens):
                 break
-                
-            temp_file_path = None
+        return chunks
+
+    def _reduce_chunk_results(self, chunk_results: List[Dict], fields: List[Dict]) -> Dict:
+        """
+        Merge per-chunk answers into one value per field.
+        
+        The distinct answers of each field (semicolon-separated values count
+        separately, compared case- and whitespace-insensitively) are joined
+        with "; " in chunk order. Fields no chunk found are "Not found".
+        """
+        metadata = {}
+        for field in fields:
+            field_name = field['name']
+            values = []
+            seen = set()
+            for result in chunk_results:
+                value = result.get(field_name)
+                if isinstance(value, list):
+                    value = "; ".join(str(v) for v in value)
+                if not value:
+                    continue
+                for part in str(value).split(';'):
+                    part = part.strip()
+                    normalized = " ".join(part.lower().split())
+                    if not part or normalized == "not found" or normalized in seen:
+                        continue
+                    seen.add(normalized)
+                    values.append(part)
+            metadata[field_name] = "; ".join(values) if values else "Not found"
+        return metadata
+
+    async def _generate_content_async(self, prompt: str, prompt_tokens: int):
+        """
+        Send a prompt to Gemini through the shared rate limiter.
+        
+        At most LLM_CONCURRENCY requests are in flight per process, whether
+        they are whole documents, packs or chunks of a large document.
+        
+        The estimated tokens (prompt plus expected response) are acquired
+        before the call and reconciled with the reported usage afterwards.
+        429 responses pause all callers and the request is retried instead
+        of failing the document.
+        
+        Args:
+            prompt (str): The prompt to send
+            prompt_tokens (int): Token count of the prompt
+            
+        Returns:
+            The Gemini response
+        """
+        estimated_tokens = prompt_tokens + self.ESTIMATED_RESPONSE_TOKENS
+        attempt = 0
+        while True:
             try:
-                # Generate unique temp file path
-                temp_file_path = self._get_temp_file_path()
-                
-                # Download document
-                self.download_document(file['url'], temp_file_path)
-                
-                # Extract text
-                text = self.extract_text(temp_file_path)
-                
-                # Count tokens
-                text_tokens = self._count_tokens(text)
-                with self.token_lock:
-                    self._update_token_tracking(text_tokens)
-                
-                # Generate prompt
-                template = self.template_context.get_template(template_id)
-                fields = template.get('metadataFields', [])
-                prompt = self._generate_prompt(text, fields)
-                
-                # Count prompt tokens
-                prompt_tokens = self._count_tokens(prompt)
-                with self.token_lock:
-                    self._update_token_tracking(prompt_tokens)
-                
-                # Get metadata from Gemini
-                response = self.gemini_model.generate_content(prompt)
-                
-                # Count response tokens
-                response_tokens = self._count_tokens(response.text)
-                with self.token_lock:
-                    self._update_token_tracking(response_tokens)
-                
-                # Parse response
-                metadata = self._parse_response(response.text)
-                
-                # Add token statistics
-                metadata['token_statistics'] = {
-                    'text_tokens': text_tokens,
-                    'prompt_tokens': prompt_tokens,
-                    'response_tokens': response_tokens,
-                    'total_tokens': text_tokens + prompt_tokens + response_tokens
-                }
-                
-                # Update document count
-                with self.token_lock:
-                    self.token_tracking['documents_processed'] += 1
-                
-                # Add result to queue
-                self.result_queue.put(metadata)
-                
-            except Exception as e:
-                logger.error(f"Error processing document {file.get('name', 'unknown')}: {str(e)}")
-                self.result_queue.put({
-                    'error': str(e),
-                    'file': file.get('name', 'unknown')
-                })
-            finally:
-                # Clean up temporary file
-                if temp_file_path and os.path.exists(temp_file_path):
-                    try:
-                        os.remove(temp_file_path)
-                    except Exception as e:
-                        logger.warning(f"Could not remove temporary file {temp_file_path}: {str(e)}")
-                
-                self.document_queue.task_done()
+                async with self.llm_semaphore:
+                    await self.rate_limiter.acquire(estimated_tokens)
+                    with self.metrics.stage_seconds.time(stage='llm'):
+                        response = await self.gemini_model.generate_content_async(prompt)
+            except (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests) as e:
+                # The rejected request still counts against the quota window
+                self.metrics.llm_requests.inc(outcome='rate_limited')
+                attempt += 1
+                if attempt > self.LLM_MAX_RETRIES:
+                    raise
+                delay = self.rate_limiter.on_rate_limited(self._get_retry_after(e))
+                logger.warning(f"Gemini rate limited (attempt {attempt}/{self.LLM_MAX_RETRIES}), retrying in {delay:.1f}s")
+                continue
+            except Exception:
+                self.metrics.llm_requests.inc(outcome='error')
+                raise
+            
+            self.metrics.llm_requests.inc(outcome='success')
+            self.rate_limiter.on_success()
+            self.rate_limiter.reconcile(estimated_tokens, self._get_actual_tokens(response, prompt_tokens))
+            return response
+
+    def _get_retry_after(self, error: Exception) -> Optional[float]:
+        """Read the retry delay from a rate limit error, if the API sent one."""
+        match = re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', str(error)) or \
+            re.search(r'retry in ([\d.]+)\s*s', str(error), re.IGNORECASE)
+        return float(match.group(1)) if match else None
+
+    def _get_actual_tokens(self, response, prompt_tokens: int) -> int:
+        """Total tokens reported by Gemini, falling back to a local count."""
+        usage = getattr(response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', None) if usage else None
+        if total:
+            return int(total)
+        try:
+            return prompt_tokens + self._count_tokens(response.text)
+        except Exception:
+            return prompt_tokens
 
     def download_document(self, document_url: str, temp_file_path: str) -> None:
         """
@@ -334,24 +589,52 @@ class DocumentProcessor:
             temp_file_path (str): Path to save the downloaded document
         """
         try:
-            if "sharepoint.com" in document_url:
-                # Handle SharePoint URL
-                if not self.sharepoint_service:
-                    raise ValueError("SharePoint service not configured")
-                self.sharepoint_service.download_file(document_url, temp_file_path)
-            else:
-                # Handle regular PDF URL
-                response = requests.get(document_url, stream=True)
-                response.raise_for_status()
-                
-                with open(temp_file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            with open(temp_file_path, 'wb') as f:
+                for chunk in self._iter_document_chunks(document_url):
+                    f.write(chunk)
                 
         except Exception as e:
             logger.error(f"Error downloading document: {str(e)}")
             raise
 
+    def download_document_spooled(self, document_url: str) -> SpooledDownload:
+        """
+        Download a document into memory, spilling to a temporary file only
+        above DOWNLOAD_SPOOL_MAX_BYTES.
+        
+        Args:
+            document_url (str): URL of the document
+            
+        Returns:
+            SpooledDownload: The downloaded content and its hash
+        """
+        download = SpooledDownload(self.DOWNLOAD_SPOOL_MAX_BYTES)
+        try:
+            for chunk in self._iter_document_chunks(document_url):
+                download.write(chunk)
+            download.close()
+            return download
+        except Exception as e:
+            download.cleanup()
+            logger.error(f"Error downloading document: {str(e)}")
+            raise
+
+    def _iter_document_chunks(self, document_url: str):
+        """Stream a document from SharePoint or a plain URL in DOWNLOAD_CHUNK_SIZE chunks."""
+        is_graph_url = self.sharepoint_service and document_url.startswith(self.sharepoint_service.graph_url)
+        if "sharepoint.com" in document_url or is_graph_url:
+            # Handle SharePoint URL
+            if not self.sharepoint_service:
+                raise ValueError("SharePoint service not configured")
+            yield from self.sharepoint_service.iter_file_chunks(document_url, self.DOWNLOAD_CHUNK_SIZE)
+        else:
+            # Handle regular PDF URL
+            with requests.get(document_url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        yield chunk
+
     def extract_text(self, file_path: str) -> str:
         """
         Extract text from a PDF file.
@@ -363,16 +646,7 @@ class DocumentProcessor:
             if not file_path.lower().endswith('.pdf'):
                 raise ValueError("Only PDF files are supported")
                 
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            
-            if not text.strip():
-                raise ValueError("No text could be extracted from the PDF")
-                
-            return text
+            return extract_pdf_text(file_path)
         except Exception as e:
             logger.error(f"Failed to extract text from document: {str(e)}")
             raise
@@ -535,6 +809,44 @@ CRITICAL INSTRUCTIONS:
 """
         return prompt
 
+    def _generate_batch_prompt(self, documents: Dict[str, str], fields: List[Dict]) -> str:
+        """
+        Generate one prompt that extracts the fields from several documents.
+        
+        Args:
+            documents (Dict[str, str]): Document texts keyed by document ID
+            fields (List[Dict]): List of fields to extract from the template
+            
+        Returns:
+            str: Formatted prompt for the LLM
+        """
+        text = "\n\n".join(
+            f"===== DOCUMENT {document_id} =====\n{document_text}\n===== END OF DOCUMENT {document_id} ====="
+            for document_id, document_text in documents.items()
+        )
+        prompt = self._generate_prompt(text, fields)
+        return prompt + f"""
+MULTIPLE DOCUMENTS:
+The text above contains {len(documents)} separate documents, each between "===== DOCUMENT <ID> =====" and "===== END OF DOCUMENT <ID> =====" markers.
+Extract the fields from each document independently; never use information from one document for another.
+Return a single JSON object whose keys are the document IDs ({", ".join(documents)}) and whose values are JSON objects in the format described above.
+"""
+
+    def _parse_batch_response(self, response: str) -> Dict[str, Dict]:
+        """Parse a multi-document Gemini response into per-document dictionaries."""
+        response = response.strip()
+        start_idx = response.find('{')
+        end_idx = response.rfind('}')
+        if start_idx == -1 or end_idx == -1:
+            logger.error(f"No JSON object in batch response: {response[:200]}")
+            return {}
+        try:
+            data = json.loads(response[start_idx:end_idx + 1])
+        except json.JSONDecodeError as e:
+            logger.error(f"Error parsing batch response: {str(e)}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
     def _parse_response(self, response: str) -> dict:
         """Parse the Gemini response into a dictionary."""
         try:
@@ -655,6 +967,43 @@ CRITICAL INSTRUCTIONS:
             logger.error(f"Error finding partial matches: {str(e)}")
             return None
 
+    def get_local_files(self, folder_path: str, recursive: bool = True) -> List[Dict]:
+        """
+        List the PDFs of a local folder as pipeline files.
+        
+        Files are parsed in place, so each entry carries its 'local_path'.
+        Names are relative to `folder_path` so PDFs with the same name in
+        different subfolders stay apart.
+        
+        Args:
+            folder_path (str): The local folder
+            recursive (bool): Include the PDFs of all subfolders
+            
+        Returns:
+            List[Dict]: The PDFs, sorted by relative path
+        """
+        folder_path = os.path.abspath(folder_path)
+        files = []
+        for root, dirs, names in os.walk(folder_path):
+            if not recursive:
+                dirs.clear()
+            for name in names:
+                if not name.lower().endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append({
+                    'id': path,
+                    'url': path,
+                    'local_path': path,
+                    'name': os.path.relpath(path, folder_path),
+                    'size': stat.st_size,
+                    'last_modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+        files.sort(key=lambda file: file['name'])
+        logger.info(f"Found {len(files)} PDF files in local folder {folder_path}")
+        return files
+
     def get_files_to_process(self, url: str) -> list:
         """
         Return a list of files (dicts with 'name' and 'url') to process for a given SharePoint folder URL.
@@ -1,65 +1,56 @@
 import os
-import pandas as pd
-from typing import Dict
+import hashlib
+import json
+from typing import Dict, List, Optional
 import logging
 from datetime import datetime
 import re
 import time
+import threading
+from urllib.parse import unquote
 from services.metadata_storage import MetadataStorage
+from services.excel_uploader import ExcelUploader
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ExcelGenerator:
-    def __init__(self, output_dir: str = "output"):
+    def __init__(self, output_dir: str = "output", sharepoint_service=None):
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
         self.logger = logging.getLogger(__name__)
         self.metadata_storage = MetadataStorage()
         self.template_excel_files = {}  # Store Excel paths for each template
+        self.pending_templates = set()  # Templates with rows not yet written to Excel
+        self.lock = threading.RLock()
+        self.flush_timer = None
+        self.upload_folders = {}  # SharePoint folder each template's workbook is uploaded to
+        self.uploader = self._create_uploader(sharepoint_service)
         self._load_existing_data()
 
+    def _create_uploader(self, sharepoint_service) -> Optional[ExcelUploader]:
+        """Create the workbook uploader, sharing the given SharePoint service if any."""
+        if sharepoint_service is None:
+            try:
+                from services.sharepoint_service import SharePointService
+                sharepoint_service = SharePointService()
+            except ValueError as e:
+                logger.warning(f"Excel files will not be uploaded to SharePoint: {str(e)}")
+                return None
+        return ExcelUploader(sharepoint_service)
+
     def _load_existing_data(self):
-        """Load existing data from both Excel and metadata storage"""
+        """Register the Excel files of templates that already have stored metadata"""
         try:
-            # Initialize lists
-            self.metadata_list = []
-            self.document_urls = []
-            
-            # Load from metadata storage
-            stored_metadata = self.metadata_storage.get_metadata()
-            if stored_metadata:
-                for doc in stored_metadata:
-                    if 'File Name' in doc and 'Template ID' in doc:
-                        template_id = doc['Template ID']
-                        if template_id not in self.template_excel_files:
-                            self.template_excel_files[template_id] = os.path.join(
-                                self.output_dir, 
-                                f"extracted_data_{template_id}.xlsx"
-                            )
-                        self.metadata_list.append(doc)
-                        self.document_urls.append(doc['File Name'])
-                self.logger.info(f"Loaded {len(self.metadata_list)} documents from metadata storage")
-                return
-
-            # Fallback to Excel if no stored metadata
-            for template_id, excel_path in self.template_excel_files.items():
-                if os.path.exists(excel_path):
-                    df = pd.read_excel(excel_path)
-                    if not df.empty:
-                        for _, row in df.iterrows():
-                            doc = row.to_dict()
-                            doc['Template ID'] = template_id
-                            self.metadata_list.append(doc)
-                            self.document_urls.append(doc.get('File Name', ''))
-                        self.logger.info(f"Loaded {len(df)} documents from Excel for template {template_id}")
+            for template_id in self.metadata_storage.get_template_ids():
+                self._get_excel_path(template_id)
+            self.logger.info(f"Found stored metadata for {len(self.template_excel_files)} templates")
         except Exception as e:
             self.logger.error(f"Error loading existing data: {e}")
-            # Initialize empty lists if there's an error
-            self.metadata_list = []
-            self.document_urls = []
 
     def _get_excel_path(self, template_id: str) -> str:
         """Get the Excel file path for a specific template"""
@@ -107,7 +98,20 @@ class ExcelGenerator:
         
         return cleaned.strip()
 
-    def add_metadata(self, metadata: Dict, document_url: str, template_id: str) -> str:
+    def add_metadata(self, metadata: Dict, document_url: str, template_id: str, defer_export: bool = False) -> Dict[str, str]:
+        """
+        Add a document's metadata and export the template's Excel file.
+        
+        Args:
+            metadata (Dict): Extracted metadata
+            document_url (str): URL of the document
+            template_id (str): ID of the template
+            defer_export (bool): Only record the row; the workbook is written
+                by the next `flush` (explicit or timed) instead of right away
+                
+        Returns:
+            Dict[str, str]: Local path and SharePoint URL of the Excel file
+        """
         try:
             # Prefer explicit file name present in metadata; fallback to URL extraction
             if isinstance(metadata, dict) and metadata.get('File Name'):
@@ -124,8 +128,8 @@ class ExcelGenerator:
                     file_name = os.path.basename(document_url)
             
             # Get template fields from template context
-            from context.template_context import TemplateContext
-            template_context = TemplateContext()
+            from context.template_context import get_template_context
+            template_context = get_template_context()
             template = template_context.get_template(template_id)
             if not template:
                 logger.error(f"No template found for template ID: {template_id}")
@@ -138,12 +142,14 @@ class ExcelGenerator:
             
             # Create a new metadata dict with only template fields
             cleaned_metadata = {}
+            extracted_fields = []
             for field in template_fields:
                 field_name = field.get('name')
                 if field_name in metadata:
                     # Clean the value for Excel
                     cleaned_value = self._clean_metadata_value(metadata[field_name])
                     cleaned_metadata[field_name] = cleaned_value
+                    extracted_fields.append(field_name)
                 else:
                     cleaned_metadata[field_name] = "Not found"
             
@@ -151,21 +157,103 @@ class ExcelGenerator:
             cleaned_metadata['File Name'] = file_name
             cleaned_metadata['Template ID'] = template_id
             
-            # Add to metadata storage
-            self.metadata_storage.add_metadata(cleaned_metadata, file_name)
-            
-            # Always append new metadata
-            self.metadata_list.append(cleaned_metadata)
-            self.document_urls.append(file_name)
+            with self.lock:
+                # Add to metadata storage
+                self.metadata_storage.add_metadata(
+                    cleaned_metadata, file_name, fields=extracted_fields, source=metadata.get('source')
+                )
+                self.pending_templates.add(template_id)
+                upload_folder = self._folder_from_url(document_url)
+                if upload_folder:
+                    self.upload_folders[template_id] = upload_folder
             logger.info(f"Added new metadata for file: {file_name}")
 
-            # Generate Excel with all accumulated metadata for this template
-            return self.generate_excel(template_id)
+            if defer_export:
+                return {
+                    'local_path': self._get_excel_path(template_id),
+                    'sharepoint_url': None
+                }
+
+            # Generate Excel with all accumulated metadata for this template;
+            # uploads of consecutive rows are coalesced
+            return self.generate_excel(template_id, debounce_upload=True)
 
         except Exception as e:
             logger.error(f"Error adding metadata: {str(e)}")
             raise
 
+    def merge_metadata(self, metadata: Dict, file_name: str, template_id: str, field_names: List[str]) -> bool:
+        """
+        Fill in fields of a document's stored row, e.g. fields added to the template later.
+        
+        Only the given fields are taken from `metadata`; the rest of the row
+        is kept. The workbook is written by the next `flush`.
+        
+        Args:
+            metadata (Dict): Extracted metadata
+            file_name (str): Key of the document's stored row
+            template_id (str): ID of the template
+            field_names (List[str]): Fields to take from `metadata`
+            
+        Returns:
+            bool: Whether the document has a stored row
+        """
+        values = {
+            field_name: self._clean_metadata_value(metadata[field_name]) if field_name in metadata else "Not found"
+            for field_name in field_names
+        }
+        with self.lock:
+            merged = self.metadata_storage.merge_fields(file_name, template_id, values)
+            if merged:
+                self.pending_templates.add(template_id)
+        return merged
+
+    def flush(self, template_id: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+        """
+        Write the Excel files of templates that have rows added with `defer_export`.
+        
+        Args:
+            template_id (str, optional): Only flush this template
+            
+        Returns:
+            Dict[str, Dict[str, str]]: Excel results keyed by template ID
+        """
+        with self.lock:
+            if template_id is not None:
+                template_ids = [template_id] if template_id in self.pending_templates else []
+            else:
+                template_ids = sorted(self.pending_templates)
+            
+            results = {}
+            for pending_id in template_ids:
+                try:
+                    results[pending_id] = self.generate_excel(pending_id)
+                except Exception as e:
+                    logger.error(f"Error flushing Excel for template {pending_id}: {str(e)}")
+            return results
+
+    def start_auto_flush(self, interval: float) -> None:
+        """
+        Flush pending rows every `interval` seconds in a background thread.
+        
+        Useful for long jobs that add rows with `defer_export` as documents
+        complete, so the workbook is refreshed periodically rather than per row.
+        """
+        def run():
+            self.flush()
+            self.start_auto_flush(interval)
+
+        self.stop_auto_flush()
+        self.flush_timer = threading.Timer(interval, run)
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+    def stop_auto_flush(self) -> None:
+        """Stop the background flush timer."""
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
     def _sanitize_column_name(self, column_name: str) -> str:
         """Sanitize column name to be valid for Excel."""
         try:
@@ -214,8 +302,34 @@ class ExcelGenerator:
             logger.error(f"Error sanitizing column name '{column_name}': {str(e)}")
             return "Column"  # Return a safe default value
 
-    def generate_excel(self, template_id: str) -> Dict[str, str]:
-        """Generate Excel file with all metadata for a specific template."""
+    def _folder_from_url(self, url: Optional[str]) -> Optional[str]:
+        """Extract the drive folder path from a Graph folder URL, if it is one."""
+        if not isinstance(url, str) or '/drive/root:/' not in url:
+            return None
+        folder_path = url.split('/drive/root:/')[1].split(':/')[0].rstrip('/')
+        return unquote(folder_path) or None
+
+    def _find_upload_folder(self, template_id: str, template_metadata) -> Optional[str]:
+        """SharePoint folder of a template's documents, where its workbook is uploaded."""
+        folder_path = self.upload_folders.get(template_id)
+        if folder_path:
+            return folder_path
+        for doc in template_metadata:
+            for value in doc.values():
+                folder_path = self._folder_from_url(value)
+                if folder_path:
+                    return folder_path
+        return None
+
+    def generate_excel(self, template_id: str, debounce_upload: bool = False) -> Dict[str, str]:
+        """
+        Generate Excel file with all metadata for a specific template.
+        
+        Args:
+            template_id (str): ID of the template
+            debounce_upload (bool): Coalesce the SharePoint upload with other
+                recent uploads of this workbook instead of uploading now
+        """
         try:
             # Create output directory if it doesn't exist
             os.makedirs(self.output_dir, exist_ok=True)
@@ -224,8 +338,8 @@ class ExcelGenerator:
             excel_path = self._get_excel_path(template_id)
             
             # Get template fields from template context
-            from context.template_context import TemplateContext
-            template_context = TemplateContext()
+            from context.template_context import get_template_context
+            template_context = get_template_context()
             template = template_context.get_template(template_id)
             if not template:
                 logger.error(f"No template found for template ID: {template_id}")
@@ -236,117 +350,66 @@ class ExcelGenerator:
                 logger.error(f"No template fields found for template ID: {template_id}")
                 raise ValueError(f"No template fields found for template ID: {template_id}")
             
-            # Filter metadata for this template
-            template_metadata = [doc for doc in self.metadata_list if doc.get('Template ID') == template_id]
-            
-            # Create DataFrame with only template fields
-            df_data = []
+            with self.lock:
+                # Indexed lookup of this template's metadata
+                template_metadata = self.metadata_storage.get_metadata_by_template(template_id)
+                self.pending_templates.discard(template_id)
+            
+            # Column order: template fields followed by the required fields
+            columns = [field.get('name') for field in template_fields] + ['File Name', 'Template ID']
+            
+            # Write the workbook in a single streaming pass. Write-only mode
+            # keeps memory constant; widths are set once per column and every
+            # cell shares one style instead of being restyled after writing.
+            workbook = openpyxl.Workbook(write_only=True)
+            worksheet = workbook.create_sheet('Metadata')
+            for idx in range(len(columns)):
+                worksheet.column_dimensions[get_column_letter(idx + 1)].width = 30
+            
+            header_fill = openpyxl.styles.PatternFill(start_color='4F81BD', end_color='4F81BD', fill_type='solid')
+            header_font = openpyxl.styles.Font(color='FFFFFF', bold=True)
+            header_alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='center')
+            cell_alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='top')
+            
+            header = []
+            for column in columns:
+                cell = WriteOnlyCell(worksheet, value=self._sanitize_column_name(column))
+                cell.fill = header_fill
+                cell.font = header_font
+                cell.alignment = header_alignment
+                header.append(cell)
+            worksheet.append(header)
+            
+            # Fingerprint of the written data, used to skip unchanged uploads
+            digest = hashlib.sha256(json.dumps(columns).encode())
             for doc in template_metadata:
-                row = {}
-                for field in template_fields:
-                    field_name = field.get('name')
-                    row[field_name] = doc.get(field_name, "Not found")
-                # Add required fields
-                row['File Name'] = doc.get('File Name', '')
-                row['Template ID'] = doc.get('Template ID', '')
-                df_data.append(row)
-            
-            # Create DataFrame
-            df = pd.DataFrame(df_data)
-            
-            # Sanitize column names
-            df.columns = [self._sanitize_column_name(col) for col in df.columns]
-            
-            # Create Excel writer
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                # Write DataFrame to Excel
-                df.to_excel(writer, sheet_name='Metadata', index=False)
-                
-                # Get workbook and worksheet
-                workbook = writer.book
-                worksheet = writer.sheets['Metadata']
-                
-                # Set column widths and enable text wrapping
-                for idx, col in enumerate(df.columns):
-                    # Set column width
-                    worksheet.column_dimensions[chr(65 + idx)].width = 30
-                    
-                    # Enable text wrapping for all cells in this column
-                    for row in range(2, len(df) + 2):  # Start from row 2 (after header)
-                        cell = worksheet.cell(row=row, column=idx + 1)
-                        cell.alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='top')
-                
-                # Format header
-                header_fill = openpyxl.styles.PatternFill(start_color='4F81BD', end_color='4F81BD', fill_type='solid')
-                header_font = openpyxl.styles.Font(color='FFFFFF', bold=True)
-                
-                for cell in worksheet[1]:
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = openpyxl.styles.Alignment(wrap_text=True, vertical='center')
+                row = []
+                values = [doc.get(column, '' if column in ('File Name', 'Template ID') else "Not found") for column in columns]
+                for value in values:
+                    cell = WriteOnlyCell(worksheet, value=value)
+                    cell.alignment = cell_alignment
+                    row.append(cell)
+                worksheet.append(row)
+                digest.update(json.dumps(values, default=str).encode())
+            
+            # Write to a temporary file first so a concurrent upload never reads a partial workbook
+            temp_path = f"{excel_path}.tmp"
+            workbook.save(temp_path)
+            os.replace(temp_path, excel_path)
             
             logger.info(f"Excel file generated successfully: {excel_path}")
             
             # Upload Excel file to SharePoint and get URL
             sharepoint_url = None
             try:
-                from services.sharepoint_service import SharePointService
-                sharepoint_service = SharePointService()
-                
-                # Get the folder path from the first document's URL
-                doc_url = None
-                if template_metadata and 'Document URL' in template_metadata[0]:
-                    doc_url = template_metadata[0]['Document URL']
-                elif template_metadata and 'webUrl' in template_metadata[0]:
-                    doc_url = template_metadata[0]['webUrl']
-                else:
-                    for doc in template_metadata:
-                        for key in doc:
-                            if isinstance(doc[key], str) and 'graph.microsoft.com' in doc[key]:
-                                doc_url = doc[key]
-                                break
-                        if doc_url:
-                            break
-                if doc_url:
-                    logger.info(f"Processing document URL: {doc_url}")
-                    if 'graph.microsoft.com' in doc_url:
-                        if '/drive/root:/' in doc_url:
-                            try:
-                                full_path = doc_url.split('/drive/root:/')[1]
-                                folder_path = full_path.split(':/')[0]
-                                folder_path = folder_path.rstrip('/')
-                                if '%20' in folder_path:
-                                    folder_path = folder_path.replace('%20', ' ')
-                                if not folder_path:
-                                    raise ValueError("Empty folder path extracted from URL")
-                                logger.info(f"Final SharePoint folder path: {folder_path}")
-                                with open(excel_path, 'rb') as file:
-                                    file_content = file.read()
-                                    file_name = os.path.basename(excel_path)
-                                    if not file_content:
-                                        logger.error("Excel file content is empty")
-                                    else:
-                                        logger.info(f"File size: {len(file_content)} bytes")
-                                        logger.info(f"Attempting to upload Excel file to SharePoint folder: {folder_path}")
-                                        try:
-                                            sharepoint_url = sharepoint_service.upload_file(file_content, file_name, folder_path)
-                                            if sharepoint_url:
-                                                logger.info(f"Excel file uploaded successfully to SharePoint: {sharepoint_url}")
-                                            else:
-                                                logger.error("Failed to get SharePoint URL after upload")
-                                        except Exception as upload_error:
-                                            logger.error(f"Error during SharePoint upload: {str(upload_error)}")
-                                            logger.error(f"Upload URL: {doc_url}")
-                                            logger.error(f"Target folder: {folder_path}")
-                                            logger.error(f"File name: {file_name}")
-                                            logger.error(f"File size: {len(file_content)} bytes")
-                            except Exception as path_error:
-                                logger.error(f"Error extracting folder path from URL: {str(path_error)}")
-                                logger.error(f"Original URL: {doc_url}")
+                folder_path = self._find_upload_folder(template_id, template_metadata)
+                if not folder_path:
+                    logger.error("No SharePoint folder found for the template's documents")
+                elif self.uploader:
+                    if debounce_upload:
+                        sharepoint_url = self.uploader.schedule(excel_path, folder_path, digest.hexdigest())
                     else:
-                        logger.error("Invalid URL format - not a Graph API URL")
-                else:
-                    logger.error("No document URL found in template metadata")
+                        sharepoint_url = self.uploader.upload(excel_path, folder_path, digest.hexdigest())
             except Exception as e:
                 logger.error(f"Error uploading Excel to SharePoint: {str(e)}")
                 # Continue even if upload fails
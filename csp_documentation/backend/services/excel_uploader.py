@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ExcelUploader:
+    """
+    Uploads generated workbooks to SharePoint.
+
+    Uploads of the same workbook are coalesced: `schedule` uploads at most
+    once per EXCEL_UPLOAD_INTERVAL seconds and sends the latest content when
+    the interval has passed, while `upload` sends the final workbook right
+    away. Content identical to the last upload is not sent again; callers
+    can pass a fingerprint of the workbook data, since the bytes of a
+    regenerated workbook differ by its timestamps alone. Files
+    above EXCEL_UPLOAD_SESSION_THRESHOLD_MB go through a resumable upload
+    session in EXCEL_UPLOAD_CHUNK_MB chunks.
+    """
+
+    def __init__(self, sharepoint_service, min_interval: Optional[float] = None):
+        self.sharepoint_service = sharepoint_service
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv('EXCEL_UPLOAD_INTERVAL', '30'))
+        self.session_threshold = int(float(os.getenv('EXCEL_UPLOAD_SESSION_THRESHOLD_MB', '4')) * 1024 * 1024)
+        self.chunk_size = int(float(os.getenv('EXCEL_UPLOAD_CHUNK_MB', '5')) * 1024 * 1024)
+
+        # Last upload of each destination: content hash, SharePoint URL and time
+        self.uploads: Dict[Tuple[str, str], Dict] = {}
+        self.timers: Dict[Tuple[str, str], threading.Timer] = {}
+        self.pending_hashes: Dict[Tuple[str, str], Optional[str]] = {}
+        self.lock = threading.Lock()
+        self.upload_lock = threading.Lock()
+
+    def upload(self, excel_path: str, folder_path: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """
+        Upload a workbook now, unless its content is already on SharePoint.
+
+        Args:
+            excel_path (str): Path of the workbook
+            folder_path (str): SharePoint folder to upload to
+            content_hash (str, optional): Fingerprint of the workbook data;
+                defaults to the SHA-256 of the file
+
+        Returns:
+            Optional[str]: SharePoint URL of the workbook
+        """
+        key = (folder_path, os.path.basename(excel_path))
+        with self.lock:
+            timer = self.timers.pop(key, None)
+            self.pending_hashes.pop(key, None)
+        if timer:
+            timer.cancel()
+        return self._upload(excel_path, folder_path, content_hash)
+
+    def schedule(self, excel_path: str, folder_path: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """
+        Upload a workbook at most once per interval.
+
+        The first call uploads right away; calls within the interval after
+        an upload arm a single timer that uploads the latest content when
+        the interval ends.
+
+        Returns:
+            Optional[str]: SharePoint URL of the last upload, if any
+        """
+        key = (folder_path, os.path.basename(excel_path))
+        with self.lock:
+            last = self.uploads.get(key)
+            if key in self.timers:
+                self.pending_hashes[key] = content_hash
+                return last['url'] if last else None
+            wait = (last['time'] + self.min_interval - time.monotonic()) if last else 0
+            if wait > 0:
+                timer = threading.Timer(wait, self._run_scheduled, args=(key, excel_path, folder_path))
+                timer.daemon = True
+                self.timers[key] = timer
+                self.pending_hashes[key] = content_hash
+                timer.start()
+                return last['url']
+        return self._upload(excel_path, folder_path, content_hash)
+
+    def _run_scheduled(self, key: Tuple[str, str], excel_path: str, folder_path: str) -> None:
+        with self.lock:
+            self.timers.pop(key, None)
+            content_hash = self.pending_hashes.pop(key, None)
+        try:
+            self._upload(excel_path, folder_path, content_hash)
+        except Exception as e:
+            logger.error(f"Error uploading {excel_path} to SharePoint: {str(e)}")
+
+    def _upload(self, excel_path: str, folder_path: str, content_hash: Optional[str] = None) -> Optional[str]:
+        file_name = os.path.basename(excel_path)
+        key = (folder_path, file_name)
+        with self.upload_lock:
+            with open(excel_path, 'rb') as f:
+                file_content = f.read()
+            if not file_content:
+                logger.error("Excel file content is empty")
+                return None
+
+            content_hash = content_hash or hashlib.sha256(file_content).hexdigest()
+            last = self.uploads.get(key)
+            if last and last['hash'] == content_hash:
+                logger.info(f"{file_name} unchanged since the last upload, skipping")
+                return last['url']
+
+            if len(file_content) > self.session_threshold:
+                url = self.sharepoint_service.upload_large_file(file_content, file_name, folder_path, self.chunk_size)
+            else:
+                url = self.sharepoint_service.upload_file(file_content, file_name, folder_path)
+
+            with self.lock:
+                self.uploads[key] = {'hash': content_hash, 'url': url, 'time': time.monotonic()}
+            return url
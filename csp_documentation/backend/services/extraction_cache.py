@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from services.sqlite_store import SQLiteStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ExtractionCache(SQLiteStore):
+    """
+    On-disk cache of extraction results.
+
+    Entries are keyed by the document version - its content hash, or its
+    Graph eTag/last modified time - plus a hash of the template fields, so a
+    result is only reused when neither the file nor the template changed.
+    The total size is bounded; the least recently used entries are evicted
+    first. The size is tracked as a running total so writes do not scan the
+    table; it is recounted when eviction runs and every
+    EVICTION_CHECK_INTERVAL writes, to pick up entries written by other
+    processes. Eviction frees space down to EVICTION_TARGET of the budget,
+    so a full cache does not evict on every write. Reads and writes may
+    come from several threads at once.
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+    EVICTION_TARGET = 0.9
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size_bytes: Optional[int] = None,
+                 name: str = 'extraction cache'):
+        self.name = name
+        self.cache_dir = cache_dir or os.getenv('EXTRACTION_CACHE_DIR', 'extraction_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        super().__init__(os.path.join(self.cache_dir, 'cache.db'))
+        self.max_size_bytes = max_size_bytes or int(os.getenv('EXTRACTION_CACHE_MAX_MB', '512')) * 1024 * 1024
+        self._initialize()
+        self.lock = threading.Lock()
+        self.total_size = self._count_size()
+        self.puts_since_check = 0
+
+    def _initialize(self) -> None:
+        """Create the cache table if it does not exist yet."""
+        try:
+            with self._connection() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_access REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access);
+                """)
+        except Exception as e:
+            logger.error(f"Error initializing {self.name}: {str(e)}")
+            raise
+
+    @staticmethod
+    def template_version(fields: List[Dict]) -> str:
+        """Hash of the template fields; changes whenever a field is added, removed or reworded."""
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """SHA-256 of a file's content."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def content_key(content_hash: str, template_version: str) -> str:
+        return f"content:{content_hash}:{template_version}"
+
+    @staticmethod
+    def version_key(file: Dict, template_version: str) -> Optional[str]:
+        """
+        Key derived from the listing data of a file, available before download.
+
+        Returns None when the file has neither an eTag nor a last modified time.
+        """
+        version = file.get('etag') or file.get('last_modified')
+        if not version:
+            return None
+        return f"version:{file.get('id') or file.get('url')}:{version}:{template_version}"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a cached result and mark it as recently used."""
+        try:
+            with self._connection() as conn:
+                row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if not row:
+                    return None
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row['value'])
+        except Exception as e:
+            logger.warning(f"Error reading {self.name}: {str(e)}")
+            return None
+
+    def contains(self, key: str) -> bool:
+        """Whether a key is cached, without marking it as used."""
+        try:
+            with self._connection() as conn:
+                return conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+        except Exception as e:
+            logger.warning(f"Error reading {self.name}: {str(e)}")
+            return False
+
+    def put(self, keys: List[str], value: Dict) -> None:
+        """Store a result under one or more keys, then evict old entries if over budget."""
+        try:
+            data = json.dumps(value)
+            now = time.time()
+            rows = [(key, data, len(data), now) for key in keys if key]
+            with self._connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)", rows
+                )
+            with self.lock:
+                self.total_size += len(data) * len(rows)
+                self.puts_since_check += 1
+                if self.puts_since_check >= self.EVICTION_CHECK_INTERVAL:
+                    self.total_size = self._count_size()
+                    self.puts_since_check = 0
+                if self.total_size > self.max_size_bytes:
+                    self._evict()
+        except Exception as e:
+            logger.warning(f"Error writing {self.name}: {str(e)}")
+
+    def _count_size(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits its size budget. Needs `lock`."""
+        target = self.max_size_bytes * self.EVICTION_TARGET
+        evicted = []
+        with self._connection() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_size_bytes:
+                for row in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                    if total <= target:
+                        break
+                    evicted.append((row['key'],))
+                    total -= row['size']
+                conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.total_size = total
+        self.puts_since_check = 0
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} entries from {self.name}")
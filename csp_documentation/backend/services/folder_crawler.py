@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FolderCrawler:
+    """
+    Breadth-first crawler over a SharePoint folder tree.
+
+    Folders waiting to be listed are taken up to GRAPH_BATCH_SIZE at a time
+    and listed with one batched Graph request. At most `concurrency` such
+    requests are in flight. PDFs are yielded as soon as their folder has been
+    listed, so processing can start while deeper levels are still being
+    crawled. A folder that cannot be listed is tried again up to
+    CRAWL_MAX_RETRIES times, waiting CRAWL_RETRY_DELAY seconds, doubled on
+    every attempt; after that it is reported through the `on_error`
+    callback and recorded in `failed_folders`, so a crawl that missed part
+    of the tree never looks complete.
+    """
+
+    def __init__(self, sharepoint_service, concurrency: Optional[int] = None):
+        self.sharepoint_service = sharepoint_service
+        self.concurrency = concurrency or int(os.getenv('CRAWL_CONCURRENCY', '4'))
+        self.batch_size = max(1, min(20, int(os.getenv('GRAPH_BATCH_SIZE', '20'))))
+        self.max_retries = int(os.getenv('CRAWL_MAX_RETRIES', '2'))
+        self.retry_delay = float(os.getenv('CRAWL_RETRY_DELAY', '1'))
+        self.folders_listed = 0
+        self.files_found = 0
+        self.failed_folders: List[Dict] = []
+
+    async def crawl(self, folder_path: str,
+                    on_error: Optional[Callable[[str, str], None]] = None) -> AsyncIterator[Dict]:
+        """
+        Yield every PDF below a folder, including its subfolders.
+
+        Each file dict carries a 'folder' key with its folder path. Files in
+        subfolders are named by their path relative to `folder_path` (e.g.
+        'Sub/report.pdf'), so equally named files in different subfolders
+        stay distinct, like the files of a local folder import.
+
+        Args:
+            folder_path (str): Path of the root folder in the drive
+            on_error (Callable, optional): Called with the path of each folder
+                that could not be listed and the error
+        """
+        root_id = await asyncio.to_thread(self.sharepoint_service.get_folder_id, folder_path)
+
+        folders = asyncio.Queue()
+        files = asyncio.Queue(maxsize=1000)
+        await folders.put((root_id, (folder_path, '', 0)))
+
+        async def worker():
+            while True:
+                batch = [await folders.get()]
+                while len(batch) < self.batch_size and not folders.empty():
+                    batch.append(folders.get_nowait())
+                try:
+                    paths = dict(batch)
+                    try:
+                        contents = await asyncio.to_thread(self.sharepoint_service.get_folder_contents, list(paths))
+                        error = "the listing request failed"
+                    except Exception as e:
+                        logger.error(f"Error listing {len(batch)} folders: {str(e)}")
+                        contents, error = {}, str(e)
+
+                    retry = []
+                    for folder_id, (path, relative_path, attempts) in paths.items():
+                        content = contents.get(folder_id)
+                        if content is None:
+                            if attempts < self.max_retries:
+                                retry.append((folder_id, (path, relative_path, attempts + 1)))
+                            else:
+                                logger.error(f"Giving up on listing folder '{path}': {error}")
+                                self.failed_folders.append({'folder': path, 'error': error})
+                                if on_error:
+                                    on_error(path, error)
+                            continue
+                        for subfolder in content['subfolders']:
+                            await folders.put((subfolder['id'], (
+                                f"{path}/{subfolder['name']}",
+                                f"{relative_path}/{subfolder['name']}" if relative_path else subfolder['name'],
+                                0
+                            )))
+                        for file in content['files']:
+                            name = f"{relative_path}/{file['name']}" if relative_path else file['name']
+                            await files.put({**file, 'name': name, 'folder': path})
+                        self.folders_listed += 1
+
+                    if retry:
+                        attempt = max(attempts for _, (_, _, attempts) in retry)
+                        delay = min(self.retry_delay * 2 ** (attempt - 1), 30)
+                        logger.warning(f"Listing {len(retry)} folders again in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        for entry in retry:
+                            await folders.put(entry)
+                finally:
+                    for _ in batch:
+                        folders.task_done()
+
+        async def run():
+            workers = [asyncio.create_task(worker()) for _ in range(max(1, self.concurrency))]
+            try:
+                await folders.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            await files.put(None)
+
+        crawl_task = asyncio.create_task(run())
+        try:
+            while True:
+                file = await files.get()
+                if file is None:
+                    break
+                self.files_found += 1
+                yield file
+            await crawl_task
+            logger.info(f"Crawled {self.folders_listed} folders below '{folder_path}', found {self.files_found} PDFs")
+            if self.failed_folders:
+                logger.warning(f"{len(self.failed_folders)} folders below '{folder_path}' could not be listed")
+        finally:
+            if not crawl_task.done():
+                crawl_task.cancel()
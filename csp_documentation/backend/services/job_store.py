@@ -0,0 +1,381 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from services.sqlite_store import SQLiteStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class JobStore(SQLiteStore):
+    """
+    SQLite-backed store for document processing jobs.
+
+    Every uvicorn worker opens its own connections to the same database file,
+    so job state and results written by one worker are visible to all others.
+    The files of a job and the outcome of each document are stored as they
+    become known, so an interrupted job can be resumed where it stopped.
+    Progress events of every document are appended to an event log that
+    clients can follow while the job runs; the logs of jobs that finished
+    more than JOB_EVENTS_RETENTION_SECONDS ago are pruned.
+    A running job refreshes its heartbeat every JOB_HEARTBEAT_SECONDS; a
+    queued or running job whose heartbeat is older than JOB_STALE_SECONDS
+    was interrupted (process IDs are reused after a restart, so they cannot
+    tell). It also provides a simple lease lock for work that must not run
+    in two processes at once.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        super().__init__(db_path or os.getenv('JOB_STORE_PATH', 'jobs.db'))
+        self.HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '10'))
+        self.STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '60'))
+        self.PROGRESS_FLUSH_SECONDS = float(os.getenv('JOB_PROGRESS_FLUSH_SECONDS', '0.5'))
+        self.EVENTS_RETENTION_SECONDS = float(os.getenv('JOB_EVENTS_RETENTION_SECONDS', '86400'))
+        self._initialize()
+
+    def _initialize(self) -> None:
+        """Create the tables if they do not exist yet."""
+        try:
+            with self._connection() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        document_url TEXT NOT NULL,
+                        template_id TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        total_documents INTEGER NOT NULL DEFAULT 0,
+                        completed_documents INTEGER NOT NULL DEFAULT 0,
+                        failed_documents INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        worker_pid INTEGER,
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS job_results (
+                        job_id TEXT NOT NULL,
+                        file_name TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        metadata TEXT,
+                        error TEXT,
+                        created_at TEXT NOT NULL,
+                        PRIMARY KEY (job_id, file_name)
+                    );
+                    CREATE TABLE IF NOT EXISTS job_files (
+                        job_id TEXT NOT NULL,
+                        file_name TEXT NOT NULL,
+                        file TEXT NOT NULL,
+                        PRIMARY KEY (job_id, file_name)
+                    );
+                    CREATE INDEX IF NOT EXISTS job_files_file_name ON job_files (file_name);
+                    CREATE TABLE IF NOT EXISTS job_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_id TEXT NOT NULL,
+                        file_name TEXT,
+                        event TEXT NOT NULL,
+                        data TEXT,
+                        created_at TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS job_events_job_id ON job_events (job_id, id);
+                    CREATE TABLE IF NOT EXISTS locks (
+                        name TEXT PRIMARY KEY,
+                        owner TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    );
+                """)
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if 'recursive' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN recursive INTEGER NOT NULL DEFAULT 0")
+                if 'kind' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'process'")
+                if 'heartbeat_at' not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        except Exception as e:
+            logger.error(f"Error initializing job store: {str(e)}")
+            raise
+
+    def create_job(self, document_url: str, template_id: str, total_documents: int = 0,
+                   recursive: bool = False, kind: str = 'process') -> str:
+        """
+        Register a new job.
+
+        Args:
+            document_url (str): URL of the document or folder being processed
+            template_id (str): ID of the template used for processing
+            total_documents (int): Number of documents in the job
+            recursive (bool): Whether the job crawls the folder's subfolders
+            kind (str): 'process' for extraction jobs, 'backfill' for jobs that
+                fill in missing fields of stored metadata
+
+        Returns:
+            str: The new job ID
+        """
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, document_url, template_id, status, total_documents, "
+                "worker_pid, created_at, updated_at, recursive, kind, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, document_url, template_id, 'queued', total_documents, os.getpid(), now, now,
+                 int(recursive), kind, time.time())
+            )
+        logger.info(f"Created job {job_id} for {total_documents} document(s)")
+        return job_id
+
+    def update_job(self, job_id: str, **fields) -> None:
+        """Update columns of a job, e.g. status or document counts."""
+        allowed = {'status', 'total_documents', 'completed_documents', 'failed_documents', 'error'}
+        updates = {key: value for key, value in fields.items() if key in allowed}
+        if not updates:
+            return
+        updates['updated_at'] = datetime.now().isoformat()
+        updates['worker_pid'] = os.getpid()
+        updates['heartbeat_at'] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in updates)
+        with self._connection() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*updates.values(), job_id))
+
+    def add_results(self, job_id: str, results: List[Dict]) -> None:
+        """
+        Store per-document outcomes for a job and update its document counts.
+
+        A later outcome for the same file replaces the earlier one, e.g. when
+        a resumed job retries a failed document; the counts are adjusted for
+        the outcome it replaces instead of being recounted.
+
+        Args:
+            job_id (str): The job ID
+            results (List[Dict]): Items with 'file_name', 'status' and either
+                'metadata' or 'error'
+        """
+        if not results:
+            return
+        now = datetime.now().isoformat()
+        file_names = list({result['file_name'] for result in results})
+        with self._connection() as conn:
+            previous = {}
+            for start in range(0, len(file_names), 500):
+                chunk = file_names[start:start + 500]
+                rows = conn.execute(
+                    "SELECT file_name, status FROM job_results WHERE job_id = ? "
+                    f"AND file_name IN ({', '.join('?' * len(chunk))})",
+                    [job_id] + chunk
+                )
+                previous.update((row['file_name'], row['status']) for row in rows)
+
+            counts = {'done': 0, 'failed': 0}
+            for result in results:
+                replaced = previous.get(result['file_name'])
+                if replaced in counts:
+                    counts[replaced] -= 1
+                if result['status'] in counts:
+                    counts[result['status']] += 1
+                previous[result['file_name']] = result['status']
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, file_name, status, metadata, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        job_id,
+                        result['file_name'],
+                        result['status'],
+                        json.dumps(result['metadata']) if result.get('metadata') is not None else None,
+                        result.get('error'),
+                        now
+                    )
+                    for result in results
+                ]
+            )
+            conn.execute(
+                "UPDATE jobs SET completed_documents = completed_documents + ?, "
+                "failed_documents = failed_documents + ?, updated_at = ? WHERE id = ?",
+                (counts['done'], counts['failed'], now, job_id)
+            )
+
+    def add_files(self, job_id: str, files: List[Dict]) -> None:
+        """Record files that belong to a job; files already recorded are ignored."""
+        if not files:
+            return
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_files (job_id, file_name, file) VALUES (?, ?, ?)",
+                [(job_id, file['name'], json.dumps(file)) for file in files]
+            )
+
+    def get_files(self, job_id: str) -> List[Dict]:
+        """Get the recorded files of a job, in the order they were added."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT file FROM job_files WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall()
+        return [json.loads(row['file']) for row in rows]
+
+    def find_file(self, file_name: str) -> Optional[Dict]:
+        """Get the most recently recorded file with the given name from any job."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT file FROM job_files WHERE file_name = ? ORDER BY rowid DESC LIMIT 1", (file_name,)
+            ).fetchone()
+        return json.loads(row['file']) if row else None
+
+    def add_event(self, job_id: str, event: str, file_name: Optional[str] = None,
+                  data: Optional[Dict] = None) -> None:
+        """
+        Append a progress event to a job's event log.
+
+        Args:
+            job_id (str): The job ID
+            event (str): Event name, e.g. 'downloading' or 'done'
+            file_name (str, optional): Document the event is about
+            data (Dict, optional): Event details such as timings and token counts
+        """
+        self.add_events(job_id, [(event, file_name, data)])
+
+    def add_events(self, job_id: str, events: List[Tuple[str, Optional[str], Optional[Dict]]]) -> None:
+        """
+        Append several progress events to a job's event log in one transaction.
+
+        Args:
+            job_id (str): The job ID
+            events (List[Tuple]): Event name, file name and data of each event, oldest first
+        """
+        if not events:
+            return
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO job_events (job_id, file_name, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, file_name, event, json.dumps(data or {}), now) for event, file_name, data in events]
+            )
+
+    def prune_events(self, max_age_seconds: Optional[float] = None) -> int:
+        """
+        Delete the event logs of jobs that finished some time ago.
+
+        Args:
+            max_age_seconds (float, optional): How long after a job finished its
+                events are kept; defaults to JOB_EVENTS_RETENTION_SECONDS
+
+        Returns:
+            int: Number of events deleted
+        """
+        if max_age_seconds is None:
+            max_age_seconds = self.EVENTS_RETENTION_SECONDS
+        cutoff = datetime.fromtimestamp(time.time() - max_age_seconds).isoformat()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM job_events WHERE job_id IN ("
+                "SELECT id FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?)",
+                (cutoff,)
+            )
+        if cursor.rowcount:
+            logger.info(f"Pruned {cursor.rowcount} events of finished jobs")
+        return cursor.rowcount
+
+    def get_events(self, job_id: str, after_id: int = 0, limit: int = 500) -> List[Dict]:
+        """Get the events of a job with an ID greater than `after_id`, oldest first."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, file_name, event, data, created_at FROM job_events "
+                "WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (job_id, after_id, limit)
+            ).fetchall()
+        return [
+            {
+                'id': row['id'],
+                'file_name': row['file_name'],
+                'event': row['event'],
+                'data': json.loads(row['data']) if row['data'] else {},
+                'created_at': row['created_at']
+            }
+            for row in rows
+        ]
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job by its ID."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_results(self, job_id: str) -> List[Dict]:
+        """Get the stored per-document outcomes of a job."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT file_name, status, metadata, error FROM job_results WHERE job_id = ? ORDER BY created_at",
+                (job_id,)
+            ).fetchall()
+        return [
+            {
+                'file_name': row['file_name'],
+                'status': row['status'],
+                'metadata': json.loads(row['metadata']) if row['metadata'] else None,
+                'error': row['error']
+            }
+            for row in rows
+        ]
+
+    def heartbeat(self, job_id: str) -> None:
+        """Record that a job is still being processed."""
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def is_running(self, job: Dict) -> bool:
+        """
+        Whether a job is queued or being processed.
+
+        A queued or running job whose heartbeat stopped more than
+        JOB_STALE_SECONDS ago was interrupted and can be resumed.
+        """
+        if job.get('status') not in ('queued', 'running'):
+            return False
+        return time.time() - (job.get('heartbeat_at') or 0) < self.STALE_SECONDS
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        """Get the most recent jobs."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = 300, lease: float = 600):
+        """
+        Hold a named lock shared by all worker processes.
+
+        The lock is a row in the locks table with an expiry time, so a lock
+        left behind by a crashed worker is released once its lease runs out.
+
+        Args:
+            name (str): Name of the lock
+            timeout (float): Seconds to wait for the lock
+            lease (float): Seconds after which a held lock is considered stale
+        """
+        owner = f"{os.getpid()}-{uuid.uuid4()}"
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            with self._connection() as conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+                acquired = conn.execute(
+                    "INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, owner, now + lease)
+                ).rowcount == 1
+            if acquired:
+                break
+            if now > deadline:
+                raise TimeoutError(f"Timed out waiting for lock '{name}'")
+            time.sleep(0.1)
+
+        try:
+            yield
+        finally:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
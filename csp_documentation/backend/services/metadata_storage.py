@@ -1,63 +1,275 @@
 import json
 import os
 import logging
+from datetime import datetime
 from typing import Dict, List, Optional
+from services.sqlite_store import SQLiteStore
 
 logger = logging.getLogger(__name__)
 
-class MetadataStorage:
-    def __init__(self, storage_file: str = "metadata_storage.json"):
+# Keys of a stored record that are not template fields
+RECORD_KEYS = ('File Name', 'Template ID')
+
+class MetadataStorage(SQLiteStore):
+    """
+    SQLite-backed storage of extracted document metadata.
+
+    Rows are keyed by document URL and template ID, so one document can be
+    catalogued under several templates, and every write is a single-row
+    transaction, so adding or deleting a document no longer rewrites the
+    whole store. Existing metadata_storage.json contents
+    are migrated on first start.
+
+    Each row also records which template fields it was extracted for and the
+    source file it came from (its URL or local path and content hash), so
+    fields added to a template later can be filled in for stored documents
+    without extracting everything again.
+    """
+
+    def __init__(self, storage_file: str = "metadata_storage.json", db_path: Optional[str] = None):
         self.storage_file = storage_file
-        self.metadata = {}
-        self._load_metadata()
+        super().__init__(db_path or os.getenv('METADATA_DB_PATH', 'metadata_storage.db'))
+        self._initialize()
+        self._migrate_json()
 
-    def _load_metadata(self) -> None:
-        """Load metadata from the storage file."""
+    def _initialize(self) -> None:
+        """Create the tables if they do not exist yet."""
         try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, 'r') as f:
-                    self.metadata = json.load(f)
-                logger.info(f"Loaded metadata from {self.storage_file}")
-            else:
-                self.metadata = {}
-                logger.info("No existing metadata file found, starting with empty storage")
+            with self._connection() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS metadata (
+                        document_url TEXT NOT NULL,
+                        template_id TEXT NOT NULL DEFAULT '',
+                        data TEXT NOT NULL,
+                        updated_at TEXT NOT NULL,
+                        fields TEXT,
+                        source TEXT,
+                        PRIMARY KEY (document_url, template_id)
+                    );
+                    CREATE TABLE IF NOT EXISTS migrations (
+                        name TEXT PRIMARY KEY,
+                        applied_at TEXT NOT NULL
+                    );
+                """)
+                key_columns = [row['name'] for row in conn.execute("PRAGMA table_info(metadata)") if row['pk']]
+                if key_columns == ['document_url']:
+                    self._migrate_template_key(conn)
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(metadata)")}
+                for column in ('fields', 'source'):
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE metadata ADD COLUMN {column} TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_template_id ON metadata (template_id)")
         except Exception as e:
-            logger.error(f"Error loading metadata: {str(e)}")
-            self.metadata = {}
+            logger.error(f"Error initializing metadata storage: {str(e)}")
+            raise
+
+    def _migrate_template_key(self, conn) -> None:
+        """Re-key a store created before documents could have several templates."""
+        conn.executescript("""
+            CREATE TABLE metadata_by_template (
+                document_url TEXT NOT NULL,
+                template_id TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (document_url, template_id)
+            );
+            INSERT INTO metadata_by_template (document_url, template_id, data, updated_at)
+                SELECT document_url, COALESCE(template_id, ''), data, updated_at FROM metadata ORDER BY rowid;
+            DROP TABLE metadata;
+            ALTER TABLE metadata_by_template RENAME TO metadata;
+        """)
+        logger.info("Migrated metadata storage to one row per document and template")
 
-    def _save_metadata(self) -> None:
-        """Save metadata to the storage file."""
+    def _migrate_json(self) -> None:
+        """Import metadata from the legacy JSON storage file, once."""
         try:
-            with open(self.storage_file, 'w') as f:
-                json.dump(self.metadata, f, indent=2)
-            logger.info(f"Saved metadata to {self.storage_file}")
+            with self._connection() as conn:
+                if conn.execute("SELECT 1 FROM migrations WHERE name = 'json'").fetchone():
+                    return
+
+                metadata = {}
+                if os.path.exists(self.storage_file) and os.path.getsize(self.storage_file) > 0:
+                    with open(self.storage_file, 'r') as f:
+                        metadata = json.load(f)
+
+                now = datetime.now().isoformat()
+                conn.executemany(
+                    "INSERT OR IGNORE INTO metadata (document_url, template_id, data, updated_at) VALUES (?, ?, ?, ?)",
+                    [(url, data.get('Template ID') or '', json.dumps(data), now) for url, data in metadata.items()]
+                )
+                conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('json', ?)", (now,))
+            if metadata:
+                logger.info(f"Migrated {len(metadata)} documents from {self.storage_file}")
         except Exception as e:
-            logger.error(f"Error saving metadata: {str(e)}")
+            logger.error(f"Error migrating metadata from {self.storage_file}: {str(e)}")
 
-    def add_metadata(self, metadata: Dict, document_url: str) -> None:
-        """Add or update metadata for a document."""
+    def add_metadata(self, metadata: Dict, document_url: str, fields: Optional[List[str]] = None,
+                     source: Optional[Dict] = None) -> None:
+        """
+        Add or update the metadata of a document for the template in its 'Template ID'.
+
+        Args:
+            metadata (Dict): Field values, 'File Name' and 'Template ID'
+            document_url (str): Key of the document
+            fields (List[str], optional): Template fields the values were
+                extracted for; defaults to the fields present in `metadata`
+            source (Dict, optional): The file the metadata was extracted from;
+                an update without a source keeps the stored one
+        """
+        if fields is None:
+            fields = [name for name in metadata if name not in RECORD_KEYS]
         try:
-            self.metadata[document_url] = metadata
-            self._save_metadata()
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT INTO metadata (document_url, template_id, data, updated_at, fields, source) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (document_url, template_id) DO UPDATE SET "
+                    "data = excluded.data, updated_at = excluded.updated_at, fields = excluded.fields, "
+                    "source = COALESCE(excluded.source, metadata.source)",
+                    (document_url, metadata.get('Template ID') or '', json.dumps(metadata), datetime.now().isoformat(),
+                     json.dumps(fields), json.dumps(source) if source else None)
+                )
             logger.info(f"Added/updated metadata for document: {document_url}")
         except Exception as e:
             logger.error(f"Error adding metadata: {str(e)}")
             raise
 
+    def merge_fields(self, document_url: str, template_id: str, values: Dict) -> bool:
+        """
+        Merge newly extracted field values into a stored record.
+
+        The fields are added to the ones the record was extracted for; other
+        values are left as they are.
+
+        Args:
+            document_url (str): Key of the document
+            template_id (str): ID of the template the record belongs to
+            values (Dict): Field values keyed by field name
+
+        Returns:
+            bool: Whether the record exists
+        """
+        try:
+            with self._connection() as conn:
+                # Take the write lock before reading so concurrent merges are not lost
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT data, fields FROM metadata WHERE document_url = ? AND template_id = ?",
+                    (document_url, template_id)
+                ).fetchone()
+                if not row:
+                    return False
+                data = json.loads(row['data'])
+                fields = self._record_fields(row)
+                data.update(values)
+                fields += [name for name in values if name not in fields]
+                conn.execute(
+                    "UPDATE metadata SET data = ?, fields = ?, updated_at = ? WHERE document_url = ? AND template_id = ?",
+                    (json.dumps(data), json.dumps(fields), datetime.now().isoformat(), document_url, template_id)
+                )
+            logger.info(f"Merged {len(values)} field(s) into metadata for document: {document_url}")
+            return True
+        except Exception as e:
+            logger.error(f"Error merging metadata: {str(e)}")
+            raise
+
+    def get_incomplete_records(self, template_id: str, field_names: List[str]) -> List[Dict]:
+        """
+        Get the records of a template that were not extracted for all the given fields.
+
+        Args:
+            template_id (str): ID of the template
+            field_names (List[str]): Current fields of the template
+
+        Returns:
+            List[Dict]: 'document_url', 'missing_fields' (in the order of
+                `field_names`) and 'source' of each incomplete record
+        """
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT document_url, data, fields, source FROM metadata WHERE template_id = ? ORDER BY rowid",
+                (template_id,)
+            ).fetchall()
+        records = []
+        for row in rows:
+            fields = set(self._record_fields(row))
+            missing = [name for name in field_names if name not in fields]
+            if missing:
+                records.append({
+                    'document_url': row['document_url'],
+                    'missing_fields': missing,
+                    'source': json.loads(row['source']) if row['source'] else None
+                })
+        return records
+
+    @staticmethod
+    def _record_fields(row) -> List[str]:
+        """Fields a row was extracted for; rows stored before they were tracked have all fields they hold."""
+        if row['fields'] is not None:
+            return json.loads(row['fields'])
+        return [name for name in json.loads(row['data']) if name not in RECORD_KEYS]
+
+    def _to_records(self, rows) -> List[Dict]:
+        return [{"Document URL": row['document_url'], **json.loads(row['data'])} for row in rows]
+
     def get_metadata(self) -> List[Dict]:
         """Get all stored metadata."""
-        return [{"Document URL": url, **data} for url, data in self.metadata.items()]
+        with self._connection() as conn:
+            rows = conn.execute("SELECT document_url, data FROM metadata ORDER BY rowid").fetchall()
+        return self._to_records(rows)
+
+    def get_metadata_by_template(self, template_id: str) -> List[Dict]:
+        """Get stored metadata of all documents processed with a template."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT document_url, data FROM metadata WHERE template_id = ? ORDER BY rowid",
+                (template_id,)
+            ).fetchall()
+        return self._to_records(rows)
+
+    def get_template_ids(self, document_url: Optional[str] = None) -> List[str]:
+        """Get the IDs of all templates that have stored metadata, optionally for one document."""
+        query = "SELECT DISTINCT template_id FROM metadata WHERE template_id != ''"
+        params = ()
+        if document_url is not None:
+            query += " AND document_url = ?"
+            params = (document_url,)
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [row['template_id'] for row in rows]
 
-    def get_metadata_by_url(self, document_url: str) -> Optional[Dict]:
-        """Get metadata for a specific document."""
-        return self.metadata.get(document_url)
+    def get_metadata_by_url(self, document_url: str, template_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Get metadata for a specific document.
 
-    def delete_metadata(self, document_url: str) -> None:
-        """Delete metadata for a specific document."""
+        Without a template ID the most recently updated metadata of the
+        document is returned.
+        """
+        with self._connection() as conn:
+            if template_id is not None:
+                row = conn.execute(
+                    "SELECT data FROM metadata WHERE document_url = ? AND template_id = ?",
+                    (document_url, template_id)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT data FROM metadata WHERE document_url = ? ORDER BY updated_at DESC LIMIT 1",
+                    (document_url,)
+                ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def delete_metadata(self, document_url: str, template_id: Optional[str] = None) -> None:
+        """Delete metadata for a specific document, for one template or for all of them."""
         try:
-            if document_url in self.metadata:
-                del self.metadata[document_url]
-                self._save_metadata()
+            with self._connection() as conn:
+                if template_id is not None:
+                    deleted = conn.execute(
+                        "DELETE FROM metadata WHERE document_url = ? AND template_id = ?",
+                        (document_url, template_id)
+                    ).rowcount
+                else:
+                    deleted = conn.execute("DELETE FROM metadata WHERE document_url = ?", (document_url,)).rowcount
+            if deleted:
                 logger.info(f"Deleted metadata for document: {document_url}")
         except Exception as e:
             logger.error(f"Error deleting metadata: {str(e)}")
@@ -66,9 +278,9 @@ class MetadataStorage:
     def clear_metadata(self) -> None:
         """Clear all stored metadata."""
         try:
-            self.metadata = {}
-            self._save_metadata()
+            with self._connection() as conn:
+                conn.execute("DELETE FROM metadata")
             logger.info("Cleared all metadata")
         except Exception as e:
             logger.error(f"Error clearing metadata: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
@@ -0,0 +1,190 @@
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, from tokenizing a page to a slow LLM call
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Label combinations kept per metric; further ones are dropped
+MAX_SERIES = 500
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: List[str], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric(ABC):
+    """Base for metrics with a fixed set of label names and bounded series."""
+
+    metric_type = ""
+
+    def __init__(self, name: str, description: str, label_names: Optional[List[str]] = None):
+        self.name = name
+        self.description = description
+        self.label_names = label_names or []
+        self.series: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+        self.dropped = False
+
+    def _key(self, labels: Dict[str, str]) -> Optional[Tuple[str, ...]]:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        if key not in self.series and len(self.series) >= MAX_SERIES:
+            if not self.dropped:
+                logger.warning(f"Metric {self.name} has {MAX_SERIES} label combinations, dropping new ones")
+                self.dropped = True
+            return None
+        return key
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.extend(self._render_series(key, value))
+        return lines
+
+    @abstractmethod
+    def _render_series(self, key: Tuple[str, ...], value) -> List[str]:
+        """Render the exposition lines of one series."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. documents or tokens."""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        with self.lock:
+            key = self._key(labels)
+            if key is not None:
+                self.series[key] = self.series.get(key, 0) + amount
+
+    def _render_series(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets.
+
+    Only the bucket counts, sum and count are kept, so memory does not grow
+    with the number of observations.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Optional[List[str]] = None,
+                 buckets: Optional[List[float]] = None):
+        super().__init__(name, description, label_names)
+        self.buckets = sorted(buckets or LATENCY_BUCKETS) + [math.inf]
+
+    def observe(self, value: float, **labels) -> None:
+        with self.lock:
+            key = self._key(labels)
+            if key is None:
+                return
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_series(self, key, value) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value['counts']):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value['sum'])}")
+        lines.append(f"{self.name}_count{labels} {value['count']}")
+        return lines
+
+
+class ProcessingMetrics:
+    """
+    Metrics of document processing, rendered in the Prometheus text format.
+
+    Metrics are kept per process; with several uvicorn workers each worker
+    reports its own and Prometheus aggregates them.
+    """
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.stage_seconds = self.histogram(
+            'csp_stage_duration_seconds',
+            'Latency of the processing stages: download, pdf_extract, tokenize, prompt_build, llm, response_parse',
+            ['stage']
+        )
+        self.queue_delay_seconds = self.histogram(
+            'csp_queue_delay_seconds', 'Time documents spent waiting in pipeline queues'
+        )
+        self.documents = self.counter(
+            'csp_documents_total', 'Documents finished, by outcome (done, cached, failed)', ['outcome']
+        )
+        self.llm_requests = self.counter(
+            'csp_llm_requests_total', 'Gemini requests, by outcome (success, rate_limited, error)', ['outcome']
+        )
+        self.tokens = self.counter(
+            'csp_tokens_total', 'Tokens of extracted documents, by template and kind (text, prompt, response)',
+            ['template_id', 'kind']
+        )
+
+    def counter(self, name: str, description: str, label_names: Optional[List[str]] = None) -> Counter:
+        metric = Counter(name, description, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, label_names: Optional[List[str]] = None,
+                  buckets: Optional[List[float]] = None) -> Histogram:
+        metric = Histogram(name, description, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def record_tokens(self, template_id: str, token_statistics: Optional[Dict]) -> None:
+        """Count the tokens of one extracted document against its template."""
+        if not token_statistics:
+            return
+        for kind in ('text', 'prompt', 'response'):
+            self.tokens.inc(token_statistics.get(f'{kind}_tokens', 0), template_id=template_id, kind=kind)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
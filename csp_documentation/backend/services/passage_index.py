@@ -0,0 +1,108 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning in field names and descriptions
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'if', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'the', 'this', 'that', 'to', 'was', 'which', 'with',
+    'any', 'all', 'document', 'field', 'value', 'information', 'details', 'e', 'g', 'eg'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text, without stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class PassageIndex:
+    """
+    In-memory BM25 index over the passages of one document.
+
+    The text is cut into passages of roughly `passage_words` words along line
+    boundaries. Each template field is used as a query (its name and
+    description) to pick the passages most likely to hold its value.
+    """
+
+    def __init__(self, text: str, passage_words: int = 200, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages = self._split_passages(text, passage_words)
+
+        self.term_counts = [Counter(tokenize(passage)) for passage in self.passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.norms = [k1 * (1 - b + b * length / (average_length or 1)) for length in self.lengths]
+
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        passage_count = len(self.passages)
+        self.idf = {
+            term: math.log((passage_count - frequency + 0.5) / (frequency + 0.5) + 1)
+            for term, frequency in document_frequency.items()
+        }
+
+    @staticmethod
+    def _split_passages(text: str, passage_words: int) -> List[str]:
+        passages = []
+        current = []
+        current_words = 0
+        for line in text.splitlines():
+            words = len(line.split())
+            if not words:
+                continue
+            if current and current_words + words > passage_words:
+                passages.append("\n".join(current))
+                current, current_words = [], 0
+            current.append(line)
+            current_words += words
+        if current:
+            passages.append("\n".join(current))
+        return passages
+
+    def score(self, query: str) -> List[float]:
+        """BM25 score of every passage for a query."""
+        terms = set(tokenize(query))
+        scores = []
+        for counts, norm in zip(self.term_counts, self.norms):
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if not frequency:
+                    continue
+                score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, fields: List[Dict], passages_per_field: int = 3) -> List[int]:
+        """
+        Pick the passages relevant to the given template fields.
+
+        The first passage (title page) is always kept, plus the top
+        `passages_per_field` passages with a positive score for each field.
+
+        Returns:
+            List[int]: Indexes of the selected passages, in document order
+        """
+        if not self.passages:
+            return []
+        selected = {0}
+        for field in fields:
+            query = f"{field.get('name', '')} {field.get('description', '')}"
+            scores = self.score(query)
+            ranked = sorted(range(len(scores)), key=lambda index: (-scores[index], index))
+            selected.update(index for index in ranked[:passages_per_field] if scores[index] > 0)
+        return sorted(selected)
+
+    def select_text(self, fields: List[Dict], passages_per_field: int = 3) -> str:
+        """Text made of the passages selected for the given fields."""
+        return "\n...\n".join(self.passages[index] for index in self.select(fields, passages_per_field))
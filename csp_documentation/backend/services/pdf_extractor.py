@@ -0,0 +1,189 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from PyPDF2 import PdfReader
+from services.extraction_cache import ExtractionCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _open_reader(source: Union[str, bytes]) -> PdfReader:
+    """Open a PDF from a file path or from its bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return PdfReader(io.BytesIO(source))
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"File not found: {source}")
+    return PdfReader(source)
+
+
+def _spill_to_file(content: bytes) -> str:
+    """Write PDF bytes to a temporary file and return its path."""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(content)
+        return f.name
+
+
+def extract_page_range(source: Union[str, bytes], start: int, end: Optional[int]) -> Tuple[int, List[Tuple[str, float]]]:
+    """
+    Extract the text of pages [start, end) of a PDF.
+
+    Kept at module level (and free of heavy imports) so it can be submitted
+    to a process pool.
+
+    Args:
+        source (str | bytes): Path to the PDF file, or its content
+        start (int): First page to extract
+        end (int, optional): Page after the last one to extract; None for all remaining pages
+
+    Returns:
+        Tuple[int, List[Tuple[str, float]]]: Total page count of the PDF, and
+            the text and extraction time in seconds of each requested page
+    """
+    pdf_reader = _open_reader(source)
+    page_count = len(pdf_reader.pages)
+    end = page_count if end is None else min(end, page_count)
+
+    pages = []
+    for index in range(start, end):
+        page_start = time.perf_counter()
+        text = pdf_reader.pages[index].extract_text() or ""
+        pages.append((text, time.perf_counter() - page_start))
+    return page_count, pages
+
+
+def join_pages(pages: List[str]) -> str:
+    """Assemble page texts into the document text, one page per line block."""
+    text = "\n".join(pages) + "\n" if pages else ""
+    if not text.strip():
+        raise ValueError("No text could be extracted from the PDF")
+    return text
+
+
+def extract_pdf_text(file_path: str) -> str:
+    """
+    Extract text from a PDF file in the calling process.
+
+    Args:
+        file_path (str): Path to the PDF file
+
+    Returns:
+        str: The extracted text
+    """
+    _, pages = extract_page_range(file_path, 0, None)
+    return join_pages([text for text, _ in pages])
+
+
+class PdfTextExtractor:
+    """
+    Page-parallel PDF text extraction.
+
+    The first task extracts the first `pages_per_task` pages and reports the
+    page count; the remaining pages are split into ranges of the same size
+    and extracted concurrently on the process pool. Page texts are joined
+    once at the end. Page texts are cached by document hash in PDF_PAGE_CACHE_DIR
+    (default 'page_cache'), so documents seen before - e.g. by a template
+    backfill - are neither downloaded nor parsed again. The page cache is an
+    ExtractionCache of its own, bounded to PDF_PAGE_CACHE_MAX_MB with the
+    least recently used documents evicted first. An empty PDF_PAGE_CACHE_DIR
+    disables it.
+    """
+
+    def __init__(self, executor_provider, pages_per_task: Optional[int] = None,
+                 page_cache_dir: Optional[str] = None):
+        self.executor_provider = executor_provider
+        self.pages_per_task = pages_per_task or int(os.getenv('PDF_PAGES_PER_TASK', '25'))
+        page_cache_dir = page_cache_dir if page_cache_dir is not None else os.getenv('PDF_PAGE_CACHE_DIR', 'page_cache')
+        self.page_cache = ExtractionCache(
+            page_cache_dir, int(os.getenv('PDF_PAGE_CACHE_MAX_MB', '2048')) * 1024 * 1024, name='page cache'
+        ) if page_cache_dir else None
+
+    @staticmethod
+    def _cache_key(document_hash: str) -> str:
+        return f"pages:{document_hash}"
+
+    def has_cached_pages(self, document_hash: Optional[str]) -> bool:
+        """Whether the page texts of a document are cached."""
+        return bool(self.page_cache and document_hash and self.page_cache.contains(self._cache_key(document_hash)))
+
+    def get_cached_pages(self, document_hash: Optional[str]) -> Optional[List[str]]:
+        """Get the cached page texts of a document, if any."""
+        if not self.page_cache or not document_hash:
+            return None
+        cached = self.page_cache.get(self._cache_key(document_hash))
+        return cached['pages'] if cached else None
+
+    def _cache_pages(self, document_hash: Optional[str], pages: List[str]) -> None:
+        if self.page_cache and document_hash:
+            self.page_cache.put([self._cache_key(document_hash)], {'pages': pages})
+
+    async def extract(self, source: Union[str, bytes], document_hash: Optional[str] = None) -> Dict:
+        """
+        Extract the text of a PDF.
+
+        Args:
+            source (str | bytes): Path to the PDF file, or its content
+            document_hash (str, optional): Content hash used as page cache key
+
+        Returns:
+            Dict: 'text', 'page_count', 'page_timings' (seconds per page) and
+                'from_cache'
+        """
+        cached_pages = await asyncio.to_thread(self.get_cached_pages, document_hash)
+        if cached_pages is not None:
+            return {
+                'text': join_pages(cached_pages),
+                'page_count': len(cached_pages),
+                'page_timings': [],
+                'from_cache': True
+            }
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor_provider()
+
+        page_count, pages = await loop.run_in_executor(
+            executor, extract_page_range, source, 0, self.pages_per_task
+        )
+        if page_count > self.pages_per_task:
+            ranges = [
+                (start, start + self.pages_per_task)
+                for start in range(self.pages_per_task, page_count, self.pages_per_task)
+            ]
+            # Every task would get its own pickled copy of an in-memory PDF;
+            # the remaining ranges read it from a temporary file instead
+            spilled_path = None
+            if isinstance(source, (bytes, bytearray)):
+                spilled_path = await asyncio.to_thread(_spill_to_file, source)
+            try:
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(executor, extract_page_range, spilled_path or source, start, end)
+                    for start, end in ranges
+                ))
+            finally:
+                if spilled_path:
+                    os.remove(spilled_path)
+            for _, range_pages in results:
+                pages.extend(range_pages)
+
+        page_texts = [text for text, _ in pages]
+        page_timings = [seconds for _, seconds in pages]
+        text = join_pages(page_texts)
+        await asyncio.to_thread(self._cache_pages, document_hash, page_texts)
+
+        if page_timings:
+            slowest = max(range(len(page_timings)), key=page_timings.__getitem__)
+            logger.debug(
+                f"Extracted {page_count} pages in {sum(page_timings):.2f}s CPU "
+                f"(slowest page {slowest + 1}: {page_timings[slowest]:.2f}s)"
+            )
+        return {
+            'text': text,
+            'page_count': page_count,
+            'page_timings': page_timings,
+            'from_cache': False
+        }
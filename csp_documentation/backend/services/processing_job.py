@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from services.document_pipeline import DocumentPipeline
+from services.job_store import JobStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ProcessingJob:
+    """
+    A single processing request.
+
+    Each job owns its pipeline - and with it its own queues, workers and
+    result list - so concurrent requests never see each other's documents.
+    Its state is recorded in the shared JobStore so any worker process can
+    report on it. Crawled files, document outcomes and per-document progress
+    events are queued in memory and written in batches every
+    JOB_PROGRESS_FLUSH_SECONDS by a writer task, so a job that was
+    interrupted can be resumed with `resume`, which skips the documents that
+    already completed. Job-level 'started', 'completed' and 'failed' events
+    are appended to the job's event log; the queue is flushed before the
+    final one. Store calls run in worker threads, never on the event loop.
+    While it runs, the job refreshes its heartbeat in the store so other
+    workers can tell it apart from an interrupted one.
+    """
+
+    kind = 'process'
+
+    def __init__(self, processor, job_store: JobStore, document_url: str, template_id: str,
+                 files: Optional[List[Dict]] = None, recursive: bool = False,
+                 job_id: Optional[str] = None):
+        self.processor = processor
+        self.job_store = job_store
+        self.document_url = document_url
+        self.template_id = template_id
+        self.results: List[Dict] = []
+        self.failed_documents: List[Dict] = []
+        self.crawl_errors: List[Dict] = []
+        self.list_files = False
+        self.pending_files: List[Dict] = []
+        self.pending_outcomes: List[Tuple[Dict, Optional[Dict], Optional[str]]] = []
+        self.pending_events: List[Tuple[str, Optional[str], Dict]] = []
+        self.progress_lock = asyncio.Lock()
+
+        if job_id is not None:
+            # Resuming: files and finished documents come from the job store
+            self.job_id = job_id
+            self.recursive = recursive
+            self.files = job_store.get_files(job_id)
+            done = [result for result in job_store.get_results(job_id) if result['status'] == 'done']
+            self.previous_results = [result['metadata'] for result in done]
+            self.done_files = {result['file_name'] for result in done}
+            # A job that failed before its folder was listed lists it again
+            self.list_files = not self.files and not recursive
+            return
+
+        # A recursive job crawls its files while they are processed, any other
+        # job without given files lists its folder when it starts running
+        self.recursive = recursive and files is None
+        self.list_files = files is None and not self.recursive
+        self.files = files if files is not None else []
+        self.job_id = job_store.create_job(document_url, template_id, len(self.files),
+                                           recursive=self.recursive, kind=self.kind)
+        job_store.add_files(self.job_id, self.files)
+        self.previous_results = []
+        self.done_files = set()
+
+    @classmethod
+    def resume(cls, processor, job_store: JobStore, job_id: str) -> 'ProcessingJob':
+        """
+        Load an existing job to process the documents it has not finished.
+
+        Args:
+            processor: The DocumentProcessor used to process the documents
+            job_store (JobStore): The shared job store
+            job_id (str): ID of the job to resume
+
+        Returns:
+            ProcessingJob: The job, ready to run
+        """
+        job = job_store.get_job(job_id)
+        if not job:
+            raise KeyError(f"Job with ID {job_id} not found")
+        return cls(processor, job_store, job['document_url'], job['template_id'],
+                   recursive=bool(job.get('recursive')), job_id=job_id)
+
+    def _record_document(self, file: Dict, metadata: Optional[Dict], error: Optional[str]) -> None:
+        """Queue the outcome of one document for the progress writer."""
+        self.pending_outcomes.append((file, metadata, error))
+
+    def _record_event(self, file: Dict, event: str, data: Dict) -> None:
+        self.pending_events.append((event, file.get('name'), data))
+
+    def _store_outcomes(self, outcomes: List[Tuple[Dict, Optional[Dict], Optional[str]]]) -> None:
+        """Persist document outcomes; runs in a worker thread."""
+        results = []
+        for file, metadata, error in outcomes:
+            if metadata is not None:
+                results.append({'file_name': file.get('name'), 'status': 'done', 'metadata': metadata})
+            else:
+                results.append({'file_name': file.get('name'), 'status': 'failed', 'error': error})
+        self.job_store.add_results(self.job_id, results)
+
+    def _store_progress(self, files: List[Dict],
+                        outcomes: List[Tuple[Dict, Optional[Dict], Optional[str]]],
+                        events: List[Tuple[str, Optional[str], Dict]]) -> None:
+        # Outcomes before events, so a client reacting to a 'done' event finds the result
+        self.job_store.add_files(self.job_id, files)
+        self._store_outcomes(outcomes)
+        self.job_store.add_events(self.job_id, events)
+
+    async def _flush_progress(self) -> None:
+        """Write the queued files, outcomes and events in one batch."""
+        async with self.progress_lock:
+            files, self.pending_files = self.pending_files, []
+            outcomes, self.pending_outcomes = self.pending_outcomes, []
+            events, self.pending_events = self.pending_events, []
+            if not files and not outcomes and not events:
+                return
+            try:
+                await asyncio.to_thread(self._store_progress, files, outcomes, events)
+            except Exception as e:
+                logger.error(f"Error writing progress of job {self.job_id}: {str(e)}")
+
+    async def _write_progress(self, stop: asyncio.Event) -> None:
+        """Flush the queued progress periodically, and once more when stopped."""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.job_store.PROGRESS_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await self._flush_progress()
+
+    def _record_crawl_error(self, folder: str, error: str) -> None:
+        """Report a folder the crawl could not list as a failed document of the job."""
+        error = f"Folder could not be listed: {error}"
+        self.crawl_errors.append({'file': folder, 'error': error})
+        self._record_document({'name': folder}, None, error)
+        self._record_event({'name': folder}, 'crawl_error', {'error': error})
+
+    async def _crawl(self) -> AsyncIterator[Dict]:
+        """Crawl the job's folder, recording each file and skipping finished ones."""
+        async for file in self.processor.crawl_files(self.document_url, self._record_crawl_error):
+            self.pending_files.append(file)
+            if file['name'] not in self.done_files:
+                yield file
+
+    def _create_pipeline(self, field_names: Optional[List[str]] = None) -> DocumentPipeline:
+        return DocumentPipeline(self.processor, self.template_id, field_names=field_names,
+                                on_document=self._record_document, on_event=self._record_event)
+
+    async def _process(self, files: Union[List[Dict], AsyncIterator[Dict]]) -> List[Dict]:
+        """Run the files through a pipeline, collecting its failed documents."""
+        pipeline = self._create_pipeline()
+        results = await pipeline.run(files)
+        self.failed_documents = pipeline.failed_documents
+        return results
+
+    async def run(self) -> List[Dict]:
+        """
+        Process all files of the job that are not done yet.
+
+        Returns:
+            List[Dict]: Metadata for each successfully processed document,
+                including documents finished by earlier runs of the job
+        """
+        await asyncio.to_thread(self.job_store.update_job, self.job_id, status='running', error=None)
+        start_time = time.time()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        stop_writer = asyncio.Event()
+        writer = asyncio.create_task(self._write_progress(stop_writer))
+        try:
+            if self.list_files:
+                self.files = await asyncio.to_thread(self.processor.get_files_to_process, self.document_url)
+                await asyncio.to_thread(self.job_store.add_files, self.job_id, self.files)
+                await asyncio.to_thread(self.job_store.update_job, self.job_id, total_documents=len(self.files))
+                self.list_files = False
+            if not self.files and not self.recursive:
+                raise ValueError("No files found in the SharePoint folder")
+            await asyncio.to_thread(self.job_store.add_event, self.job_id, 'started', data={
+                'total_documents': None if self.recursive else len(self.files),
+                'skipped_documents': len(self.done_files)
+            })
+
+            if self.recursive:
+                new_results = await self._process(self._crawl())
+                # Folders that could not be listed count as failed documents,
+                # so the job does not claim to have covered the whole tree
+                self.failed_documents += self.crawl_errors
+                await self._flush_progress()
+                self.files = await asyncio.to_thread(self.job_store.get_files, self.job_id)
+                if not self.files:
+                    raise ValueError("No files found in the SharePoint folder")
+                await asyncio.to_thread(self.job_store.update_job, self.job_id, total_documents=len(self.files))
+            else:
+                pending = [file for file in self.files if file['name'] not in self.done_files]
+                if self.done_files:
+                    logger.info(f"Resuming job {self.job_id}: {len(pending)} of {len(self.files)} documents left")
+                new_results = await self._process(pending)
+            self.results = self.previous_results + new_results
+            stop_writer.set()
+            await writer
+
+            processing_time = time.time() - start_time
+            processed = len(new_results) + len(self.failed_documents)
+            await asyncio.to_thread(self.job_store.add_event, self.job_id, 'completed', data={
+                'total_documents': len(self.files),
+                'completed_documents': len(self.results),
+                'failed_documents': len(self.failed_documents),
+                'elapsed_seconds': round(processing_time, 3),
+                'documents_per_second': round(processed / processing_time, 3) if processing_time else None
+            })
+            await asyncio.to_thread(self.job_store.update_job, self.job_id, status='completed')
+            return self.results
+
+        except Exception as e:
+            logger.error(f"Job {self.job_id} failed: {str(e)}")
+            # Queued progress and the final event are written before the
+            # status so that event streams which stop on a final status
+            # never miss them
+            stop_writer.set()
+            await writer
+            await asyncio.to_thread(self.job_store.add_event, self.job_id, 'failed', data={
+                'error': str(e),
+                'elapsed_seconds': round(time.time() - start_time, 3)
+            })
+            await asyncio.to_thread(self.job_store.update_job, self.job_id, status='failed', error=str(e))
+            raise
+        finally:
+            heartbeat.cancel()
+            stop_writer.set()
+            await asyncio.to_thread(self._prune_events)
+
+    def _prune_events(self) -> None:
+        try:
+            self.job_store.prune_events()
+        except Exception as e:
+            logger.warning(f"Could not prune job events: {str(e)}")
+
+    async def _heartbeat(self) -> None:
+        """Refresh the job's heartbeat until the run ends."""
+        while True:
+            await asyncio.sleep(self.job_store.HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(self.job_store.heartbeat, self.job_id)
+            except Exception as e:
+                logger.warning(f"Could not record heartbeat of job {self.job_id}: {str(e)}")
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for LLM requests.
+
+    Two buckets refill continuously: one holding the tokens allowed per
+    minute, one the requests allowed per minute. Callers acquire the
+    estimated tokens of a request before sending it and reconcile the
+    estimate with the actual usage afterwards. When the API answers 429 all
+    callers pause until the retry delay (or an exponential backoff) has
+    passed.
+
+    State is guarded by a thread lock and waiting uses asyncio.sleep, so one
+    limiter can be shared by every pipeline of the process regardless of
+    which event loop they run on. Limits apply per process.
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int,
+                 initial_backoff: float = 2.0, max_backoff: float = 60.0):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.available_tokens = float(tokens_per_minute)
+        self.available_requests = float(requests_per_minute)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = initial_backoff
+        self.lock = threading.Lock()
+
+        self.stats = {
+            'requests': 0,
+            'throttled_requests': 0,
+            'rate_limited_responses': 0,
+            'wait_seconds': 0.0
+        }
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.available_tokens = min(
+            self.tokens_per_minute,
+            self.available_tokens + elapsed * self.tokens_per_minute / 60
+        )
+        self.available_requests = min(
+            self.requests_per_minute,
+            self.available_requests + elapsed * self.requests_per_minute / 60
+        )
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Wait until a request of `tokens` estimated tokens may be sent.
+
+        Requests larger than the whole per-minute budget wait for a full
+        bucket rather than forever.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        throttled = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.available_tokens >= tokens and self.available_requests >= 1:
+                    self.available_tokens -= tokens
+                    self.available_requests -= 1
+                    self.stats['requests'] += 1
+                    if throttled:
+                        self.stats['throttled_requests'] += 1
+                    return
+                else:
+                    token_wait = (tokens - self.available_tokens) * 60 / self.tokens_per_minute
+                    request_wait = (1 - self.available_requests) * 60 / self.requests_per_minute
+                    wait = max(token_wait, request_wait, 0.01)
+                self.stats['wait_seconds'] += wait
+            throttled = True
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once the actual usage of a request is known."""
+        with self.lock:
+            self.available_tokens = min(
+                self.tokens_per_minute,
+                self.available_tokens + min(estimated_tokens, self.tokens_per_minute) - actual_tokens
+            )
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """
+        Pause all callers after a 429 response.
+
+        Args:
+            retry_after (float, optional): Delay requested by the API
+
+        Returns:
+            float: Seconds until requests resume
+        """
+        with self.lock:
+            delay = retry_after if retry_after else self.backoff
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.available_tokens = 0
+            self.stats['rate_limited_responses'] += 1
+        logger.warning(f"LLM rate limit hit, pausing requests for {delay:.1f} seconds")
+        return delay
+
+    def on_success(self) -> None:
+        """Reset the backoff after a successful request."""
+        with self.lock:
+            self.backoff = self.initial_backoff
+
+    def get_statistics(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from bisect import bisect_right
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEDULER_POLICIES = ('fifo', 'sjf_size', 'sjf_tokens', 'fair')
+
+# Upper bounds of the size buckets of the fair policy: 1 MB, 10 MB, 100 MB and above
+SIZE_BUCKETS = [1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+
+
+def file_size(item: Dict) -> int:
+    return item['file'].get('size') or 0
+
+
+def text_tokens(item: Dict) -> int:
+    return item.get('text_tokens') or 0
+
+
+class DocumentQueue(asyncio.Queue):
+    """
+    FIFO queue between pipeline stages that measures queueing delay.
+
+    Every item records when it was queued; on removal the time it waited is
+    added to its 'queue_delay'. None (end of input) is always served last.
+    Subclasses only change the order in which items are served.
+    """
+
+    def _init(self, maxsize):
+        self._queue = deque()
+
+    def _put(self, item):
+        if item is not None:
+            item['enqueued_at'] = time.monotonic()
+        self._put_item(item)
+
+    def _get(self):
+        item = self._get_item()
+        if item is not None:
+            item['queue_delay'] = item.get('queue_delay', 0.0) + time.monotonic() - item.pop('enqueued_at')
+        return item
+
+    def _put_item(self, item) -> None:
+        self._queue.append(item)
+
+    def _get_item(self):
+        return self._queue.popleft()
+
+
+class ShortestJobFirstQueue(DocumentQueue):
+    """Serves the item with the smallest `key` first; ties in arrival order."""
+
+    def __init__(self, key: Callable[[Dict], float], maxsize: int = 0):
+        self.key = key
+        self.counter = itertools.count()
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue = []
+
+    def _put_item(self, item) -> None:
+        priority = float('inf') if item is None else self.key(item)
+        heapq.heappush(self._queue, (priority, next(self.counter), item))
+
+    def _get_item(self):
+        return heapq.heappop(self._queue)[2]
+
+
+class _Buckets:
+    """FIFO buckets plus a slot for the end-of-input marker."""
+
+    def __init__(self, count: int):
+        self.buckets = [deque() for _ in range(count)]
+        self.end = deque()
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets) + len(self.end)
+
+    def __iter__(self):
+        return itertools.chain(*self.buckets, self.end)
+
+
+class SizeBucketedQueue(DocumentQueue):
+    """
+    Fair mix of document sizes.
+
+    Items are sorted into size buckets and the buckets are served round
+    robin, so small documents finish early without starving large ones.
+    """
+
+    def __init__(self, bounds: Optional[List[int]] = None, maxsize: int = 0):
+        self.bounds = bounds or SIZE_BUCKETS
+        self.next_bucket = 0
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue = _Buckets(len(self.bounds) + 1)
+
+    def _put_item(self, item) -> None:
+        if item is None:
+            self._queue.end.append(item)
+        else:
+            self._queue.buckets[bisect_right(self.bounds, file_size(item))].append(item)
+
+    def _get_item(self):
+        buckets = self._queue.buckets
+        for offset in range(len(buckets)):
+            index = (self.next_bucket + offset) % len(buckets)
+            if buckets[index]:
+                self.next_bucket = (index + 1) % len(buckets)
+                return buckets[index].popleft()
+        return self._queue.end.popleft()
+
+
+def create_file_queue(policy: str, maxsize: int) -> DocumentQueue:
+    """
+    Queue of files waiting for download, ordered by the scheduling policy.
+
+    Any policy other than FIFO needs to see the whole backlog to reorder it,
+    so those queues are unbounded; they only hold file descriptions.
+    """
+    if policy == 'fifo':
+        return DocumentQueue(maxsize)
+    if policy in ('sjf_size', 'sjf_tokens'):
+        # Before parsing the file size is the best estimate of the token count
+        return ShortestJobFirstQueue(file_size)
+    if policy == 'fair':
+        return SizeBucketedQueue()
+    raise ValueError(f"Unknown scheduler policy: {policy}. Use one of {', '.join(SCHEDULER_POLICIES)}")
+
+
+def create_llm_queue(policy: str, maxsize: int) -> DocumentQueue:
+    """Queue of parsed documents waiting for extraction."""
+    if policy == 'sjf_tokens':
+        return ShortestJobFirstQueue(text_tokens, maxsize)
+    return DocumentQueue(maxsize)
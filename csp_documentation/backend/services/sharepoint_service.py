@@ -1,6 +1,9 @@
 import os
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from typing import Optional, List, Dict
 from office365.runtime.auth.client_credential import ClientCredential
@@ -14,8 +17,44 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_graph_session() -> requests.Session:
+    """
+    Get the HTTP session shared by every SharePointService of the process.
+    
+    Connections are kept alive and pooled (GRAPH_POOL_SIZE per host), and
+    429/503 responses are retried with exponential backoff, honouring the
+    Retry-After header.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=int(os.getenv('GRAPH_MAX_RETRIES', '5')),
+                backoff_factor=float(os.getenv('GRAPH_RETRY_BACKOFF', '1')),
+                status_forcelist=(429, 503),
+                allowed_methods=None,
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            pool_size = int(os.getenv('GRAPH_POOL_SIZE', '16'))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
 
 class SharePointService:
+    # Site and drive IDs never change for a site, so they are resolved once
+    # per process and shared by all instances
+    _site_ids: Dict[str, str] = {}
+    _drive_ids: Dict[str, str] = {}
+    _id_lock = threading.Lock()
+
     def __init__(self):
         self.client_id = os.getenv('SHAREPOINT_CLIENT_ID')
         self.client_secret = os.getenv('SHAREPOINT_CLIENT_SECRET')
@@ -26,6 +65,12 @@ class SharePointService:
         self.access_token = None
         self.token_expiry = 0
 
+        # Graph and login endpoints; overridable to point at a local stand-in server
+        self.graph_url = os.getenv('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0').rstrip('/')
+        self.login_url = os.getenv('GRAPH_LOGIN_URL', 'https://login.microsoftonline.com').rstrip('/')
+        self.session = get_graph_session()
+        self.timeout = float(os.getenv('GRAPH_TIMEOUT', '60'))
+
         # Ensure site URL has protocol
         if self.site_url and not self.site_url.startswith('http'):
             self.site_url = f'https://{self.site_url}'
@@ -71,7 +116,7 @@ class SharePointService:
                 return self.access_token
 
             # Get new token
-            token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/token"
+            token_url = f"{self.login_url}/{self.tenant_id}/oauth2/token"
             data = {
                 'client_id': self.client_id,
                 'client_secret': self.client_secret,
@@ -79,7 +124,7 @@ class SharePointService:
                 'resource': 'https://graph.microsoft.com/'
             }
             
-            response = requests.post(token_url, data=data)
+            response = self.session.post(token_url, data=data, timeout=self.timeout)
             response.raise_for_status()
             token_data = response.json()
             
@@ -101,23 +146,21 @@ class SharePointService:
             str: Site ID
         """
         try:
-            access_token = self._get_access_token()
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/json'
-            }
+            search_url = f"{self.graph_url}/sites?search=regulatory-docs"
+            with self._id_lock:
+                site_id = self._site_ids.get(search_url)
+            if site_id:
+                return site_id
             
             # Search for the site
-            search_url = "https://graph.microsoft.com/v1.0/sites?search=regulatory-docs"
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
-            
-            sites = response.json().get('value', [])
+            sites = self._graph_get(search_url).get('value', [])
             if not sites:
                 raise ValueError("Site not found")
                 
             # Get the site ID
             site_id = sites[0]['id']
+            with self._id_lock:
+                self._site_ids[search_url] = site_id
             logger.info(f"Found site ID: {site_id}")
             return site_id
             
@@ -125,6 +168,34 @@ class SharePointService:
             logger.error(f"Error getting site ID: {str(e)}")
             raise
 
+    def _get_drive_id(self) -> str:
+        """
+        Get the ID of the site's default document library.
+        
+        Returns:
+            str: Drive ID
+        """
+        try:
+            site_id = self._get_site_id()
+            with self._id_lock:
+                drive_id = self._drive_ids.get(site_id)
+            if drive_id:
+                return drive_id
+            
+            drive_id = self._graph_get(f"{self.graph_url}/sites/{site_id}/drive")['id']
+            with self._id_lock:
+                self._drive_ids[site_id] = drive_id
+            logger.info(f"Found drive ID: {drive_id}")
+            return drive_id
+            
+        except Exception as e:
+            logger.error(f"Error getting drive ID: {str(e)}")
+            raise
+
+    def _drive_url(self) -> str:
+        """Graph URL of the site's default document library."""
+        return f"{self.graph_url}/drives/{self._get_drive_id()}"
+
     def get_files(self, folder_path: Optional[str] = None) -> List[Dict]:
         """
         Get all PDF files from a SharePoint folder using pagination.
@@ -136,31 +207,18 @@ class SharePointService:
             List[Dict]: List of dictionaries with file metadata.
         """
         try:
-            access_token = self._get_access_token()
-            site_id = self._get_site_id()
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/json'
-            }
+            drive_url = self._drive_url()
             
             # Get files from the specified folder
             folder_path = folder_path or "Regulatory IDMP Documents"
-            files_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{folder_path}:/children"
+            files_url = f"{drive_url}/root:/{folder_path}:/children"
             
             all_files = []
             while files_url:
-                response = requests.get(files_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
+                data = self._graph_get(files_url)
                 files = data.get('value', [])
                 all_files.extend([
-                    {
-                        'url': f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{file['id']}/content",
-                        'name': file['name'],
-                        'size': file.get('size', 0),
-                        'last_modified': file.get('lastModifiedDateTime')
-                    }
+                    self._to_file_entry(drive_url, file)
                     for file in files if file['name'].lower().endswith('.pdf')
                 ])
                 # Get the next page URL if it exists
@@ -175,33 +233,280 @@ class SharePointService:
             logger.error(f"Error getting SharePoint files: {str(e)}")
             raise
 
-    def download_file(self, file_url: str, local_path: Optional[str] = None) -> str:
+    def _to_file_entry(self, drive_url: str, item: Dict) -> Dict:
+        """Convert a Graph drive item into the file dict used by the processing pipeline."""
+        return {
+            'id': item['id'],
+            'url': f"{drive_url}/items/{item['id']}/content",
+            'name': item['name'],
+            'size': item.get('size', 0),
+            'etag': item.get('eTag'),
+            'last_modified': item.get('lastModifiedDateTime')
+        }
+
+    def _graph_get(self, url: str) -> Dict:
+        """GET a Graph API URL and return the JSON body."""
+        headers = {
+            'Authorization': f'Bearer {self._get_access_token()}',
+            'Accept': 'application/json'
+        }
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def graph_batch_get(self, urls: List[str]) -> List[Dict]:
+        """
+        GET several Graph URLs through JSON batching.
+        
+        URLs are sent to /$batch in groups of GRAPH_BATCH_SIZE (at most 20,
+        the Graph limit). Sub-requests throttled with 429 are sent again,
+        after the longest Retry-After of the group, up to GRAPH_MAX_RETRIES times.
+        
+        Args:
+            urls (List[str]): Absolute Graph API URLs
+            
+        Returns:
+            List[Dict]: 'status' and 'body' of each sub-response, in the order of `urls`
+        """
+        try:
+            batch_size = max(1, min(20, int(os.getenv('GRAPH_BATCH_SIZE', '20'))))
+            max_retries = int(os.getenv('GRAPH_MAX_RETRIES', '5'))
+            results: List[Optional[Dict]] = [None] * len(urls)
+            
+            for start in range(0, len(urls), batch_size):
+                pending = list(range(start, min(start + batch_size, len(urls))))
+                attempt = 0
+                while pending:
+                    responses = self._send_batch({str(index): urls[index] for index in pending})
+                    throttled = []
+                    retry_after = 0.0
+                    for index in pending:
+                        response = responses.get(str(index), {'status': 500, 'body': {}})
+                        if response['status'] == 429 and attempt < max_retries:
+                            throttled.append(index)
+                            headers = {key.lower(): value for key, value in (response.get('headers') or {}).items()}
+                            retry_after = max(retry_after, float(headers.get('retry-after', 0) or 0))
+                        else:
+                            results[index] = {'status': response['status'], 'body': response.get('body') or {}}
+                    if throttled:
+                        attempt += 1
+                        delay = retry_after or min(2 ** attempt, 60)
+                        logger.warning(f"{len(throttled)} batched Graph requests throttled, retrying in {delay:.1f}s")
+                        time.sleep(delay)
+                    pending = throttled
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error sending Graph batch request: {str(e)}")
+            raise
+
+    def _send_batch(self, urls: Dict[str, str]) -> Dict[str, Dict]:
+        """POST one /$batch request and return the sub-responses keyed by request ID."""
+        headers = {
+            'Authorization': f'Bearer {self._get_access_token()}',
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        body = {
+            'requests': [
+                {
+                    'id': request_id,
+                    'method': 'GET',
+                    'url': url[len(self.graph_url):] if url.startswith(self.graph_url) else url
+                }
+                for request_id, url in urls.items()
+            ]
+        }
+        response = self.session.post(f"{self.graph_url}/$batch", headers=headers, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return {item['id']: item for item in response.json().get('responses', [])}
+
+    def list_children_batch(self, item_ids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        List the children of several folders with batched requests.
+        
+        The first page of every folder comes from the batch; further pages of
+        large folders are followed one by one.
+        
+        Args:
+            item_ids (List[str]): Drive item IDs of the folders
+            
+        Returns:
+            Dict[str, List[Dict]]: Child drive items of each folder, keyed by
+                folder ID; folders that could not be listed are left out
+        """
+        drive_url = self._drive_url()
+        responses = self.graph_batch_get([f"{drive_url}/items/{item_id}/children" for item_id in item_ids])
+        children = {}
+        for item_id, response in zip(item_ids, responses):
+            if response['status'] != 200:
+                logger.warning(f"Could not list folder {item_id}: status {response['status']}")
+                continue
+            items = list(response['body'].get('value', []))
+            next_link = response['body'].get('@odata.nextLink')
+            while next_link:
+                data = self._graph_get(next_link)
+                items.extend(data.get('value', []))
+                next_link = data.get('@odata.nextLink')
+            children[item_id] = items
+        return children
+
+    def get_folder_id(self, folder_path: str) -> str:
+        """Get the drive item ID of a folder from its path."""
+        return self._graph_get(f"{self._drive_url()}/root:/{folder_path}")['id']
+
+    def get_folder_contents(self, item_ids: List[str]) -> Dict[str, Dict]:
+        """
+        List the PDFs and subfolders of several folders with batched requests.
+        
+        Args:
+            item_ids (List[str]): Drive item IDs of the folders
+            
+        Returns:
+            Dict[str, Dict]: For each folder ID, 'files' - file dicts of its
+                PDFs - and 'subfolders' - the 'id' and 'name' of its subfolders;
+                folders that could not be listed are left out
+        """
+        drive_url = self._drive_url()
+        contents = {}
+        for item_id, children in self.list_children_batch(item_ids).items():
+            contents[item_id] = {
+                'files': [
+                    self._to_file_entry(drive_url, child) for child in children
+                    if 'file' in child and child['name'].lower().endswith('.pdf')
+                ],
+                'subfolders': [
+                    {'id': child['id'], 'name': child['name']} for child in children if 'folder' in child
+                ]
+            }
+        return contents
+
+    def sync_folder(self, folder_path: Optional[str], manifest) -> Dict[str, List[Dict]]:
+        """
+        Bring the manifest of a folder up to date and return what changed.
+        
+        When the folder has a stored delta link only the changes since the
+        last sync are fetched from the drive's delta feed. Otherwise (first
+        sync, expired delta link, or delta not available) the folder is
+        listed in full and compared with the manifest.
+        
+        Args:
+            folder_path (str, optional): Folder path. Defaults to "Regulatory IDMP Documents".
+            manifest (SyncManifest): The local manifest to update
+            
+        Returns:
+            Dict[str, List[Dict]]: 'changed' - PDFs added or changed since they
+                were last processed; 'deleted' - manifest items that no longer exist
+        """
+        try:
+            folder_path = folder_path or "Regulatory IDMP Documents"
+            folder = manifest.get_folder(folder_path)
+            
+            deleted = None
+            if folder and folder.get('delta_link') and folder.get('folder_id'):
+                try:
+                    deleted = self._apply_delta(folder_path, folder, manifest)
+                except requests.exceptions.HTTPError as e:
+                    # 410 Gone means the delta token expired; resync from a full listing
+                    logger.warning(f"Delta sync failed for '{folder_path}', falling back to full listing: {str(e)}")
+            if deleted is None:
+                deleted = self._apply_listing(folder_path, manifest)
+            
+            changed = manifest.get_pending(folder_path)
+            logger.info(f"Sync of '{folder_path}': {len(changed)} added or changed, {len(deleted)} deleted")
+            return {'changed': changed, 'deleted': deleted}
+            
+        except Exception as e:
+            logger.error(f"Error syncing SharePoint folder: {str(e)}")
+            raise
+
+    def _apply_listing(self, folder_path: str, manifest) -> List[Dict]:
+        """Update the manifest from a full folder listing and start delta tracking."""
+        # Take the delta token before listing so changes made meanwhile are not missed
+        folder_id, delta_link = self._get_latest_delta_link(folder_path)
+        
+        files = self.get_files(folder_path)
+        current_ids = {file['id'] for file in files}
+        known_ids = manifest.get_items(folder_path).keys()
+        
+        manifest.upsert_items(folder_path, files)
+        deleted = manifest.remove_items(folder_path, [item_id for item_id in known_ids if item_id not in current_ids])
+        manifest.save_folder(folder_path, folder_id, delta_link)
+        return deleted
+
+    def _apply_delta(self, folder_path: str, folder: Dict, manifest) -> List[Dict]:
+        """Apply the drive's delta feed since the stored delta link to the manifest."""
+        drive_url = self._drive_url()
+        changed = {}
+        deleted_ids = set()
+        
+        url = folder['delta_link']
+        delta_link = None
+        while url:
+            data = self._graph_get(url)
+            for item in data.get('value', []):
+                parent_id = item.get('parentReference', {}).get('id')
+                in_folder = (
+                    'deleted' not in item
+                    and 'file' in item
+                    and parent_id == folder['folder_id']
+                    and item.get('name', '').lower().endswith('.pdf')
+                )
+                if in_folder:
+                    changed[item['id']] = self._to_file_entry(drive_url, item)
+                    deleted_ids.discard(item['id'])
+                else:
+                    # Deleted, moved out of the folder or no longer a PDF
+                    changed.pop(item['id'], None)
+                    deleted_ids.add(item['id'])
+            url = data.get('@odata.nextLink')
+            delta_link = data.get('@odata.deltaLink', delta_link)
+        
+        manifest.upsert_items(folder_path, list(changed.values()))
+        deleted = manifest.remove_items(folder_path, list(deleted_ids))
+        manifest.save_folder(folder_path, folder['folder_id'], delta_link or folder['delta_link'])
+        return deleted
+
+    def _get_latest_delta_link(self, folder_path: str):
+        """
+        Get the folder's item ID and a delta link pointing at the current state of the drive.
+        
+        SharePoint only offers delta on the drive root, so changes are later
+        filtered by parent folder ID. Returns a None delta link when delta is
+        not available, in which case every sync lists the folder in full.
+        """
+        drive_url = self._drive_url()
+        folder_response, delta_response = self.graph_batch_get([
+            f"{drive_url}/root:/{folder_path}",
+            f"{drive_url}/root/delta?token=latest"
+        ])
+        if folder_response['status'] != 200:
+            raise requests.exceptions.HTTPError(f"Folder '{folder_path}' lookup failed with status {folder_response['status']}")
+        if delta_response['status'] != 200:
+            logger.warning(f"Delta query not available (status {delta_response['status']}), using full listings")
+            return folder_response['body']['id'], None
+        return folder_response['body']['id'], delta_response['body'].get('@odata.deltaLink')
+
+    def download_file(self, file_url: str, local_path: Optional[str] = None, chunk_size: int = 8192) -> str:
         """
         Download a file from SharePoint.
         
         Args:
             file_url (str): URL of the file.
             local_path (str, optional): Local path to save the file.
+            chunk_size (int, optional): Size of the chunks read from the response.
             
         Returns:
             str: Path to downloaded file.
         """
         try:
-            access_token = self._get_access_token()
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/octet-stream'
-            }
-            
             if not local_path:
                 local_path = os.path.join('temp', os.path.basename(file_url))
                 os.makedirs(os.path.dirname(local_path), exist_ok=True)
             
-            response = requests.get(file_url, headers=headers, stream=True)
-            response.raise_for_status()
-            
             with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+                for chunk in self.iter_file_chunks(file_url, chunk_size):
                     f.write(chunk)
             
             logger.info(f"File downloaded successfully: {local_path}")
@@ -211,6 +516,28 @@ class SharePointService:
             logger.error(f"Error downloading SharePoint file: {str(e)}")
             raise
 
+    def iter_file_chunks(self, file_url: str, chunk_size: int = 8192):
+        """
+        Stream the content of a SharePoint file.
+        
+        Args:
+            file_url (str): URL of the file.
+            chunk_size (int, optional): Size of the chunks read from the response.
+            
+        Yields:
+            bytes: Chunks of the file content
+        """
+        access_token = self._get_access_token()
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/octet-stream'
+        }
+        with self.session.get(file_url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
+
     def _convert_to_direct_url(self, sharing_url: str) -> str:
         """
         Convert SharePoint sharing URL to direct download URL.
@@ -323,9 +650,9 @@ class SharePointService:
             if not folder_path:
                 raise ValueError("Folder path cannot be empty")
 
-            # Get access token and site ID
+            # Get access token and drive URL
             access_token = self._get_access_token()
-            site_id = self._get_site_id()
+            drive_url = self._drive_url()
             
             # Log the upload attempt
             logger.info(f"Attempting to upload file '{file_name}' to folder '{folder_path}'")
@@ -337,11 +664,11 @@ class SharePointService:
             }
             
             # Construct the upload URL
-            upload_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{folder_path}/{file_name}:/content"
+            upload_url = f"{drive_url}/root:/{folder_path}/{file_name}:/content"
             logger.info(f"Upload URL: {upload_url}")
             
             # Upload the file
-            response = requests.put(upload_url, headers=headers, data=file_content)
+            response = self.session.put(upload_url, headers=headers, data=file_content, timeout=self.timeout)
             
             # Log response details
             logger.info(f"Upload response status: {response.status_code}")
@@ -370,3 +697,73 @@ class SharePointService:
             error_msg = f"Error uploading file to SharePoint: {str(e)}"
             logger.error(error_msg)
             raise
+
+    def upload_large_file(self, file_content: bytes, file_name: str, folder_path: str,
+                          chunk_size: int = 5 * 1024 * 1024) -> str:
+        """
+        Upload a file to a SharePoint folder through a resumable upload session.
+        
+        The content is sent in fixed-size chunks (rounded down to a multiple of
+        320 KiB, as Graph requires), so files above the 4 MB limit of a simple
+        upload are supported and a failed chunk does not resend the whole file.
+        
+        Args:
+            file_content (bytes): The file content to upload
+            file_name (str): Name of the file
+            folder_path (str): Path to the SharePoint folder
+            chunk_size (int, optional): Size of each uploaded chunk
+            
+        Returns:
+            str: URL of the uploaded file
+        """
+        upload_url = None
+        try:
+            if not file_content:
+                raise ValueError("File content cannot be empty")
+            
+            access_token = self._get_access_token()
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
+            session_url = f"{self._drive_url()}/root:/{folder_path}/{file_name}:/createUploadSession"
+            response = self.session.post(
+                session_url,
+                headers=headers,
+                json={'item': {'@microsoft.graph.conflictBehavior': 'replace'}},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            upload_url = response.json()['uploadUrl']
+            
+            chunk_size = max(1, chunk_size // (320 * 1024)) * 320 * 1024
+            total = len(file_content)
+            logger.info(f"Uploading '{file_name}' ({total} bytes) to '{folder_path}' in {chunk_size} byte chunks")
+            for start in range(0, total, chunk_size):
+                chunk = file_content[start:start + chunk_size]
+                # The upload URL is pre-authenticated; Graph rejects an Authorization header on it
+                response = self.session.put(
+                    upload_url,
+                    headers={
+                        'Content-Length': str(len(chunk)),
+                        'Content-Range': f"bytes {start}-{start + len(chunk) - 1}/{total}"
+                    },
+                    data=chunk,
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+            
+            file_url = response.json().get('webUrl')
+            if not file_url:
+                raise ValueError("No webUrl in response")
+            logger.info(f"File uploaded successfully to SharePoint: {file_url}")
+            return file_url
+            
+        except Exception as e:
+            if upload_url:
+                try:
+                    self.session.delete(upload_url, timeout=self.timeout)
+                except Exception:
+                    pass
+            logger.error(f"Error uploading file to SharePoint: {str(e)}")
+            raise
@@ -0,0 +1,66 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import uuid
+from typing import Optional, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SpooledDownload:
+    """
+    Write target for a streamed download.
+
+    Content is kept in memory up to `max_size` bytes and spills to a named
+    temporary file beyond that, so small documents never touch the disk
+    while large ones do not exhaust memory. The SHA-256 of the content is
+    computed while writing.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.buffer = io.BytesIO()
+        self.file = None
+        self.path: Optional[str] = None
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> None:
+        if self.file is None and self.size + len(chunk) > self.max_size:
+            self._spill()
+        (self.file or self.buffer).write(chunk)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def _spill(self) -> None:
+        self.path = os.path.join(tempfile.gettempdir(), f"temp_document_{uuid.uuid4()}.pdf")
+        self.file = open(self.path, 'wb')
+        self.file.write(self.buffer.getbuffer())
+        self.buffer = None
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+    @property
+    def content_hash(self) -> str:
+        return self.digest.hexdigest()
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """The content as bytes, or the path of the spilled file."""
+        return self.path if self.path else self.buffer.getvalue()
+
+    def cleanup(self) -> None:
+        """Release the buffer and remove the spilled file, if any."""
+        self.close()
+        self.buffer = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except Exception as e:
+                logger.warning(f"Could not remove temporary file {self.path}: {str(e)}")
@@ -0,0 +1,32 @@
+import sqlite3
+from contextlib import contextmanager
+
+
+class SQLiteStore:
+    """
+    Base class for the SQLite-backed stores.
+
+    Connections are opened per operation and use WAL mode with a busy
+    timeout, so several uvicorn worker processes can share one database file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection configured for concurrent access from several processes."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Yield a connection that commits on success and is always closed."""
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,128 @@
+import logging
+import os
+from typing import Dict, List, Optional
+from services.sqlite_store import SQLiteStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SyncManifest(SQLiteStore):
+    """
+    Local record of the PDFs seen in each SharePoint folder.
+
+    For every item it keeps the current eTag and modified time as reported by
+    Graph, and the eTag that was last processed successfully. Items whose two
+    eTags differ are pending; items that fail processing stay pending and are
+    picked up again by the next sync. The Graph delta link of each folder is
+    stored alongside.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        super().__init__(db_path or os.getenv('SYNC_MANIFEST_PATH', 'sync_manifest.db'))
+        self._initialize()
+
+    def _initialize(self) -> None:
+        """Create the tables if they do not exist yet."""
+        try:
+            with self._connection() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS items (
+                        folder_path TEXT NOT NULL,
+                        item_id TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        url TEXT NOT NULL,
+                        size INTEGER,
+                        etag TEXT,
+                        last_modified TEXT,
+                        processed_etag TEXT,
+                        PRIMARY KEY (folder_path, item_id)
+                    );
+                    CREATE TABLE IF NOT EXISTS folders (
+                        folder_path TEXT PRIMARY KEY,
+                        folder_id TEXT,
+                        delta_link TEXT
+                    );
+                """)
+        except Exception as e:
+            logger.error(f"Error initializing sync manifest: {str(e)}")
+            raise
+
+    def get_folder(self, folder_path: str) -> Optional[Dict]:
+        """Get the stored folder ID and delta link of a folder."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM folders WHERE folder_path = ?", (folder_path,)).fetchone()
+        return dict(row) if row else None
+
+    def save_folder(self, folder_path: str, folder_id: Optional[str], delta_link: Optional[str]) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO folders (folder_path, folder_id, delta_link) VALUES (?, ?, ?)",
+                (folder_path, folder_id, delta_link)
+            )
+
+    def get_items(self, folder_path: str) -> Dict[str, Dict]:
+        """Get all manifest items of a folder, keyed by item ID."""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT * FROM items WHERE folder_path = ?", (folder_path,)).fetchall()
+        return {row['item_id']: dict(row) for row in rows}
+
+    def upsert_items(self, folder_path: str, files: List[Dict]) -> None:
+        """Record the current state of files, keeping their processed eTag."""
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO items (folder_path, item_id, name, url, size, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (folder_path, item_id) DO UPDATE SET name = excluded.name, url = excluded.url, "
+                "size = excluded.size, etag = excluded.etag, last_modified = excluded.last_modified",
+                [
+                    (folder_path, file['id'], file['name'], file['url'], file.get('size'),
+                     file.get('etag') or file.get('last_modified'), file.get('last_modified'))
+                    for file in files
+                ]
+            )
+
+    def remove_items(self, folder_path: str, item_ids: List[str]) -> List[Dict]:
+        """
+        Remove items from the manifest.
+
+        Returns:
+            List[Dict]: The removed items
+        """
+        items = self.get_items(folder_path)
+        removed = [items[item_id] for item_id in item_ids if item_id in items]
+        with self._connection() as conn:
+            conn.executemany(
+                "DELETE FROM items WHERE folder_path = ? AND item_id = ?",
+                [(folder_path, item['item_id']) for item in removed]
+            )
+        return removed
+
+    def get_pending(self, folder_path: str) -> List[Dict]:
+        """Get the items that were added or changed since they were last processed."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM items WHERE folder_path = ? "
+                "AND (processed_etag IS NULL OR processed_etag != etag) ORDER BY name",
+                (folder_path,)
+            ).fetchall()
+        return [
+            {
+                'id': row['item_id'],
+                'url': row['url'],
+                'name': row['name'],
+                'size': row['size'] or 0,
+                'etag': row['etag'],
+                'last_modified': row['last_modified']
+            }
+            for row in rows
+        ]
+
+    def mark_processed(self, folder_path: str, item_ids: List[str]) -> None:
+        """Mark the current version of the given items as processed."""
+        with self._connection() as conn:
+            conn.executemany(
+                "UPDATE items SET processed_etag = etag WHERE folder_path = ? AND item_id = ?",
+                [(folder_path, item_id) for item_id in item_ids]
+            )
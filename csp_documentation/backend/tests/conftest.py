@@ -0,0 +1,25 @@
+import pytest
+
+from benchmarks.mock_graph import MockGraphServer
+
+
+@pytest.fixture
+def graph_server():
+    """A mock Graph server with four PDFs: two in the root folder, two in a subfolder."""
+    server = MockGraphServer(documents=4, pages=[1], words_per_page=50, folders=1, page_size=2).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def sharepoint(graph_server, monkeypatch):
+    """A SharePointService pointed at the mock Graph server."""
+    monkeypatch.setenv('GRAPH_API_URL', graph_server.graph_url)
+    monkeypatch.setenv('GRAPH_LOGIN_URL', graph_server.base_url)
+    monkeypatch.setenv('SHAREPOINT_CLIENT_ID', 'test')
+    monkeypatch.setenv('SHAREPOINT_CLIENT_SECRET', 'test')
+    monkeypatch.setenv('SHAREPOINT_TENANT_ID', 'test')
+    monkeypatch.setenv('SHAREPOINT_SITE_URL', 'https://test.sharepoint.com/sites/regulatory-docs')
+    monkeypatch.setenv('SHAREPOINT_FOLDER_PATH', 'Benchmark')
+    from services.sharepoint_service import SharePointService
+    return SharePointService()
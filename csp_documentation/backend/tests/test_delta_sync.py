@@ -0,0 +1,74 @@
+import pytest
+
+from services.sync_manifest import SyncManifest
+
+FOLDER = 'Benchmark'
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return SyncManifest(str(tmp_path / 'sync_manifest.db'))
+
+
+def names(files):
+    return sorted(file['name'] for file in files)
+
+
+def sync_and_mark(sharepoint, manifest):
+    result = sharepoint.sync_folder(FOLDER, manifest)
+    manifest.mark_processed(FOLDER, [file['id'] for file in result['changed']])
+    return result
+
+
+def test_initial_sync_lists_folder_and_starts_delta_tracking(sharepoint, manifest):
+    result = sharepoint.sync_folder(FOLDER, manifest)
+
+    # Only the PDFs directly in the folder; the subfolder holds the other two
+    assert names(result['changed']) == ['document_00000.pdf', 'document_00002.pdf']
+    assert result['deleted'] == []
+    folder = manifest.get_folder(FOLDER)
+    assert folder['folder_id'] == 'folder-root'
+    assert 'token=' in folder['delta_link']
+
+
+def test_incremental_sync_applies_additions_and_deletions(graph_server, sharepoint, manifest):
+    sync_and_mark(sharepoint, manifest)
+    assert sharepoint.sync_folder(FOLDER, manifest) == {'changed': [], 'deleted': []}
+
+    graph_server.add_file('added.pdf')
+    graph_server.add_file('nested.pdf', folder_id='folder-0')
+    graph_server.add_file('notes.txt')
+    graph_server.delete_file('doc-0')
+    result = sharepoint.sync_folder(FOLDER, manifest)
+
+    # Files added to the subfolder or that are not PDFs are filtered out
+    assert names(result['changed']) == ['added.pdf']
+    assert [item['item_id'] for item in result['deleted']] == ['doc-0']
+    assert sorted(manifest.get_items(FOLDER)) == ['doc-2', result['changed'][0]['id']]
+
+
+def test_delta_sync_uses_delta_link_instead_of_listing(graph_server, sharepoint, manifest, monkeypatch):
+    sync_and_mark(sharepoint, manifest)
+    graph_server.add_file('added.pdf')
+
+    def fail_listing(folder_path=None):
+        raise AssertionError("folder was listed in full")
+
+    monkeypatch.setattr(sharepoint, 'get_files', fail_listing)
+    assert names(sharepoint.sync_folder(FOLDER, manifest)['changed']) == ['added.pdf']
+
+
+def test_expired_delta_link_falls_back_to_full_listing(graph_server, sharepoint, manifest):
+    sync_and_mark(sharepoint, manifest)
+    expired_link = manifest.get_folder(FOLDER)['delta_link']
+
+    graph_server.delete_file('doc-2')
+    graph_server.add_file('added.pdf')
+    graph_server.expire_delta()
+    result = sharepoint.sync_folder(FOLDER, manifest)
+
+    assert names(result['changed']) == ['added.pdf']
+    assert [item['item_id'] for item in result['deleted']] == ['doc-2']
+    # The full listing took a fresh delta link
+    assert manifest.get_folder(FOLDER)['delta_link'] != expired_link
+    assert sharepoint.sync_folder(FOLDER, manifest)['deleted'] == []
@@ -0,0 +1,51 @@
+import asyncio
+
+from services.folder_crawler import FolderCrawler
+
+
+def crawl(sharepoint, folder_path='Benchmark'):
+    async def collect():
+        return [file async for file in FolderCrawler(sharepoint, concurrency=2).crawl(folder_path)]
+    return asyncio.run(collect())
+
+
+def test_crawl_finds_pdfs_in_subfolders(sharepoint):
+    files = crawl(sharepoint)
+
+    assert sorted(file['name'] for file in files) == [
+        'Subfolder 0/document_00001.pdf', 'Subfolder 0/document_00003.pdf',
+        'document_00000.pdf', 'document_00002.pdf'
+    ]
+    assert {file['folder'] for file in files} == {'Benchmark', 'Benchmark/Subfolder 0'}
+
+
+def test_equally_named_files_in_different_folders_stay_distinct(graph_server, sharepoint):
+    graph_server.add_file('document_00000.pdf', folder_id='folder-0')
+    files = crawl(sharepoint)
+
+    names = [file['name'] for file in files]
+    assert len(names) == len(set(names)) == 5
+    assert 'Subfolder 0/document_00000.pdf' in names
+
+
+def test_folder_listing_that_fails_once_is_retried(graph_server, sharepoint, monkeypatch):
+    monkeypatch.setenv('CRAWL_RETRY_DELAY', '0')
+    graph_server.fail_listing('folder-0', 1)
+    files = crawl(sharepoint)
+
+    assert len(files) == 4
+
+
+def test_folder_that_cannot_be_listed_is_reported(graph_server, sharepoint, monkeypatch):
+    monkeypatch.setenv('CRAWL_RETRY_DELAY', '0')
+    graph_server.fail_listing('folder-0', 10)
+    crawler = FolderCrawler(sharepoint, concurrency=2)
+    errors = []
+
+    async def collect():
+        return [file async for file in crawler.crawl('Benchmark', on_error=lambda path, error: errors.append(path))]
+    files = asyncio.run(collect())
+
+    assert sorted(file['name'] for file in files) == ['document_00000.pdf', 'document_00002.pdf']
+    assert errors == ['Benchmark/Subfolder 0']
+    assert [failure['folder'] for failure in crawler.failed_folders] == ['Benchmark/Subfolder 0']
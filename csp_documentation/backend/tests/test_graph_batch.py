@@ -0,0 +1,60 @@
+import pytest
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the delays graph_batch_get waits instead of sleeping."""
+    delays = []
+    monkeypatch.setattr('services.sharepoint_service.time.sleep', delays.append)
+    return delays
+
+
+def item_urls(sharepoint, item_ids):
+    return [f"{sharepoint._drive_url()}/items/{item_id}" for item_id in item_ids]
+
+
+def test_batch_returns_responses_in_request_order(sharepoint):
+    responses = sharepoint.graph_batch_get(item_urls(sharepoint, ['doc-1', 'missing', 'doc-0']))
+
+    assert [response['status'] for response in responses] == [200, 404, 200]
+    assert [responses[0]['body']['id'], responses[2]['body']['id']] == ['doc-1', 'doc-0']
+
+
+def test_throttled_requests_are_retried_after_retry_after(graph_server, sharepoint, sleeps):
+    urls = item_urls(sharepoint, ['doc-0', 'doc-1', 'doc-2'])
+    graph_server.throttle_batch(2, retry_after=7)
+    responses = sharepoint.graph_batch_get(urls)
+
+    assert [response['status'] for response in responses] == [200, 200, 200]
+    assert [response['body']['id'] for response in responses] == ['doc-0', 'doc-1', 'doc-2']
+    assert sleeps == [7.0]
+
+
+def test_throttled_requests_back_off_without_retry_after(graph_server, sharepoint, sleeps):
+    urls = item_urls(sharepoint, ['doc-0'])
+    graph_server.throttle_batch(2)
+    responses = sharepoint.graph_batch_get(urls)
+
+    assert responses[0]['status'] == 200
+    assert sleeps == [2, 4]
+
+
+def test_throttling_beyond_max_retries_returns_429(graph_server, sharepoint, sleeps, monkeypatch):
+    monkeypatch.setenv('GRAPH_MAX_RETRIES', '2')
+    urls = item_urls(sharepoint, ['doc-0'])
+    graph_server.throttle_batch(10, retry_after=1)
+    responses = sharepoint.graph_batch_get(urls)
+
+    assert responses[0]['status'] == 429
+    assert len(sleeps) == 2
+
+
+def test_large_batches_are_split_into_groups(graph_server, sharepoint, monkeypatch):
+    monkeypatch.setenv('GRAPH_BATCH_SIZE', '2')
+    sent = []
+    send_batch = sharepoint._send_batch
+    monkeypatch.setattr(sharepoint, '_send_batch', lambda urls: sent.append(len(urls)) or send_batch(urls))
+    responses = sharepoint.graph_batch_get(item_urls(sharepoint, ['doc-0', 'doc-1', 'doc-2', 'doc-3', 'doc-0']))
+
+    assert [response['status'] for response in responses] == [200] * 5
+    assert sent == [2, 2, 1]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from services.job_store import JobStore
+
+
+@pytest.fixture
+def job_store(tmp_path, monkeypatch):
+    monkeypatch.setenv('JOB_STALE_SECONDS', '30')
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def test_job_with_recent_heartbeat_is_running(job_store):
+    job_id = job_store.create_job('url', 't1', 3)
+    assert job_store.is_running(job_store.get_job(job_id))
+
+    job_store.update_job(job_id, status='running')
+    assert job_store.is_running(job_store.get_job(job_id))
+
+
+def test_job_with_stale_heartbeat_is_interrupted_even_if_its_pid_is_alive(job_store, monkeypatch):
+    job_id = job_store.create_job('url', 't1', 3)
+    job_store.update_job(job_id, status='running')
+
+    # After a restart the new worker often has the interrupted job's PID
+    assert job_store.get_job(job_id)['worker_pid'] is not None
+    an_hour_later = time.time() + 3600
+    monkeypatch.setattr('services.job_store.time.time', lambda: an_hour_later)
+    assert not job_store.is_running(job_store.get_job(job_id))
+
+
+def test_heartbeat_keeps_a_job_running(job_store, monkeypatch):
+    job_id = job_store.create_job('url', 't1', 3)
+    job_store.update_job(job_id, status='running')
+    later = time.time() + 25
+    monkeypatch.setattr('services.job_store.time.time', lambda: later)
+    job_store.heartbeat(job_id)
+
+    monkeypatch.setattr('services.job_store.time.time', lambda: later + 25)
+    assert job_store.is_running(job_store.get_job(job_id))
+
+
+def test_finished_jobs_are_not_running(job_store):
+    job_id = job_store.create_job('url', 't1', 3)
+    job_store.update_job(job_id, status='completed')
+    assert not job_store.is_running(job_store.get_job(job_id))
+
+
+def test_replaced_outcomes_adjust_the_document_counts(job_store):
+    job_id = job_store.create_job('url', 't1', 3)
+    job_store.add_results(job_id, [
+        {'file_name': 'a.pdf', 'status': 'done', 'metadata': {'Title': 'A'}},
+        {'file_name': 'b.pdf', 'status': 'failed', 'error': 'timeout'},
+        {'file_name': 'c.pdf', 'status': 'failed', 'error': 'timeout'},
+    ])
+    job = job_store.get_job(job_id)
+    assert (job['completed_documents'], job['failed_documents']) == (1, 2)
+
+    # A resumed job retries the failed documents
+    job_store.add_results(job_id, [
+        {'file_name': 'b.pdf', 'status': 'done', 'metadata': {'Title': 'B'}},
+        {'file_name': 'c.pdf', 'status': 'failed', 'error': 'bad PDF'},
+    ])
+    job = job_store.get_job(job_id)
+    assert (job['completed_documents'], job['failed_documents']) == (2, 1)
+
+
+def test_events_of_jobs_finished_long_ago_are_pruned(job_store, monkeypatch):
+    finished = job_store.create_job('url', 't1', 1)
+    job_store.add_events(finished, [('done', 'a.pdf', {}), ('completed', None, {})])
+    job_store.update_job(finished, status='completed')
+    running = job_store.create_job('url', 't1', 1)
+    job_store.add_event(running, 'done', 'b.pdf')
+
+    assert job_store.prune_events(3600) == 0
+
+    a_day_later = time.time() + 86400
+    monkeypatch.setattr('services.job_store.time.time', lambda: a_day_later)
+    assert job_store.prune_events(3600) == 2
+    assert job_store.get_events(finished) == []
+    assert len(job_store.get_events(running)) == 1
@@ -0,0 +1,37 @@
+import asyncio
+
+from services.pdf_extractor import PdfTextExtractor
+
+
+def test_cached_pages_are_served_without_parsing(tmp_path):
+    extractor = PdfTextExtractor(lambda: None, page_cache_dir=str(tmp_path))
+    extractor._cache_pages('abc', ['page one', 'page two'])
+
+    assert extractor.has_cached_pages('abc')
+    extraction = asyncio.run(extractor.extract(b'not a pdf', 'abc'))
+    assert extraction['from_cache']
+    assert extraction['page_count'] == 2
+    assert extraction['text'] == 'page one\npage two\n'
+
+
+def test_page_cache_evicts_least_recently_used_documents(tmp_path, monkeypatch):
+    monkeypatch.setenv('PDF_PAGE_CACHE_MAX_MB', '1')
+    extractor = PdfTextExtractor(lambda: None, page_cache_dir=str(tmp_path))
+    page = 'x' * 300_000
+    for document_hash in ('d1', 'd2', 'd3'):
+        extractor._cache_pages(document_hash, [page])
+    extractor.get_cached_pages('d1')
+    extractor._cache_pages('d4', [page])
+
+    assert extractor.has_cached_pages('d1')
+    assert not extractor.has_cached_pages('d2')
+    assert extractor.has_cached_pages('d4')
+    assert extractor.page_cache.total_size <= 1024 * 1024
+
+
+def test_empty_cache_dir_disables_the_page_cache(monkeypatch):
+    monkeypatch.setenv('PDF_PAGE_CACHE_DIR', '')
+    extractor = PdfTextExtractor(lambda: None)
+    extractor._cache_pages('abc', ['page'])
+    assert extractor.page_cache is None
+    assert not extractor.has_cached_pages('abc')